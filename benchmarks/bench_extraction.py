@@ -0,0 +1,119 @@
+"""Benchmark: CPU per page of structured content extraction, per backend.
+
+Usage:
+    python benchmarks/bench_extraction.py [--pages 200] [--corpus DIR]
+
+Uses the fixed synthetic corpus of ``bench_parse_once.py``, with a site
+header, menu, cookie banner and footer holding headers and paragraphs added
+to every page, unless ``--corpus`` points at a directory of ``.html`` files.
+Every backend is also measured with the boilerplate template learned from the
+corpus, together with the number of blocks it strips and the size of the
+extracted JSON.
+"""
+
+
+import argparse
+import json
+import os
+import sys
+
+from bs4 import BeautifulSoup
+
+# Run from anywhere: the project packages live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_parse_once import load_corpus, measure, synthetic_page  # noqa: E402
+from utils.boilerplate import TemplateModel  # noqa: E402
+from utils.extraction import BACKENDS, extract_content  # noqa: E402
+from utils.html_document import HtmlDocument  # noqa: E402
+
+# Blocks every page of the synthetic site repeats around its own content
+BOILERPLATE_TOP = (
+    '<header class="site-header"><p class="logo">Näidise vald</p>'
+    "<p>Vallavalitsus, Keskväljak 1</p></header>"
+    '<div id="cookie" class="banner"><h3>Küpsised</h3>'
+    "<p>Kasutame küpsiseid, et lehte paremaks teha.</p></div>"
+    '<nav class="menu"><h2>Menüü</h2><ul>'
+    + "".join(f"<li><p>Teema {i}</p></li>" for i in range(12)) + "</ul></nav>"
+)
+BOILERPLATE_BOTTOM = (
+    '<aside class="news"><h2>Uudised</h2>'
+    + "".join(f"<p>Uudis {i}: vallas toimus üritus.</p>" for i in range(5)) + "</aside>"
+    '<footer class="site-footer"><h2>Kontakt</h2><p>Telefon 600 0000</p>'
+    "<p>E-post vald@vald.ee</p><h2>Lahtiolekuajad</h2><p>E–R 8–16</p></footer>"
+)
+
+
+def templated_page(index):
+    """
+    Build a synthetic page wrapped in the repeated blocks of the site.
+
+    Args:
+        index (int): Page number, varies the content.
+
+    Returns:
+        bytes: UTF-8 encoded HTML.
+    """
+    html = synthetic_page(index).decode("utf-8")
+    html = html.replace("<body>", f"<body>{BOILERPLATE_TOP}", 1)
+    return html.replace("</body>", f"{BOILERPLATE_BOTTOM}</body>", 1).encode("utf-8")
+
+
+def before(body):
+    """``parse_html_to_json`` before the extraction engine was introduced."""
+    soup = BeautifulSoup(body.decode("utf-8"), "html.parser")
+    content = []
+    current_section = None
+    for element in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6", "p"]):
+        if element.name.startswith("h"):
+            current_section = {"header": element.get_text(strip=True), "paragraphs": []}
+            content.append(current_section)
+        elif element.name == "p" and current_section:
+            current_section["paragraphs"].append(element.get_text(strip=True))
+    return soup.title.string if soup.title else "", content
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--corpus", default=None)
+    args = parser.parse_args()
+
+    if args.corpus:
+        bodies = load_corpus(args.corpus, args.pages)
+    else:
+        bodies = [templated_page(index) for index in range(args.pages)]
+    size = sum(len(body) for body in bodies) / len(bodies)
+    print(f"{len(bodies)} pages, {size / 1024:.1f} KiB average")
+
+    before_ms = measure(before, bodies, args.rounds)
+    print(f"before (bs4 find_all): {before_ms:.2f} ms CPU/page")
+    for backend in BACKENDS:
+        backend_ms = measure(lambda body: extract_content(body, backend=backend), bodies,
+                             args.rounds)
+        print(f"{backend + ':':22}{backend_ms:.2f} ms CPU/page "
+              f"({before_ms / backend_ms:.1f}x faster)")
+
+    template = TemplateModel.learn(bodies)
+    print(f"template: {len(template)} blocks learned from {template.pages} pages")
+    stripped_blocks = 0
+    for body in bodies:
+        tree = HtmlDocument(body).tree
+        if tree is not None:
+            stripped_blocks += template.strip_lxml(tree)
+    print(f"template: {stripped_blocks / len(bodies):.1f} blocks stripped per page")
+    for backend in BACKENDS:
+        backend_ms = measure(lambda body: extract_content(body, backend=backend,
+                                                          template=template),
+                             bodies, args.rounds)
+        plain = sum(len(json.dumps(extract_content(body, backend=backend))) for body in bodies)
+        stripped = sum(len(json.dumps(extract_content(body, backend=backend, template=template)))
+                       for body in bodies)
+        print(f"{backend + ' + template:':22}{backend_ms:.2f} ms CPU/page, "
+              f"JSON {stripped / plain:.0%} of the size without template")
+
+
+if __name__ == "__main__":
+    main()
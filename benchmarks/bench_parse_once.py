@@ -0,0 +1,134 @@
+"""Benchmark: CPU per page of the spider's HTML handling, before and after parsing once.
+
+Usage:
+    python benchmarks/bench_parse_once.py [--pages 200] [--corpus DIR]
+
+Without ``--corpus`` a fixed synthetic corpus of municipality-style pages is used.
+With ``--corpus`` every ``.html`` file in DIR is used instead (e.g. ``data/<domain>``).
+"""
+
+
+import argparse
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+# Run from anywhere: the project packages live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.html_document import HtmlDocument  # noqa: E402
+from utils.parsing_utils import parse_html_links  # noqa: E402
+
+
+def synthetic_page(index):
+    """
+    Build a deterministic page with navigation, text and scripts.
+
+    Args:
+        index (int): Page number, varies the content.
+
+    Returns:
+        bytes: UTF-8 encoded HTML.
+    """
+    nav = "".join(f'<li><a href="/teenused/{i}">Teenus {i}</a></li>' for i in range(60))
+    sections = "".join(
+        f"<h2>Peatükk {i}</h2>"
+        + "".join(f"<p>Lõik {i}.{j} lehel {index}. " + "Sisu tekst. " * 30 + "</p>"
+                  for j in range(4))
+        for i in range(12)
+    )
+    scripts = '<script src="/static/app.js"></script><script>window.dataLayer=[];</script>'
+    html = (f'<!DOCTYPE html><html lang="et"><head><meta charset="utf-8">'
+            f"<title>Leht {index}</title>{scripts}</head><body><nav><ul>{nav}</ul></nav>"
+            f"<main><h1>Leht {index}</h1>{sections}</main>"
+            f'<footer><a href="/kontakt">Kontakt</a></footer></body></html>')
+    return html.encode("utf-8")
+
+
+def load_corpus(corpus_dir, pages):
+    """
+    Load the benchmark corpus.
+
+    Args:
+        corpus_dir (str or None): Directory with .html files, None for the synthetic corpus.
+        pages (int): Number of synthetic pages.
+
+    Returns:
+        list: Raw page bodies as bytes.
+    """
+    if not corpus_dir:
+        return [synthetic_page(index) for index in range(pages)]
+    bodies = []
+    for filename in sorted(os.listdir(corpus_dir)):
+        if filename.endswith(".html"):
+            with open(os.path.join(corpus_dir, filename), "rb") as f:
+                bodies.append(f.read())
+    return bodies
+
+
+def before(body):
+    """The per-page work of the spider before the shared document was introduced."""
+    text = body.decode("utf-8", errors="replace")
+    soup = BeautifulSoup(text, "html.parser")  # detect_language
+    html_tag = soup.find("html")
+    language = html_tag["lang"].split("-")[0] if html_tag and html_tag.get("lang") else "unknown"
+    content = text.lower()  # requires_javascript
+    needs_js = any(marker in content for marker in ("react", "vue", "<script", "loading"))
+    pretty = BeautifulSoup(body, "html.parser").prettify()  # scrape_with_beautifulsoup
+    links = parse_html_links(body)
+    ignored = 'lang="en"' in pretty or 'lang="ru"' in pretty  # ignore_language
+    return language, needs_js, len(links), ignored
+
+
+def after(body):
+    """The per-page work of the spider with one shared HtmlDocument."""
+    document = HtmlDocument(body, encoding="utf-8")
+    language = document.lang
+    needs_js = document.js_score > 0
+    html = document.html
+    links = document.links
+    ignored = language in ("en", "ru")
+    return language, needs_js, len(links), ignored, len(html)
+
+
+def measure(func, bodies, rounds):
+    """
+    Measure CPU seconds per page.
+
+    Args:
+        func (callable): Per-page function.
+        bodies (list): Page bodies.
+        rounds (int): Number of passes over the corpus.
+
+    Returns:
+        float: CPU milliseconds per page.
+    """
+    started = time.process_time()
+    for _ in range(rounds):
+        for body in bodies:
+            func(body)
+    return (time.process_time() - started) * 1000 / (len(bodies) * rounds)
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--corpus", default=None)
+    args = parser.parse_args()
+
+    bodies = load_corpus(args.corpus, args.pages)
+    size = sum(len(body) for body in bodies) / len(bodies)
+    print(f"{len(bodies)} pages, {size / 1024:.1f} KiB average")
+
+    before_ms = measure(before, bodies, args.rounds)
+    after_ms = measure(after, bodies, args.rounds)
+    print(f"before: {before_ms:.2f} ms CPU/page")
+    print(f"after:  {after_ms:.2f} ms CPU/page ({before_ms / after_ms:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
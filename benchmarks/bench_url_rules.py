@@ -0,0 +1,103 @@
+"""Benchmark: links checked per second by the spider's URL filter, before and after UrlRules.
+
+Usage:
+    python benchmarks/bench_url_rules.py [--links 200000]
+
+Uses a fixed mix of on-site, off-site, language, news and non-HTTP links.
+"""
+
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from urllib.parse import urlparse
+
+# Run from anywhere: the project packages live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy_project.url_rules import UrlRules  # noqa: E402
+
+DOMAIN = "tartu.ee"
+PATHS = ("/teenused/{}", "/et/teenused/{}", "/en/services/{}", "/ru/uslugi/{}", "/uudised/{}",
+         "/news/{}", "/dokumendid/{}.pdf", "/kontakt", "/")
+
+
+def make_links(count, seed=1):
+    """
+    Build a deterministic list of absolute links.
+
+    Args:
+        count (int): Number of links.
+        seed (int): Seed of the generator.
+
+    Returns:
+        list: URLs.
+    """
+    rng = random.Random(seed)
+    hosts = ["www.tartu.ee", "tartu.ee", "web.ee", "facebook.com", "www.riigiteataja.ee"]
+    links = []
+    for _ in range(count):
+        if rng.random() < 0.03:
+            links.append(f"mailto:info{rng.randrange(100)}@tartu.ee")
+            continue
+        host = rng.choice(hosts) if rng.random() < 0.3 else "www.tartu.ee"
+        path = rng.choice(PATHS).format(rng.randrange(5000))
+        links.append(f"https://{host}{path}")
+    return links
+
+
+def before(url):
+    """``Spider.is_valid_url`` before the rules were compiled once."""
+    parsed = urlparse(url)
+    language_pattern = re.compile(r"/(?:ru|en)/")
+    news_pattern = re.compile(r"uudis(ed)?|news")
+    if language_pattern.search(parsed.path.lower()) or news_pattern.search(parsed.path.lower()):
+        return False
+    if (parsed.scheme not in ('http', 'https')
+            or parsed.netloc.lower().lstrip("www.").rstrip("/") != DOMAIN):
+        return False
+    return True
+
+
+def measure(func, links, rounds):
+    """
+    Measure links checked per second.
+
+    Args:
+        func (callable): Per-link check.
+        links (list): URLs.
+        rounds (int): Passes over the links.
+
+    Returns:
+        tuple: Links per second and number of allowed links in one pass.
+    """
+    allowed = sum(1 for link in links if func(link))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for link in links:
+            func(link)
+    return len(links) * rounds / (time.perf_counter() - started), allowed
+
+
+def main():
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--links", type=int, default=200_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    links = make_links(args.links)
+    rules = UrlRules(DOMAIN)
+    before_rate, before_allowed = measure(before, links, args.rounds)
+    after_rate, after_allowed = measure(rules.allows, links, args.rounds)
+    print(f"{len(links)} links")
+    print(f"before: {before_rate:,.0f} links/s ({before_allowed} allowed)")
+    print(f"after:  {after_rate:,.0f} links/s ({after_allowed} allowed, "
+          f"{after_rate / before_rate:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
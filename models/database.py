@@ -1,6 +1,10 @@
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, JSON, Interval, Boolean
+from sqlalchemy import (create_engine, inspect, Column, String, Integer, DateTime, JSON, Interval,
+                        Boolean, BigInteger)
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
+from functools import lru_cache
 import os
 from datetime import datetime
 
@@ -12,13 +16,25 @@ class LinkMetadata(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     url = Column(String, nullable=False, unique=True)
+    domain = Column(String, nullable=True, index=True)
     language = Column(String, nullable=True)
     last_modified_at = Column(DateTime, nullable=True)
+    etag = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)
+    content_changed_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.now)
     scraped_at = Column(DateTime, default=datetime.now)
     status_code = Column(Integer, nullable=True)
     parsed_at = Column(DateTime, nullable=True)
+    parse_fingerprint = Column(String, nullable=True)
     parsed_data = Column(JSON, nullable=True)
+    check_count = Column(Integer, nullable=True)
+    change_count = Column(Integer, nullable=True)
+    recrawl_interval = Column(Interval, nullable=True)
+    next_due_at = Column(DateTime, nullable=True)
+    crawl_priority = Column(Integer, nullable=True)
+    simhash = Column(BigInteger, nullable=True)
+    duplicate_of = Column(String, nullable=True)
 
 class ScrapingSchedule(Base):
     """SQLAlchemy model for storing scraping schedules."""
@@ -30,8 +46,16 @@ class ScrapingSchedule(Base):
     scraped_at = Column(DateTime, default=datetime.now)
     scraping_interval = Column(Interval, nullable=False)
     is_active = Column(Boolean, default=True)
+    include_patterns = Column(JSON, nullable=True)
+    exclude_patterns = Column(JSON, nullable=True)
+    lease_owner = Column(String, nullable=True)
+    lease_heartbeat_at = Column(DateTime, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    next_due_at = Column(DateTime, nullable=True)
 
-def get_db_session():
+@lru_cache(maxsize=None)
+def get_engine():
+    """Return the process-wide pooled engine, creating the tables on first use."""
     db_user = os.environ.get("POSTGRES_USER", "postgres")
     db_password = os.environ.get("POSTGRES_PASSWORD", "password")
     db_host = os.environ.get("POSTGRES_HOST", "localhost")
@@ -39,10 +63,93 @@ def get_db_session():
     db_name = os.environ.get("POSTGRES_DB", "scrapy_metadata")
 
     engine_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
-    engine = create_engine(engine_url, echo=False)
+    engine = create_engine(engine_url, echo=False, pool_pre_ping=True)
 
     Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    return engine
+
+
+def upgrade_schema(engine):
+    """
+    Add columns and indexes that were added to the models after the tables were created.
+
+    Workers starting together may run this at the same time, so every change is
+    made in its own transaction and a change another worker made first is not an error.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                _add_column(engine, table, column)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            _create_index(engine, index)
+
+
+def _add_column(engine, table, column):
+    """
+    Add a column to a table unless another worker already added it.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Database engine.
+        table (sqlalchemy.Table): Table of the column.
+        column (sqlalchemy.Column): Column to add.
+    """
+    column_type = column.type.compile(dialect=engine.dialect)
+    try:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+    except DBAPIError:
+        if column.name not in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+            raise
+
 
-    Session = sessionmaker(bind=engine)
+def _create_index(engine, index):
+    """
+    Create an index unless it exists or another worker already created it.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Database engine.
+        index (sqlalchemy.Index): Index to create.
+    """
+    try:
+        index.create(engine, checkfirst=True)
+    except DBAPIError:
+        if index.name not in {i["name"] for i in inspect(engine).get_indexes(index.table.name)}:
+            raise
+
+
+def get_db_session():
+    Session = sessionmaker(bind=get_engine())
     return Session()
 
+
+def bulk_upsert(connection, table, rows, key="url", update_columns=None):
+    """
+    Insert rows, updating the existing row when the key already exists.
+
+    Runs a single ``INSERT ... ON CONFLICT (key) DO UPDATE`` for all rows. Every
+    row must have the same columns; only those columns are updated.
+
+    Args:
+        connection (sqlalchemy.engine.Connection): Open connection.
+        table (sqlalchemy.Table): Target table.
+        rows (list): Dicts of column values.
+        key (str): Unique column the conflict is detected on.
+        update_columns (list, optional): Columns updated on conflict; all columns of
+            the rows if None, the others are only set on insert.
+    """
+    if not rows:
+        return
+    dialect = sqlite if connection.dialect.name == "sqlite" else postgresql
+    statement = dialect.insert(table)
+    columns = update_columns or [column for column in rows[0] if column != key]
+    statement = statement.on_conflict_do_update(
+        index_elements=[key],
+        set_={column: statement.excluded[column] for column in columns},
+    )
+    connection.execute(statement, rows)
+
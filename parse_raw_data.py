@@ -1,8 +1,14 @@
 import os
+import argparse
 import logging
-from datetime import datetime
-from models.database import get_db_session, LinkMetadata
-from bs4 import BeautifulSoup
+import multiprocessing
+import random
+import time
+from datetime import datetime, timedelta
+from models.database import get_db_session, get_engine, bulk_upsert, LinkMetadata
+from utils.boilerplate import TEMPLATE_FILE, TemplateModel
+from utils.page_store import PageStore
+from utils.extraction import extract_content
 import json
 from urllib.parse import urlparse
 
@@ -10,92 +16,318 @@ from urllib.parse import urlparse
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 RAW_DATA_DIR = os.getenv("RAW_DATA_DIR", "/app/data")
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", os.cpu_count() or 1))
+PARSER_BATCH_SIZE = int(os.getenv("PARSER_BATCH_SIZE", 500))
+PARSER_BACKEND = os.getenv("PARSER_BACKEND") or None
+# Blocks repeated on TEMPLATE_MIN_SHARE of a sample of TEMPLATE_SAMPLE_SIZE pages of a domain
+# are skipped by extraction; the learned template is cached for TEMPLATE_MAX_AGE_DAYS
+TEMPLATE_LEARNING = os.getenv("TEMPLATE_LEARNING", "true").lower() == "true"
+TEMPLATE_SAMPLE_SIZE = int(os.getenv("TEMPLATE_SAMPLE_SIZE", 50))
+TEMPLATE_MIN_PAGES = int(os.getenv("TEMPLATE_MIN_PAGES", 5))
+TEMPLATE_MIN_SHARE = float(os.getenv("TEMPLATE_MIN_SHARE", 0.5))
+TEMPLATE_MAX_AGE_DAYS = float(os.getenv("TEMPLATE_MAX_AGE_DAYS", 7))
 
 
-def parse_html_to_json(file_path, base_url):
-    """Parses raw HTML file into structured JSON."""
+def parse_html_to_json(file_path, base_url, template=None):
+    """Parses raw HTML file into structured JSON, skipping the blocks of ``template``."""
     with open(file_path, 'r', encoding='utf-8') as f:
         html_content = f.read()
 
-    soup = BeautifulSoup(html_content, 'html.parser')
-    parsed_data = {
-        "url": base_url,
-        "title": soup.title.string if soup.title else "",
-        "content": []
-    }
+    return parse_html_content_to_json(html_content, base_url, template)
 
-    current_section = None
-    for element in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6", "p"]):
-        if element.name.startswith("h"):
-            current_section = {"header": element.get_text(strip=True), "paragraphs": []}
-            parsed_data["content"].append(current_section)
-        elif element.name == "p" and current_section:
-            current_section["paragraphs"].append(element.get_text(strip=True))
 
-    return parsed_data
+def parse_html_content_to_json(html_content, base_url, template=None):
+    """Parses HTML content (str or bytes) into structured JSON, skipping ``template`` blocks."""
+    extracted = extract_content(html_content, backend=PARSER_BACKEND, template=template)
+    return {"url": base_url, "title": extracted["title"], "content": extracted["content"]}
 
 
-def process_files(raw_data_dir):
-    """Processes all raw HTML files, converts them to JSON, and saves them."""
-    session = get_db_session()
+def parse_task(task):
+    """
+    Parses one page in a worker process.
+
+    Errors are returned instead of raised, so one broken file does not stop the run.
+
+    Args:
+        task (tuple): Source ("store" or "file"), URL, store directory or file path,
+            parse fingerprint, and template file and version (None without template).
+
+    Returns:
+        tuple: URL, parsed JSON (None on error), error message (None on success)
+        and parse fingerprint.
+    """
+    source, url, location, fingerprint, template_spec = task
+    try:
+        template = open_template(*template_spec) if template_spec else None
+        if source == "store":
+            body = open_store(location).get(url)
+            if body is None:
+                raise LookupError("page is no longer in the store")
+            parsed_json = parse_html_content_to_json(body, url, template)
+        else:
+            parsed_json = parse_html_to_json(location, url, template)
+        return url, parsed_json, None, fingerprint
+    except Exception as e:
+        return url, None, f"{type(e).__name__}: {e}", fingerprint
+
+
+_stores = {}
+
+
+def open_store(store_dir):
+    """Opens a page store once per process."""
+    store = _stores.get(store_dir)
+    if store is None:
+        store = _stores[store_dir] = PageStore(store_dir)
+    return store
+
+
+_templates = {}
+
+
+def open_template(path, version):
+    """Loads a domain template once per process and version."""
+    template = _templates.get(path)
+    if template is None or template.version != version:
+        template = _templates[path] = TemplateModel.load(path)
+        if template is None or template.version != version:
+            raise LookupError(f"template {path} changed during the run")
+    return template
+
+
+def sample_pages(raw_data_dir, size):
+    """Yields the sources of a fixed random sample of the saved pages of a domain."""
+    store_dir = os.path.join(raw_data_dir, "store")
+    pages = []
+    store = PageStore(store_dir) if os.path.isdir(store_dir) else None
+    try:
+        if store is not None:
+            pages = [("store", url) for url, _ in store.digests(content_type="text/html")]
+        with os.scandir(raw_data_dir) as entries:
+            pages += [("file", entry.path) for entry in entries if entry.name.endswith(".html")]
+        for source, location in random.Random(0).sample(pages, min(size, len(pages))):
+            if source == "store":
+                body = store.get(location)
+                if body is not None:
+                    yield body
+            else:
+                with open(location, "rb") as f:
+                    yield f.read()
+    finally:
+        if store is not None:
+            store.close()
+
+
+def load_template(raw_data_dir):
+    """
+    Returns the template of a domain, learning it when missing or older than TEMPLATE_MAX_AGE_DAYS.
+
+    Returns:
+        tuple: TemplateModel (None if learning is off or nothing repeats) and its file.
+    """
+    if not TEMPLATE_LEARNING:
+        return None, None
+    path = os.path.join(raw_data_dir, TEMPLATE_FILE)
+    domain = os.path.basename(os.path.normpath(raw_data_dir))
+    template = TemplateModel.load(path)
+    if template is None or datetime.now() - template.learned_at > timedelta(
+            days=TEMPLATE_MAX_AGE_DAYS):
+        started = time.perf_counter()
+        template = TemplateModel.learn(sample_pages(raw_data_dir, TEMPLATE_SAMPLE_SIZE),
+                                       min_share=TEMPLATE_MIN_SHARE,
+                                       min_pages=TEMPLATE_MIN_PAGES)
+        logging.info(f"{domain}: learned a template of {len(template)} blocks from "
+                     f"{template.pages} pages in {time.perf_counter() - started:.1f}s")
+        if template.pages < TEMPLATE_MIN_PAGES:
+            return None, None
+        template.save(path)
+    return (template, path) if len(template) else (None, None)
+
+
+def load_parse_fingerprints(session, domain):
+    """Loads the parse fingerprints of all pages of a domain with one query."""
+    rows = session.query(LinkMetadata.url, LinkMetadata.parse_fingerprint).filter(
+        LinkMetadata.domain == domain, LinkMetadata.parse_fingerprint.isnot(None))
+    return dict(rows)
+
+
+def load_near_duplicates(session, domain):
+    """Loads the URLs of the pages of a domain that duplicate another page."""
+    rows = session.query(LinkMetadata.url).filter(
+        LinkMetadata.domain == domain, LinkMetadata.duplicate_of.isnot(None))
+    return {url for url, in rows}
+
 
+def collect_tasks(session, raw_data_dir, full=False, template=None, template_path=None):
+    """
+    Lists the pages of a domain directory that need parsing.
+
+    A page is skipped when its fingerprint matches the one stored by its last
+    parse: the content digest for pages in the page store, modification time
+    and size for legacy files. ``full`` parses every page. Near-duplicates of
+    another page, saved before they were recognised, are always skipped. The
+    fingerprints include the ``template`` version, so a changed template of the
+    domain reparses its pages.
+
+    Returns:
+        tuple: Tasks for ``parse_task`` and number of pages skipped as unchanged
+        or as near-duplicates.
+    """
+    domain = os.path.basename(os.path.normpath(raw_data_dir))
+    parsed = {} if full else load_parse_fingerprints(session, domain)
+    duplicates = load_near_duplicates(session, domain)
+    template_spec = (template_path, template.version) if template is not None else None
+    suffix = f";template:{template.version}" if template is not None else ""
+    tasks = []
+    skipped = 0
+
+    store_dir = os.path.join(raw_data_dir, "store")
+    if os.path.isdir(store_dir):
+        store = PageStore(store_dir)
+        try:
+            digests = store.digests(content_type="text/html")
+        finally:
+            store.close()
+        for url, digest in digests:
+            fingerprint = f"blake2b:{digest}{suffix}"
+            if parsed.get(url) == fingerprint or url in duplicates:
+                skipped += 1
+            else:
+                tasks.append(("store", url, store_dir, fingerprint, template_spec))
+
+    # Pages saved one file per URL by earlier versions of the spider
+    with os.scandir(raw_data_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".html"):
+                continue
+
+            try:
+                url = extract_url_from_filename(entry.name, raw_data_dir)
+            except Exception as e:
+                logging.error(f"Error decoding {entry.name}: {e}")
+                continue
+
+            stat = entry.stat()
+            fingerprint = f"mtime:{stat.st_mtime_ns}:{stat.st_size}{suffix}"
+            if parsed.get(url) == fingerprint or url in duplicates:
+                skipped += 1
+            else:
+                tasks.append(("file", url, entry.path, fingerprint, template_spec))
+
+    return tasks, skipped
+
+
+def process_files(raw_data_dir, pool=None, batch_size=PARSER_BATCH_SIZE, full=False):
+    """
+    Parses the changed pages of one domain directory and saves the JSON in bulk.
+
+    Pages are parsed by ``pool`` (in this process if None); this process is the
+    only writer and upserts the results in batches of ``batch_size`` rows.
+    ``full`` reparses unchanged pages too.
+
+    Returns:
+        tuple: Number of pages saved and of pages that failed.
+    """
     if not os.path.exists(raw_data_dir) or not os.listdir(raw_data_dir):
         logging.info(f"No HTML files found in {raw_data_dir}. Exiting.")
-        return
+        return 0, 0
 
-    for filename in os.listdir(raw_data_dir):
-        if not filename.endswith(".html"):
+    template, template_path = load_template(raw_data_dir)
+    session = get_db_session()
+    try:
+        tasks, skipped = collect_tasks(session, raw_data_dir, full, template, template_path)
+    finally:
+        session.close()
+    domain = os.path.basename(os.path.normpath(raw_data_dir))
+    logging.info(f"{domain}: {len(tasks)} pages to parse, {skipped} unchanged since last parse "
+                 f"or near-duplicates")
+    if not tasks:
+        return 0, 0
+
+    if pool is not None:
+        results = pool.imap_unordered(parse_task, tasks, chunksize=16)
+    else:
+        results = map(parse_task, tasks)
+    engine = get_engine()
+    started = time.perf_counter()
+    saved = failed = 0
+    batch = []
+    for url, parsed_json, error, fingerprint in results:
+        if error is not None:
+            logging.error(f"Failed to parse {url}: {error}")
+            failed += 1
             continue
+        batch.append({"url": url, "domain": domain, "parsed_at": datetime.now(),
+                      "parsed_data": parsed_json, "parse_fingerprint": fingerprint,
+                      "status_code": 200})
+        if len(batch) >= batch_size:
+            saved += save_parsed_batch(engine, batch)
+            batch = []
+    saved += save_parsed_batch(engine, batch)
+    # Pages that parsed but were rejected by the database
+    failed = len(tasks) - saved
 
-        file_path = os.path.join(raw_data_dir, filename)
-        logging.info(f"Processing file: {file_path}")  # Log file being processed
+    elapsed = time.perf_counter() - started
+    logging.info(f"Parsed {domain}: {saved} saved, {failed} failed in {elapsed:.1f}s "
+                 f"({len(tasks) / max(elapsed, 1e-9):.1f} files/s)")
+    return saved, failed
 
-        try:
-            url = extract_url_from_filename(filename, raw_data_dir)
-            logging.info(f"Decoded URL: {url}")
-        except Exception as e:
-            logging.error(f"Error decoding {filename}: {e}")
-            continue
 
-        parsed_json = parse_html_to_json(file_path, url)
+def save_parsed_batch(engine, rows):
+    """
+    Upserts parsed pages into link_metadata in one statement.
 
-        metadata_entry = session.query(LinkMetadata).filter_by(url=url).first()
-        if metadata_entry:
-            metadata_entry.parsed_at = datetime.now()
-            metadata_entry.parsed_data = parsed_json  # Save JSON directly instead of dumping as a string
-            metadata_entry.status_code = metadata_entry.status_code or 200  # Ensure status code is stored
-            logging.info(f"Updated existing entry: {url}")
-        else:
-            metadata_entry = LinkMetadata(
-                url=url,
-                parsed_at=datetime.now(),
-                parsed_data=parsed_json,  # Save JSON directly
-                status_code=200  # Default status code if missing
-            )
-            session.add(metadata_entry)
-            logging.info(f"Created new entry: {url}")
+    A rejected batch is retried row by row so only the offending pages are lost.
+    ``status_code`` is only set on pages the crawler has not recorded.
 
-        try:
-            session.commit()
-            logging.info(f"Successfully saved to database: {url}")
-        except Exception as e:
-            session.rollback()
-            logging.error(f"Database commit failed for {url}: {e}")
+    Returns:
+        int: Number of rows saved.
+    """
+    if not rows:
+        return 0
+    update_columns = ["domain", "parsed_at", "parsed_data", "parse_fingerprint"]
+    try:
+        with engine.begin() as connection:
+            bulk_upsert(connection, LinkMetadata.__table__, rows, update_columns=update_columns)
+        return len(rows)
+    except Exception as e:
+        if len(rows) == 1:
+            logging.error(f"Database write failed for {rows[0]['url']}: {e}")
+            return 0
+        logging.warning(f"Batch of {len(rows)} parsed pages failed, saving row by row: {e}")
+        return sum(save_parsed_batch(engine, [row]) for row in rows)
 
-    session.close()
 
+def process_all_raw_data(workers=PARSER_WORKERS, full=False):
+    """
+    Iterates over all directories inside RAW_DATA_DIR and processes each.
 
-def process_all_raw_data():
-    """Iterates over all directories inside RAW_DATA_DIR and processes each."""
+    Only pages changed since their last parse are parsed unless ``full`` is set.
+    """
     if not os.path.exists(RAW_DATA_DIR):
         logging.error(f"RAW_DATA_DIR {RAW_DATA_DIR} does not exist.")
         return
 
-    for site_dir in os.listdir(RAW_DATA_DIR):
-        site_path = os.path.join(RAW_DATA_DIR, site_dir)
-        if os.path.isdir(site_path):
-            logging.info(f"Processing site: {site_dir}")
-            process_files(site_path)
+    started = time.perf_counter()
+    saved = failed = 0
+    # Workers only parse; they never touch the database
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        for site_dir in sorted(os.listdir(RAW_DATA_DIR)):
+            site_path = os.path.join(RAW_DATA_DIR, site_dir)
+            if os.path.isdir(site_path):
+                logging.info(f"Processing site: {site_dir}")
+                site_saved, site_failed = process_files(site_path, pool, full=full)
+                saved += site_saved
+                failed += site_failed
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Parsed {saved + failed} files with {workers} workers in {elapsed:.1f}s "
+                 f"({(saved + failed) / max(elapsed, 1e-9):.1f} files/s, {failed} failed)")
 
 
 def extract_url_from_filename(filename, base_dir):
@@ -121,6 +353,14 @@ def extract_url_from_filename(filename, base_dir):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse the saved pages into link_metadata.")
+    parser.add_argument("--workers", type=int, default=PARSER_WORKERS,
+                        help="Parser processes; 1 parses in this process")
+    parser.add_argument("--full", action="store_true",
+                        default=os.getenv("PARSER_FULL_REBUILD", "").lower() in ("1", "true"),
+                        help="Reparse every page, even if unchanged since its last parse")
+    arguments = parser.parse_args()
+
     logging.info("Starting parser...")
-    process_all_raw_data()
+    process_all_raw_data(workers=arguments.workers, full=arguments.full)
     logging.info("Parsing completed.")
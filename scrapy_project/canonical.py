@@ -0,0 +1,166 @@
+"""Canonical form of crawled URLs, so that variants of one page are fetched and stored once."""
+
+
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from weakref import WeakKeyDictionary
+
+from scrapy.utils.request import RequestFingerprinter, fingerprint as request_fingerprint
+from w3lib.url import canonicalize_url
+
+from scrapy_project.url_rules import normalize_host
+
+# Query parameters that only track the visitor and never change the page
+TRACKING_PARAMS = (r"utm_\w*", "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid",
+                   "yclid", "mc_cid", "mc_eid", "_ga", "_gl", "igshid")
+# "sid" is left out: many sites use it for a section or story id (add it to CANONICAL_DROP_PARAMS
+# where it is a session id)
+SESSION_PARAMS = ("jsessionid", "phpsessid", r"aspsessionid\w*", "sessionid", "session_id",
+                  "cfid", "cftoken")
+# Session ids that servlet containers and PHP append to the path, e.g. /page;jsessionid=AB12
+PATH_SESSION = re.compile(r";(?:jsessionid|phpsessid|sid)=[^/?#]*", re.IGNORECASE)
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+
+class UrlCanonicalizer:
+    """
+    Rewrite URLs to the canonical form under which they are scheduled and stored.
+
+    The fragment, tracking and session parameters and path session ids are
+    dropped, the scheme and host are lowercased, the default port is removed
+    and the remaining parameters are sorted and consistently percent-encoded.
+    On domains with a parameter allowlist only the listed parameters are kept.
+    """
+
+    def __init__(self, drop_params=(), param_allowlists=None, strip_trailing_slash=True):
+        """
+        Initialize the canonicalizer.
+
+        Args:
+            drop_params (iterable): Regular expressions of further parameter names to drop,
+                matched against the whole name, case-insensitively.
+            param_allowlists (dict, optional): Domain to the list of parameter names kept
+                on it; all other parameters of the domain are dropped.
+            strip_trailing_slash (bool): Treat paths with and without a trailing slash as
+                the same page when deduplicating.
+        """
+        patterns = (*TRACKING_PARAMS, *SESSION_PARAMS, *drop_params)
+        self.drop = re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+        self.param_allowlists = {normalize_host(domain): frozenset(params)
+                                 for domain, params in (param_allowlists or {}).items()}
+        self.strip_trailing_slash = strip_trailing_slash
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create the canonicalizer from the crawler settings.
+
+        Args:
+            settings (scrapy.settings.Settings): Crawler settings.
+
+        Returns:
+            UrlCanonicalizer: New canonicalizer.
+        """
+        return cls(
+            drop_params=settings.getlist("CANONICAL_DROP_PARAMS"),
+            param_allowlists=settings.getdict("CANONICAL_PARAM_ALLOWLISTS"),
+            strip_trailing_slash=settings.getbool("CANONICAL_STRIP_TRAILING_SLASH", True),
+        )
+
+    def canonicalize(self, url):
+        """
+        Return the canonical form of a URL, which is still fetched as is.
+
+        Args:
+            url (str): Absolute URL.
+
+        Returns:
+            str: Canonical URL; other than http(s) URLs are returned unchanged.
+        """
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return url
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS:
+            return url
+        netloc = parts.netloc.lower()
+        if netloc.endswith(DEFAULT_PORTS[scheme]):
+            netloc = netloc[:-len(DEFAULT_PORTS[scheme])]
+        path = PATH_SESSION.sub("", parts.path) if ";" in parts.path else parts.path
+        query = parts.query
+        if query:
+            allowed = self.param_allowlists.get(normalize_host(netloc))
+            query = urlencode([
+                (name, value) for name, value in parse_qsl(query, keep_blank_values=True)
+                if (name in allowed if allowed is not None else not self.drop.fullmatch(name))
+            ])
+        return canonicalize_url(urlunsplit((scheme, netloc, path, query, "")))
+
+    def key(self, url):
+        """
+        Return the key under which a URL is deduplicated.
+
+        Args:
+            url (str): Absolute URL.
+
+        Returns:
+            str: Canonical URL, without the trailing slash of paths below the root if
+            ``strip_trailing_slash`` is set.
+        """
+        canonical = self.canonicalize(url)
+        if not self.strip_trailing_slash:
+            return canonical
+        head, separator, query = canonical.partition("?")
+        # More than the three slashes of "scheme://host/" means a path below the root
+        if head.endswith("/") and head.count("/") > 3:
+            head = head.rstrip("/")
+            if head.count("/") < 3:
+                head += "/"
+        return head + separator + query
+
+
+class CanonicalRequestFingerprinter(RequestFingerprinter):
+    """
+    Request fingerprinter that identifies a request by the canonical key of its URL.
+
+    Redirected requests keep the fingerprint of the URL they were redirected
+    to, so a redirect from ``/page`` to ``/page/`` is not dropped as a
+    duplicate of itself.
+    """
+
+    def __init__(self, crawler=None):
+        """
+        Initialize the fingerprinter.
+
+        Args:
+            crawler (scrapy.crawler.Crawler, optional): Running crawler.
+        """
+        if crawler is not None:
+            super().__init__(crawler)
+        else:
+            # Scrapy falls back to the deprecated 2.6 implementation without a crawler
+            self._fingerprint = request_fingerprint
+        self.canonicalizer = (UrlCanonicalizer.from_settings(crawler.settings) if crawler
+                              else UrlCanonicalizer())
+        self.cache = WeakKeyDictionary()
+
+    def fingerprint(self, request):
+        """
+        Return the fingerprint of a request.
+
+        Args:
+            request (scrapy.Request): Request to fingerprint.
+
+        Returns:
+            bytes: Fingerprint of the method, canonical URL and body.
+        """
+        if request in self.cache:
+            return self.cache[request]
+        key = request.url
+        if not request.meta.get("redirect_urls"):
+            key = self.canonicalizer.key(request.url)
+        fingerprint = super().fingerprint(request if key == request.url
+                                          else request.replace(url=key))
+        self.cache[request] = fingerprint
+        return fingerprint
@@ -0,0 +1,251 @@
+"""Disk-backed, memory-bounded duplicate filter for resumable crawls."""
+
+
+import hashlib
+import logging
+import math
+import mmap
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+from w3lib.url import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Bloom filter whose bit array is a memory-mapped file."""
+
+    def __init__(self, directory, capacity, error_rate, name="seen"):
+        """
+        Open or create the filter.
+
+        The file name records the size and hash count, so a resumed crawl always
+        reopens a filter with the same parameters.
+
+        Args:
+            directory (str): Directory of the bit array file.
+            capacity (int): Expected number of elements.
+            error_rate (float): False positive rate at ``capacity`` elements.
+            name (str): Prefix of the file name.
+        """
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.size = (self.bits + 7) // 8
+        self.path = os.path.join(directory, f"{name}-{self.bits}-{self.hashes}.bloom")
+        with open(self.path, "ab") as file:
+            if file.tell() < self.size:
+                file.truncate(self.size)
+        self.file = open(self.path, "r+b")
+        self.array = mmap.mmap(self.file.fileno(), self.size)
+
+    def _positions(self, fingerprint):
+        """
+        Yield the bit positions of a fingerprint using double hashing.
+
+        Args:
+            fingerprint (bytes): At least 16 bytes of a uniformly distributed hash.
+        """
+        first = int.from_bytes(fingerprint[:8], "little")
+        second = int.from_bytes(fingerprint[8:16], "little") | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.bits
+
+    def add(self, fingerprint):
+        """
+        Add a fingerprint.
+
+        Args:
+            fingerprint (bytes): Fingerprint to add.
+
+        Returns:
+            bool: True if the fingerprint was possibly present already.
+        """
+        present = True
+        for position in self._positions(fingerprint):
+            byte, bit = divmod(position, 8)
+            value = self.array[byte]
+            if not value & (1 << bit):
+                present = False
+                self.array[byte] = value | (1 << bit)
+        return present
+
+    def resident_bytes(self):
+        """
+        Measure how much of the bit array is resident in memory.
+
+        Reads the mapping of the array in /proc/self/smaps, so only the pages
+        the crawl actually touched are counted.
+
+        Returns:
+            int or None: Resident bytes, None where /proc is not available.
+        """
+        try:
+            with open("/proc/self/smaps", encoding="utf-8", errors="replace") as smaps:
+                mapped = False
+                for line in smaps:
+                    fields = line.split()
+                    if "-" in fields[0] and len(fields) >= 5 and not fields[0].endswith(":"):
+                        mapped = fields[-1] == os.path.realpath(self.path)
+                    elif mapped and fields[0] == "Rss:":
+                        return int(fields[1]) * 1024
+        except OSError:
+            return None
+        return 0
+
+    def close(self):
+        """Flush and close the bit array."""
+        self.array.flush()
+        self.array.close()
+        self.file.close()
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    """
+    Request duplicate filter backed by a Bloom filter with an exact on-disk fallback.
+
+    New fingerprints are recognised by the memory-mapped Bloom filter alone.
+    Only when the filter reports a possible duplicate is the exact SQLite store
+    consulted, so false positives never drop a URL. Both files live in the
+    JOBDIR and survive restarts; without a JOBDIR a temporary directory is used.
+    Memory stays at the size of the two Bloom filters (about 1.8 MB each per
+    million URLs at a 0.1% error rate) plus SQLite's page cache, whatever the
+    number of URLs. On close, the memory the filters actually occupy is
+    measured and reported per million seen URLs.
+
+    A second Bloom filter remembers the links as they were found on the page
+    (``raw_url`` in the request meta), in the form Scrapy's default
+    fingerprint compares them. A filtered request whose raw link was new is a
+    duplicate that only URL canonicalisation avoided, and is counted as such.
+    """
+
+    def __init__(self, path=None, debug=False, *, fingerprinter=None, capacity=10_000_000,
+                 error_rate=0.001, stats=None):
+        """
+        Open the filter.
+
+        Args:
+            path (str, optional): Job directory; a temporary directory if None.
+            debug (bool): Log every filtered request.
+            fingerprinter (RequestFingerprinter, optional): Request fingerprinter.
+            capacity (int): Number of URLs the Bloom filter is sized for.
+            error_rate (float): Bloom filter false positive rate at capacity.
+            stats (scrapy.statscollectors.StatsCollector, optional): Collector for counters.
+        """
+        super().__init__(None, debug, fingerprinter=fingerprinter)
+        self.temporary = path is None
+        self.directory = tempfile.mkdtemp(prefix="dupefilter-") if path is None else path
+        os.makedirs(self.directory, exist_ok=True)
+        self.bloom = BloomFilter(self.directory, capacity, error_rate)
+        self.raw_bloom = BloomFilter(self.directory, capacity, error_rate, name="raw")
+        self.capacity = capacity
+        self.stats = stats
+        self.pending = 0
+        self.db = sqlite3.connect(os.path.join(self.directory, "seen.sqlite"))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS seen (fp BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.seen = self.db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+        if self.seen:
+            logger.info(f"Resuming with {self.seen} seen URLs from {self.directory}")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Create the filter from the crawler settings.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+
+        Returns:
+            BloomDupeFilter: New filter.
+        """
+        settings = crawler.settings
+        return cls(
+            job_dir(settings),
+            settings.getbool("DUPEFILTER_DEBUG"),
+            fingerprinter=crawler.request_fingerprinter,
+            capacity=settings.getint("DUPEFILTER_CAPACITY", 10_000_000),
+            error_rate=settings.getfloat("DUPEFILTER_ERROR_RATE", 0.001),
+            stats=crawler.stats,
+        )
+
+    def request_seen(self, request):
+        """
+        Check a request and remember it.
+
+        Args:
+            request (scrapy.Request): Request about to be scheduled.
+
+        Returns:
+            bool: True if the request was seen before.
+        """
+        fingerprint = self.fingerprinter.fingerprint(request)
+        raw_seen = self.raw_bloom.add(self._raw_fingerprint(request))
+        if self.bloom.add(fingerprint):
+            if self.db.execute("SELECT 1 FROM seen WHERE fp = ?", (fingerprint,)).fetchone():
+                if not raw_seen:
+                    self._inc("canonical/duplicates_avoided")
+                return True
+            self._inc("dupefilter/bloom_false_positives")
+        self.db.execute("INSERT OR IGNORE INTO seen (fp) VALUES (?)", (fingerprint,))
+        self.seen += 1
+        self.pending += 1
+        if self.pending >= 1000:
+            self.db.commit()
+            self.pending = 0
+        return False
+
+    def close(self, reason):
+        """
+        Persist the store and report its memory use.
+
+        ``dupefilter/bloom_bytes`` is the mapped size the filters were configured
+        for; ``dupefilter/bloom_resident_bytes`` is the memory they occupy,
+        measured before they are closed.
+
+        Args:
+            reason (str): Reason the spider was closed.
+        """
+        if self.stats is not None:
+            self.stats.set_value("dupefilter/seen", self.seen)
+            self.stats.set_value("dupefilter/bloom_bytes", self.bloom.size + self.raw_bloom.size)
+            resident = [bloom.resident_bytes() for bloom in (self.bloom, self.raw_bloom)]
+            if None not in resident:
+                self.stats.set_value("dupefilter/bloom_resident_bytes", sum(resident))
+                if self.seen:
+                    self.stats.set_value("dupefilter/bloom_resident_bytes_per_million_seen",
+                                         sum(resident) * 1_000_000 // self.seen)
+        self.db.commit()
+        self.db.close()
+        self.bloom.close()
+        self.raw_bloom.close()
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _raw_fingerprint(self, request):
+        """
+        Hash the link a request was made for, as Scrapy's default fingerprint compares it.
+
+        Args:
+            request (scrapy.Request): Request about to be scheduled.
+
+        Returns:
+            bytes: 16-byte digest.
+        """
+        raw_url = canonicalize_url(request.meta.get("raw_url", request.url))
+        return hashlib.blake2b(raw_url.encode("utf-8"), digest_size=16).digest()
+
+    def _inc(self, key):
+        """
+        Increment a counter if a stats collector is attached.
+
+        Args:
+            key (str): Stats key.
+        """
+        if self.stats is not None:
+            self.stats.inc_value(key)
@@ -0,0 +1,250 @@
+"""Stop downloads of pages the crawl would throw away, from the headers or the first body bytes."""
+
+
+import logging
+import re
+import zlib
+from weakref import WeakKeyDictionary
+
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured, StopDownload
+
+logger = logging.getLogger(__name__)
+
+HTML_LANG = re.compile(rb"<html\b[^>]*?\blang\s*=\s*[\"']?([a-z]{2,3})", re.IGNORECASE)
+HTML_TAG = re.compile(rb"<html\b[^>]*>", re.IGNORECASE)
+
+
+class Sniff:
+    """Headers and the first body bytes of a download that is still being checked."""
+
+    def __init__(self, content_type, length, encoding):
+        """
+        Initialize the state of a download.
+
+        Args:
+            content_type (str): Lowercase media type, "" if the header is missing.
+            length (int or None): Announced body length, None if unknown.
+            encoding (str): Lowercase Content-Encoding, "" if the body is not compressed.
+        """
+        self.content_type = content_type
+        self.length = length
+        self.received = 0
+        self.head = b""
+        self.sniffing = True
+        self.decompressor = (zlib.decompressobj(zlib.MAX_WBITS | 32)
+                             if encoding in ("gzip", "x-gzip", "deflate") else None)
+        if encoding and self.decompressor is None:
+            # Other encodings (e.g. br) are not sniffed, only their headers are checked
+            self.sniffing = False
+
+
+class EarlyAbortMiddleware:
+    """
+    Stop downloads of pages that would be discarded after the download.
+
+    The headers are checked first: a Content-Type outside EARLY_ABORT_CONTENT_TYPES
+    or a Content-Length above the cap of the content type stops the download at
+    once. Otherwise the first EARLY_ABORT_SNIFF_BYTES of the body, decompressed if
+    needed, are searched for ``<html lang>``, and the download stops if it is one
+    of EARLY_ABORT_LANGUAGES. The cap is also enforced while the body streams in.
+
+    Content-Language is not checked: the spider decides by ``<html lang>``, and
+    servers often send a site-wide Content-Language on pages in other languages.
+    A stopped page is not a link source either, so EARLY_ABORT_LANGUAGES is empty
+    by default; pages reachable only through pages in those languages are
+    missed when it is set.
+
+    Only page requests handled by ``Spider.parse`` are checked. Stopped requests
+    are dropped silently, and the bytes that were not transferred are added to
+    ``early_abort/bytes_saved`` when the length was announced.
+    """
+
+    def __init__(self, crawler, content_types, languages, sniff_bytes=4096, max_sizes=None):
+        """
+        Initialize the middleware.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+            content_types (iterable): Media types that are downloaded; others are stopped.
+            languages (iterable): ``<html lang>`` primary subtags whose pages are stopped;
+                empty to download pages in every language.
+            sniff_bytes (int): Body bytes searched for ``<html lang>``.
+            max_sizes (dict, optional): Media type to maximum body size in bytes; "*"
+                applies to all other types.
+        """
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.content_types = frozenset(content_types)
+        self.languages = frozenset(languages)
+        self.sniff_bytes = sniff_bytes
+        self.max_sizes = dict(max_sizes or {})
+        self.downloads = WeakKeyDictionary()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Create the middleware from the crawler settings.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+
+        Returns:
+            EarlyAbortMiddleware: New middleware.
+        """
+        settings = crawler.settings
+        if not settings.getbool("EARLY_ABORT_ENABLED", True):
+            raise NotConfigured
+        middleware = cls(
+            crawler,
+            content_types=settings.getlist("EARLY_ABORT_CONTENT_TYPES"),
+            languages=settings.getlist("EARLY_ABORT_LANGUAGES"),
+            sniff_bytes=settings.getint("EARLY_ABORT_SNIFF_BYTES", 4096),
+            max_sizes=settings.getdict("EARLY_ABORT_MAX_SIZES"),
+        )
+        crawler.signals.connect(middleware.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(middleware.bytes_received, signal=signals.bytes_received)
+        return middleware
+
+    def is_checked(self, request, spider):
+        """
+        Check whether a request fetches a page for ``Spider.parse``.
+
+        Args:
+            request (scrapy.Request): Request being downloaded.
+            spider (scrapy.Spider): Running spider.
+
+        Returns:
+            bool: False for robots.txt, sitemaps and other internal requests.
+        """
+        return request.callback is None or request.callback == getattr(spider, "parse", None)
+
+    def headers_received(self, headers, body_length, request, spider):
+        """
+        Check the headers of a download.
+
+        Args:
+            headers (scrapy.http.Headers): Response headers.
+            body_length (int): Announced body length, or Twisted's UNKNOWN_LENGTH.
+            request (scrapy.Request): Request being downloaded.
+            spider (scrapy.Spider): Running spider.
+
+        Raises:
+            StopDownload: If the page will be discarded.
+        """
+        if not self.is_checked(request, spider):
+            return
+        content_type = headers.get(b"Content-Type", b"").decode("latin-1")
+        content_type = content_type.split(";")[0].strip().lower()
+        length = body_length if isinstance(body_length, int) and body_length >= 0 else None
+        if content_type and content_type not in self.content_types:
+            self.stop(request, "content_type", length, 0)
+        if length is not None and length > self.max_size(content_type):
+            self.stop(request, "max_size", length, 0)
+        encoding = headers.get(b"Content-Encoding", b"").decode("latin-1").strip().lower()
+        self.downloads[request] = Sniff(content_type, length, encoding)
+
+    def bytes_received(self, data, request, spider):
+        """
+        Check the first bytes of a body and its size so far.
+
+        Args:
+            data (bytes): Received chunk, as sent by the server.
+            request (scrapy.Request): Request being downloaded.
+            spider (scrapy.Spider): Running spider.
+
+        Raises:
+            StopDownload: If the page will be discarded.
+        """
+        sniff = self.downloads.get(request)
+        if sniff is None:
+            return
+        sniff.received += len(data)
+        if sniff.received > self.max_size(sniff.content_type):
+            self.stop(request, "max_size", sniff.length, sniff.received)
+        if not sniff.sniffing:
+            return
+        try:
+            chunk = sniff.decompressor.decompress(data) if sniff.decompressor else data
+        except zlib.error:
+            sniff.sniffing = False
+            return
+        sniff.head = (sniff.head + chunk)[:self.sniff_bytes]
+        if not sniff.content_type and b"\0" in sniff.head[:512]:
+            self.stop(request, "binary", sniff.length, sniff.received)
+        match = HTML_TAG.search(sniff.head)
+        if match is None and len(sniff.head) < self.sniff_bytes:
+            return
+        sniff.sniffing = False
+        sniff.head = b""
+        language = HTML_LANG.match(match.group(0)) if match else None
+        if language and language.group(1).decode("ascii").lower() in self.languages:
+            self.stop(request, "html_lang", sniff.length, sniff.received)
+
+    def max_size(self, content_type):
+        """
+        Return the body size cap of a content type.
+
+        Args:
+            content_type (str): Lowercase media type.
+
+        Returns:
+            float: Maximum size in bytes, infinity if uncapped.
+        """
+        return self.max_sizes.get(content_type, self.max_sizes.get("*", float("inf")))
+
+    def stop(self, request, reason, length, received):
+        """
+        Record and stop a download.
+
+        Args:
+            request (scrapy.Request): Request being downloaded.
+            reason (str): Why the page is discarded.
+            length (int or None): Announced body length, None if unknown.
+            received (int): Body bytes received so far.
+
+        Raises:
+            StopDownload: Always.
+        """
+        self.downloads.pop(request, None)
+        request.meta["early_abort"] = reason
+        self.stats.inc_value("early_abort/requests")
+        self.stats.inc_value(f"early_abort/reason/{reason}")
+        self.stats.inc_value("early_abort/bytes_received", received)
+        if length is not None:
+            self.stats.inc_value("early_abort/bytes_saved", max(0, length - received))
+        else:
+            self.stats.inc_value("early_abort/unknown_length")
+        logger.debug(f"Stopped download of {request.url} ({reason})")
+        raise StopDownload(fail=True)
+
+    def process_response(self, request, response, spider):
+        """
+        Forget the state of a finished download.
+
+        Args:
+            request (scrapy.Request): Downloaded request.
+            response (scrapy.http.Response): Its response.
+            spider (scrapy.Spider): Running spider.
+
+        Returns:
+            scrapy.http.Response: The response, unchanged.
+        """
+        self.downloads.pop(request, None)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        """
+        Drop a stopped download without logging it as an error.
+
+        Args:
+            request (scrapy.Request): Failed request.
+            exception (Exception): Download error.
+            spider (scrapy.Spider): Running spider.
+
+        Raises:
+            IgnoreRequest: If the download was stopped by this middleware.
+        """
+        self.downloads.pop(request, None)
+        if isinstance(exception, StopDownload) and "early_abort" in request.meta:
+            raise IgnoreRequest(f"Download stopped: {request.meta['early_abort']}")
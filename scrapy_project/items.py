@@ -0,0 +1,25 @@
+"""Items yielded by the spider."""
+
+
+import scrapy
+
+
+class LinkMetadataItem(scrapy.Item):
+    """Metadata of a crawled page, stored in the link_metadata table by MetadataPipeline."""
+
+    url = scrapy.Field()
+    domain = scrapy.Field()
+    language = scrapy.Field()
+    last_modified_at = scrapy.Field()
+    etag = scrapy.Field()
+    content_hash = scrapy.Field()
+    content_changed_at = scrapy.Field()
+    status_code = scrapy.Field()
+    scraped_at = scrapy.Field()
+    check_count = scrapy.Field()
+    change_count = scrapy.Field()
+    recrawl_interval = scrapy.Field()
+    next_due_at = scrapy.Field()
+    crawl_priority = scrapy.Field()
+    simhash = scrapy.Field()
+    duplicate_of = scrapy.Field()
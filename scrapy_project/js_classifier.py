@@ -0,0 +1,252 @@
+"""Decide which pages need JavaScript rendering, learning per domain and path prefix."""
+
+
+import json
+import logging
+import os
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+RenderDecision = namedtuple("RenderDecision", ["render", "compare"])
+# File of the learned decisions in the data directory of a domain, next to its template
+MEMORY_FILE = "js_classifier.json"
+
+
+class PrefixMemory:
+    """Comparison results for one domain and path prefix."""
+
+    def __init__(self, samples=0, needed=0, decision=None, decided_at=None):
+        """
+        Initialize the memory.
+
+        Args:
+            samples (int): Number of comparisons.
+            needed (int): Comparisons in which rendering found more content.
+            decision (bool, optional): Settled decision, None while still learning.
+            decided_at (datetime, optional): When the decision was settled.
+        """
+        self.samples = samples
+        self.needed = needed
+        self.decision = decision
+        self.decided_at = decided_at
+
+    def add(self, needed, min_samples):
+        """
+        Record one static-vs-rendered comparison and settle the decision once sampled enough.
+
+        Args:
+            needed (bool): True if rendering found noticeably more content.
+            min_samples (int): Comparisons needed before the decision is cached.
+        """
+        self.samples += 1
+        self.needed += int(needed)
+        if self.samples >= min_samples:
+            self.decision = self.needed * 2 >= self.samples
+            self.decided_at = datetime.now()
+
+
+class JsClassifier:
+    """
+    Score pages for JavaScript rendering and remember the outcome per template.
+
+    Until a path prefix of a domain has ``min_samples`` comparisons, every page
+    the score sends to Playwright is compared with its static HTML, and a
+    ``sample_rate`` share of the pages the score keeps static is rendered
+    anyway for comparison. After that the majority outcome is reused for the
+    prefix and no more comparisons are made. Settled decisions are saved with
+    ``save`` and reused by later crawls until they are ``max_age`` old.
+    """
+
+    def __init__(self, threshold=0.5, path_depth=1, min_samples=3, sample_rate=0.1, stats=None,
+                 crawler=None, max_age=timedelta(days=30)):
+        """
+        Initialize the classifier.
+
+        Args:
+            threshold (float): ``HtmlDocument.js_score`` from which a page is rendered.
+            path_depth (int): Number of leading path segments that form a prefix.
+            min_samples (int): Comparisons after which a prefix decision is cached.
+            sample_rate (float): Share of statically classified pages rendered for comparison
+                while a prefix is still learning.
+            stats (scrapy.statscollectors.StatsCollector, optional): Collector for counters.
+            crawler (scrapy.crawler.Crawler, optional): Crawler whose stats are used when
+                ``stats`` is not given; read on use, as spiders are created before the stats.
+            max_age (timedelta): Age after which a saved decision is learned again.
+        """
+        self.threshold = threshold
+        self.path_depth = path_depth
+        self.min_samples = min_samples
+        self.sample_rate = sample_rate
+        self._stats = stats
+        self.crawler = crawler
+        self.max_age = max_age
+        self.memory = {}
+
+    @property
+    def stats(self):
+        """scrapy.statscollectors.StatsCollector or None: Collector for counters."""
+        if self._stats is None and self.crawler is not None:
+            return self.crawler.stats
+        return self._stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Create a classifier configured from the crawler settings.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+
+        Returns:
+            JsClassifier: New classifier.
+        """
+        settings = crawler.settings
+        return cls(
+            threshold=settings.getfloat("JS_CLASSIFIER_THRESHOLD", 0.5),
+            path_depth=settings.getint("JS_CLASSIFIER_PATH_DEPTH", 1),
+            min_samples=settings.getint("JS_CLASSIFIER_MIN_SAMPLES", 3),
+            sample_rate=settings.getfloat("JS_CLASSIFIER_SAMPLE_RATE", 0.1),
+            crawler=crawler,
+            max_age=timedelta(days=settings.getfloat("JS_CLASSIFIER_MAX_AGE_DAYS", 30)),
+        )
+
+    def prefix_key(self, url):
+        """
+        Return the memory key of a URL.
+
+        Args:
+            url (str): Page URL.
+
+        Returns:
+            tuple: Host and the first ``path_depth`` path segments.
+        """
+        parsed = urlparse(url)
+        segments = [segment for segment in parsed.path.split("/") if segment]
+        return parsed.netloc.lower(), tuple(segments[:self.path_depth])
+
+    def classify(self, url, document):
+        """
+        Decide whether to render a page and whether to compare it with its static HTML.
+
+        Args:
+            url (str): Page URL.
+            document (HtmlDocument): Static page.
+
+        Returns:
+            RenderDecision: ``render`` and ``compare`` flags.
+        """
+        memory = self.memory.get(self.prefix_key(url))
+        if memory is not None and memory.decision is not None:
+            decision = RenderDecision(render=memory.decision, compare=False)
+            self._inc("js_classifier/cached_decisions")
+        elif document.js_score >= self.threshold:
+            decision = RenderDecision(render=True, compare=True)
+        else:
+            sampled = random.random() < self.sample_rate
+            decision = RenderDecision(render=sampled, compare=sampled)
+        self._inc("js_classifier/pages")
+        if decision.render:
+            self._inc("js_classifier/rendered")
+        return decision
+
+    def record(self, url, static_document, rendered_document):
+        """
+        Compare a page rendered both ways and update the memory of its prefix.
+
+        Args:
+            url (str): Page URL.
+            static_document (HtmlDocument): Page as downloaded.
+            rendered_document (HtmlDocument): Page after rendering.
+
+        Returns:
+            bool: True if rendering found noticeably more links or text.
+        """
+        needed = (
+            len(rendered_document.links) > len(static_document.links) * 1.2 + 2
+            or rendered_document.text_length > static_document.text_length * 1.2 + 100
+        )
+        predicted = static_document.js_score >= self.threshold
+        self.memory.setdefault(self.prefix_key(url), PrefixMemory()).add(needed, self.min_samples)
+        self._inc("js_classifier/compared")
+        if predicted == needed:
+            self._inc("js_classifier/agreed")
+        return needed
+
+    def summarize(self):
+        """Write the render rate and score agreement ratios to the crawl stats."""
+        if self.stats is None:
+            return
+        pages = self.stats.get_value("js_classifier/pages", 0)
+        compared = self.stats.get_value("js_classifier/compared", 0)
+        if pages:
+            rendered = self.stats.get_value("js_classifier/rendered", 0)
+            self.stats.set_value("js_classifier/render_rate", round(rendered / pages, 4))
+        if compared:
+            agreed = self.stats.get_value("js_classifier/agreed", 0)
+            self.stats.set_value("js_classifier/agreement", round(agreed / compared, 4))
+        self.stats.set_value("js_classifier/prefixes_learned",
+                             sum(1 for memory in self.memory.values()
+                                 if memory.decision is not None))
+
+    def save(self, path):
+        """
+        Write the settled decisions to a JSON file, replacing it atomically.
+
+        Prefixes that are still learning are not saved; their comparisons start
+        over in the next crawl.
+
+        Args:
+            path (str): Target file; its directory is created if missing.
+        """
+        prefixes = [[host, list(segments), memory.samples, memory.needed, memory.decision,
+                     memory.decided_at.isoformat()]
+                    for (host, segments), memory in sorted(self.memory.items())
+                    if memory.decision is not None]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"prefixes": prefixes}, f)
+        os.replace(temporary, path)
+
+    def load(self, path, now=None):
+        """
+        Read the decisions saved by ``save``, skipping those older than ``max_age``.
+
+        Args:
+            path (str): Decision file.
+            now (datetime, optional): Current time; ``datetime.now()`` if None.
+
+        Returns:
+            int: Number of decisions loaded.
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                prefixes = json.load(f)["prefixes"]
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable JS classifier decisions {path}: {e}")
+            return 0
+        now = now or datetime.now()
+        loaded = 0
+        for host, segments, samples, needed, decision, decided_at in prefixes:
+            decided_at = datetime.fromisoformat(decided_at)
+            if now - decided_at <= self.max_age:
+                self.memory[(host, tuple(segments))] = PrefixMemory(samples, needed, decision,
+                                                                    decided_at)
+                loaded += 1
+        return loaded
+
+    def _inc(self, key):
+        """
+        Increment a counter if a stats collector is attached.
+
+        Args:
+            key (str): Stats key.
+        """
+        if self.stats is not None:
+            self.stats.inc_value(key)
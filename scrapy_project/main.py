@@ -1,68 +1,321 @@
 """Main."""
 
 
-from scrapy.crawler import CrawlerProcess
+import logging
+import os
+import shutil
+import signal
+import socket
+from scrapy.crawler import Crawler, CrawlerProcess
 from scrapy.utils.project import get_project_settings
-from sqlalchemy import and_, func
-from datetime import datetime
+from scrapy.utils.reactor import install_reactor
+from sqlalchemy import and_, func, or_, select, update
+from datetime import datetime, timedelta
 from urllib.parse import urlparse
-from models.database import get_db_session, ScrapingSchedule  # Import session function
+from twisted.internet import task
+from models.database import get_db_session, LinkMetadata, ScrapingSchedule
+from scrapy_project.metrics import serve_metrics
 from scrapy_project.spiders.spider import Spider  # Import the spider
+from scrapy_project.url_rules import normalize_host
 
+logger = logging.getLogger(__name__)
 
-def get_next_url(db_session):
-    """Fetch the next URL that needs scraping based on schedule."""
-    url_entry = db_session.query(
-        ScrapingSchedule.id,
-        func.trim(ScrapingSchedule.url).label("url"),
-        ScrapingSchedule.scraped_at,
-        ScrapingSchedule.scraping_interval
-    ).filter(
+
+def database_now(db_session):
+    """
+    Return the current time of the database server.
+
+    Leases are set and compared by this clock only, so workers whose clocks
+    disagree still agree on when a lease expires.
+    """
+    return db_session.scalar(select(func.now()))
+
+def claim_next_url(db_session, owner, lease_seconds):
+    """
+    Claim the next due schedule for this worker.
+
+    The row is locked with ``FOR UPDATE SKIP LOCKED`` so concurrent workers never
+    claim the same schedule, and schedules leased by another worker are skipped
+    until their lease expires (e.g. because that worker crashed). A schedule
+    with a ``next_due_at`` is due then instead of after its scraping_interval.
+    """
+    now = datetime.now()
+    lease_now = database_now(db_session)
+    url_entry = db_session.query(ScrapingSchedule).filter(
         and_(
             ScrapingSchedule.is_active == True,
             (ScrapingSchedule.scraped_at.is_(None)) |
-            (ScrapingSchedule.scraped_at + ScrapingSchedule.scraping_interval < datetime.now())
+            (func.coalesce(ScrapingSchedule.next_due_at,
+                           ScrapingSchedule.scraped_at + ScrapingSchedule.scraping_interval)
+             < now),
+            or_(ScrapingSchedule.lease_expires_at.is_(None),
+                ScrapingSchedule.lease_expires_at < lease_now)
         )
-    ).order_by(ScrapingSchedule.scraped_at.asc().nullsfirst()).first()
+    ).order_by(
+        ScrapingSchedule.scraped_at.asc().nullsfirst()
+    ).with_for_update(skip_locked=True).first()
+
+    if url_entry is None:
+        db_session.rollback()
+        return None
 
-    return db_session.query(ScrapingSchedule).get(url_entry.id) if url_entry else None
+    if url_entry.lease_owner and url_entry.lease_owner != owner:
+        logger.info(f"Reclaiming expired lease of {url_entry.lease_owner} on {url_entry.url}")
+    url_entry.lease_owner = owner
+    url_entry.lease_heartbeat_at = lease_now
+    url_entry.lease_expires_at = lease_now + timedelta(seconds=lease_seconds)
+    db_session.commit()
+    return url_entry
+
+def renew_leases(db_session, owner, schedule_ids, lease_seconds):
+    """
+    Extend the leases this worker holds.
+
+    Returns:
+        set: Ids of the schedules whose lease is still held by ``owner``.
+    """
+    if not schedule_ids:
+        return set()
+    now = database_now(db_session)
+    renewed = db_session.execute(
+        update(ScrapingSchedule)
+        .where(ScrapingSchedule.id.in_(list(schedule_ids)),
+               ScrapingSchedule.lease_owner == owner)
+        .values(lease_heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds))
+        .returning(ScrapingSchedule.id)
+    ).scalars().all()
+    db_session.commit()
+    return set(renewed)
 
 def update_scraped_at(db_session, url_entry):
     """Update the `scraped_at` timestamp after scraping."""
     url_entry.scraped_at = datetime.now()
     db_session.commit()
 
+def update_next_due(db_session, url_entry, min_interval):
+    """
+    Make a schedule due again as soon as the first of its pages is due.
+
+    The schedule is due at most ``scraping_interval`` and at least
+    ``min_interval`` after its last crawl.
+
+    Args:
+        db_session (sqlalchemy.orm.Session): Database session.
+        url_entry (ScrapingSchedule): Crawled schedule.
+        min_interval (timedelta): Shortest time between two crawls of the schedule.
+    """
+    domain = normalize_host(urlparse(url_entry.url.strip()).netloc)
+    first_due = db_session.query(func.min(LinkMetadata.next_due_at)).filter(
+        LinkMetadata.domain == domain).scalar()
+    if first_due is None:
+        url_entry.next_due_at = None
+    else:
+        latest = url_entry.scraped_at + url_entry.scraping_interval
+        url_entry.next_due_at = min(latest, max(first_due, url_entry.scraped_at + min_interval))
+    db_session.commit()
+
+def release_lease(db_session, url_entry):
+    """Give up the lease on a schedule so any worker can claim it when it is due."""
+    url_entry.lease_owner = None
+    url_entry.lease_heartbeat_at = None
+    url_entry.lease_expires_at = None
+    db_session.commit()
+
 
-def run_spider(url_entry):
-    """Run the spider for a given URL."""
-    parsed_url = urlparse(str(url_entry.url))
+class CrawlScheduler:
+    """
+    Keep up to MAX_CONCURRENT_CRAWLS due schedules crawling in one reactor.
 
-    if not parsed_url.scheme:
-        print(f"Skipping invalid URL: {url_entry.url}")
-        return
+    Every schedule runs as its own Spider instance with its own crawler. When a
+    crawl finishes its ``scraped_at`` is updated and the next due schedule is
+    started; the schedule table is also polled every SCHEDULE_POLL_INTERVAL
+    seconds for schedules that became due.
 
-    # Extract domain dynamically and pass it to the spider
-    allowed_domain = parsed_url.netloc
+    Schedules are claimed with a lease, so any number of workers can share the
+    schedule table. Leases are renewed every LEASE_HEARTBEAT_INTERVAL seconds;
+    a worker that stops renewing loses its schedules after LEASE_DURATION.
+    A crawl whose lease was lost is stopped without affecting the others.
+    Only a shutdown of the process stops polling and keeps the interrupted
+    schedules due.
+    """
 
-    process = CrawlerProcess(get_project_settings())
-    process.crawl(Spider, start_urls=[url_entry.url.strip()], allowed_domains=[allowed_domain])
-    process.start()
+    def __init__(self, settings):
+        """
+        Initialize the scheduler.
 
+        Args:
+            settings (scrapy.settings.Settings): Project settings.
+        """
+        self.settings = settings
+        self.process = CrawlerProcess(settings)
+        # Crawlers are created with per-schedule settings, so install the reactor up front
+        install_reactor(settings.get("TWISTED_REACTOR"), settings.get("ASYNCIO_EVENT_LOOP"))
+        self.max_crawls = settings.getint("MAX_CONCURRENT_CRAWLS", 4)
+        self.poll_interval = settings.getfloat("SCHEDULE_POLL_INTERVAL", 60)
+        self.worker_id = settings.get("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = settings.getint("LEASE_DURATION", 300)
+        self.running = {}
+        self.lease_lost = set()
+        self.stopping = False
+        self.poll_loop = task.LoopingCall(self.top_up)
+        self.heartbeat_loop = task.LoopingCall(self.heartbeat)
 
-if __name__ == "__main__":
-    while True:
+    def start(self):
+        """Start polling and run the reactor until the process is stopped."""
+        # Imported here: importing it earlier would install the default reactor
+        from twisted.internet import reactor
+
+        logger.info(f"Starting worker {self.worker_id}")
+        # After startup, once CrawlerProcess has installed its own signal handlers
+        reactor.callWhenRunning(reactor.callLater, 0, self.watch_shutdown)
+        reactor.addSystemEventTrigger("before", "shutdown", self.begin_shutdown)
+        # One /metrics server for all crawls of the process
+        if self.settings.getbool("METRICS_ENABLED", True):
+            serve_metrics(self.settings.getint("METRICS_PORT", 8000),
+                          self.settings.get("METRICS_INTERFACE", "0.0.0.0"))
+        self.poll_loop.start(self.poll_interval)
+        self.heartbeat_loop.start(self.settings.getfloat("LEASE_HEARTBEAT_INTERVAL", 60),
+                                  now=False)
+        self.process.start(stop_after_crawl=False)
+
+    def watch_shutdown(self):
+        """Mark the worker as stopping as soon as the process receives SIGINT or SIGTERM."""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            handler = signal.getsignal(signum)
+
+            def shutdown(received, frame, handler=handler):
+                self.begin_shutdown()
+                if callable(handler):
+                    handler(received, frame)
+
+            signal.signal(signum, shutdown)
+
+    def begin_shutdown(self):
+        """Stop claiming schedules and renewing leases because the process is stopping."""
+        if self.stopping:
+            return
+        logger.info(f"Worker {self.worker_id} is shutting down")
+        self.stopping = True
+        for loop in (self.poll_loop, self.heartbeat_loop):
+            if loop.running:
+                loop.stop()
+
+    def heartbeat(self):
+        """Renew the leases of running crawls and stop crawls whose lease was lost."""
         db_session = get_db_session()
+        try:
+            held = renew_leases(db_session, self.worker_id, self.running.keys(),
+                                self.lease_seconds)
+        except Exception as e:
+            logger.error(f"Failed to renew schedule leases: {e}")
+            return
+        finally:
+            db_session.close()
+        for schedule_id, crawler in list(self.running.items()):
+            if schedule_id not in held and schedule_id not in self.lease_lost:
+                logger.warning(f"Lost the lease on schedule {schedule_id}, stopping its crawl")
+                self.lease_lost.add(schedule_id)
+                crawler.stop()
 
+    def top_up(self):
+        """Start due schedules until MAX_CONCURRENT_CRAWLS crawls are running."""
+        if self.stopping:
+            return
+        db_session = get_db_session()
         try:
-            url_entry = get_next_url(db_session)
-            if not url_entry:
-                print("No URLs to scrape. Exiting...")
-                break
+            while len(self.running) < self.max_crawls:
+                url_entry = claim_next_url(db_session, self.worker_id, self.lease_seconds)
+                if not url_entry:
+                    break
+                if not self.start_crawl(url_entry):
+                    update_scraped_at(db_session, url_entry)
+                    release_lease(db_session, url_entry)
+        except Exception as e:
+            logger.error(f"Failed to fetch due schedules: {e}")
+        finally:
+            db_session.close()
+
+    def start_crawl(self, url_entry):
+        """
+        Start the crawl of a schedule in the running reactor.
+
+        Args:
+            url_entry (ScrapingSchedule): Due schedule.
+
+        Returns:
+            bool: False if the schedule URL is invalid and was skipped.
+        """
+        # The session expires url_entry when it commits, so keep what the callbacks need
+        schedule_id = url_entry.id
+        url = url_entry.url.strip()
+        parsed_url = urlparse(url)
+
+        if not parsed_url.scheme:
+            logger.warning(f"Skipping invalid URL: {url_entry.url}")
+            return False
+
+        # Extract domain dynamically and pass it to the spider
+        allowed_domain = parsed_url.netloc
 
-            print(f"Scraping: {url_entry.url}")
-            run_spider(url_entry)
+        # Keep the frontier and seen URLs of the schedule on disk so an interrupted crawl
+        # resumes; schedules on the same host each have their own
+        settings = self.settings.copy()
+        job_dir = os.path.join(settings.get("CRAWL_STATE_DIR"), str(schedule_id))
+        settings.set("JOBDIR", job_dir)
+        # Tells the metrics of concurrent crawls of one domain apart
+        settings.set("CRAWL_ID", str(schedule_id))
 
-            update_scraped_at(db_session, url_entry)
+        logger.info(f"Scraping: {url}")
+        crawler = Crawler(Spider, settings)
+        self.running[schedule_id] = crawler
+        d = self.process.crawl(crawler, start_urls=[url], allowed_domains=[allowed_domain],
+                               include_patterns=url_entry.include_patterns,
+                               exclude_patterns=url_entry.exclude_patterns)
+        d.addErrback(lambda failure: logger.error(f"Crawl of {url} failed: {failure.value}"))
+        d.addBoth(lambda _: self.crawl_finished(schedule_id, crawler, job_dir))
+        return True
 
+    def crawl_finished(self, schedule_id, crawler, job_dir):
+        """
+        Record a finished crawl and start the next due schedule.
+
+        Args:
+            schedule_id (int): Id of the crawled schedule.
+            crawler (scrapy.crawler.Crawler): Crawler of the finished crawl.
+            job_dir (str): JOBDIR of the crawl.
+        """
+        self.running.pop(schedule_id, None)
+        finish_reason = crawler.stats.get_value("finish_reason")
+        lease_lost = schedule_id in self.lease_lost
+        self.lease_lost.discard(schedule_id)
+        # A stopped crawl keeps the schedule due and its JOBDIR for resuming; "shutdown"
+        # is also the reason of a crawl stopped because its lease was lost
+        interrupted = self.stopping or lease_lost or finish_reason == "shutdown"
+
+        # A completed crawl starts from scratch next time
+        if finish_reason == "finished":
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+        db_session = get_db_session()
+        try:
+            url_entry = db_session.get(ScrapingSchedule, schedule_id)
+            if url_entry is not None and url_entry.lease_owner == self.worker_id:
+                if not interrupted:
+                    update_scraped_at(db_session, url_entry)
+                    if self.settings.getbool("RECRAWL_ADAPTIVE", True):
+                        update_next_due(db_session, url_entry, timedelta(
+                            seconds=self.settings.getfloat("RECRAWL_MIN_INTERVAL", 3600)))
+                release_lease(db_session, url_entry)
+        except Exception as e:
+            logger.error(f"Failed to update scraped_at of schedule {schedule_id}: {e}")
         finally:
             db_session.close()
+
+        if self.stopping:
+            return
+
+        self.top_up()
+
+
+if __name__ == "__main__":
+    CrawlScheduler(get_project_settings()).start()
@@ -0,0 +1,266 @@
+"""Per-stage timings kept in the Scrapy stats and served on a Prometheus /metrics endpoint."""
+
+
+import logging
+import time
+from contextlib import contextmanager
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet.error import CannotListenError
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("download", "language_detection", "js_classification", "near_duplicate", "render",
+          "save", "db_write")
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+GAUGES = {
+    "crawler_queue_depth": "Requests waiting in the scheduler.",
+    "crawler_downloads_in_flight": "Requests being downloaded.",
+    "crawler_renders_in_flight": "Pages being rendered by Playwright.",
+}
+
+_resource = None
+
+
+def observe(stats, stage, seconds):
+    """
+    Add one duration to the histogram of a stage.
+
+    The histogram lives in the stats as ``timing/<stage>/count``, ``/sum`` and
+    cumulative ``/le_<bound>`` buckets, so it is dumped with the other stats
+    when the crawl ends.
+
+    Args:
+        stats (scrapy.statscollectors.StatsCollector or None): Crawl stats.
+        stage (str): Stage name, one of STAGES.
+        seconds (float): Duration.
+    """
+    if stats is None:
+        return
+    stats.inc_value(f"timing/{stage}/count")
+    stats.inc_value(f"timing/{stage}/sum", seconds)
+    for bound in BUCKETS:
+        if seconds <= bound:
+            stats.inc_value(f"timing/{stage}/le_{bound}")
+
+
+@contextmanager
+def timed(stats, stage):
+    """
+    Time the enclosed block and add it to the histogram of a stage.
+
+    Args:
+        stats (scrapy.statscollectors.StatsCollector or None): Crawl stats.
+        stage (str): Stage name, one of STAGES.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stats, stage, time.perf_counter() - started)
+
+
+def _label(value):
+    """
+    Escape a Prometheus label value.
+
+    Args:
+        value (str): Raw value.
+
+    Returns:
+        str: Escaped value.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics(crawlers):
+    """
+    Render the metrics of running crawlers in the Prometheus text format.
+
+    Args:
+        crawlers (iterable): Running crawlers.
+
+    Returns:
+        str: Exposition text.
+    """
+    histograms, stats_lines = [], []
+    gauges = {name: [] for name in GAUGES}
+    for crawler in crawlers:
+        spider = crawler.spider
+        if spider is None or crawler.stats is None:
+            continue
+        domain = _label(spider.allowed_domains[0] if getattr(spider, "allowed_domains", None)
+                        else spider.name)
+        crawl = f'domain="{domain}",crawl="{_label(crawler.settings.get("CRAWL_ID") or domain)}"'
+        stats = crawler.stats.get_stats()
+        for stage in STAGES:
+            count = stats.get(f"timing/{stage}/count")
+            if not count:
+                continue
+            labels = f'{crawl},stage="{stage}"'
+            for bound in BUCKETS:
+                histograms.append(f'crawler_stage_seconds_bucket{{{labels},le="{bound}"}} '
+                                  f'{stats.get(f"timing/{stage}/le_{bound}", 0)}')
+            histograms.append(f'crawler_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            histograms.append(f"crawler_stage_seconds_sum{{{labels}}} "
+                              f"{stats.get(f'timing/{stage}/sum', 0)}")
+            histograms.append(f"crawler_stage_seconds_count{{{labels}}} {count}")
+
+        slot = getattr(crawler.engine, "slot", None)
+        queue_depth = len(slot.scheduler) if slot is not None else 0
+        in_flight = len(crawler.engine.downloader.active) if crawler.engine else 0
+        values = {
+            "crawler_queue_depth": queue_depth,
+            "crawler_downloads_in_flight": in_flight,
+            "crawler_renders_in_flight": getattr(spider, "renders_in_flight", 0),
+        }
+        for name, value in values.items():
+            gauges[name].append(f"{name}{{{crawl}}} {value}")
+
+        for name, value in sorted(stats.items()):
+            if isinstance(value, (int, float)) and not name.startswith("timing/"):
+                stats_lines.append(f'scrapy_stat{{{crawl},stat="{_label(name)}"}} {value}')
+
+    lines = [
+        "# HELP crawler_stage_seconds Time spent per page in each crawl stage.",
+        "# TYPE crawler_stage_seconds histogram",
+        *histograms,
+    ]
+    for name, description in GAUGES.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge", *gauges[name]]
+    lines += [
+        "# HELP scrapy_stat Numeric Scrapy stats of the running crawls.",
+        "# TYPE scrapy_stat untyped",
+        *stats_lines,
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsResource(Resource):
+    """``/metrics`` page listing every registered crawler."""
+
+    isLeaf = True
+
+    def __init__(self):
+        """Initialize the resource without crawlers."""
+        super().__init__()
+        self.crawlers = set()
+
+    def render_GET(self, request):
+        """
+        Answer a scrape.
+
+        Args:
+            request (twisted.web.server.Request): HTTP request.
+
+        Returns:
+            bytes: Exposition text.
+        """
+        if request.path != b"/metrics":
+            request.setResponseCode(404)
+            return b"Not found\n"
+        request.setHeader(b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+        return render_metrics(list(self.crawlers)).encode("utf-8")
+
+
+def serve_metrics(port, interface="0.0.0.0"):
+    """
+    Start the HTTP server of the process, unless it is already running.
+
+    The long-lived scheduler starts it once before its first crawl; a single
+    ``scrapy crawl`` starts it with its first crawler.
+
+    Args:
+        port (int): Port of the HTTP server.
+        interface (str): Interface of the HTTP server.
+
+    Returns:
+        MetricsResource: Page the crawlers of the process register with.
+    """
+    from twisted.internet import reactor
+
+    global _resource
+    if _resource is None:
+        _resource = MetricsResource()
+        try:
+            reactor.listenTCP(port, Site(_resource), interface=interface)
+            logger.info(f"Serving metrics on http://{interface}:{port}/metrics")
+        except CannotListenError as e:
+            logger.warning(f"Metrics endpoint not started: {e}")
+    return _resource
+
+
+class MetricsExporter:
+    """
+    Register a crawler with the /metrics server of the process.
+
+    Every crawler is listed while its spider is open, so the long-lived
+    scheduler exposes all of its concurrent crawls on one port. Each crawl is
+    labelled with its domain and its CRAWL_ID (the schedule id, set by
+    ``main.py``), so two crawls of one domain are told apart.
+    """
+
+    def __init__(self, crawler, resource):
+        """
+        Initialize the exporter.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+            resource (MetricsResource): Page of the process.
+        """
+        self.crawler = crawler
+        self.resource = resource
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Create the exporter from the crawler settings.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+
+        Returns:
+            MetricsExporter: New exporter.
+        """
+        if not crawler.settings.getbool("METRICS_ENABLED", True):
+            raise NotConfigured
+        resource = serve_metrics(crawler.settings.getint("METRICS_PORT", 8000),
+                                 crawler.settings.get("METRICS_INTERFACE", "0.0.0.0"))
+        exporter = cls(crawler, resource)
+        crawler.signals.connect(exporter.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(exporter.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(exporter.response_received, signal=signals.response_received)
+        return exporter
+
+    def spider_opened(self, spider):
+        """
+        Start exposing the crawler.
+
+        Args:
+            spider (scrapy.Spider): Opened spider.
+        """
+        self.resource.crawlers.add(self.crawler)
+
+    def spider_closed(self, spider):
+        """
+        Stop exposing the crawler.
+
+        Args:
+            spider (scrapy.Spider): Closed spider.
+        """
+        self.resource.crawlers.discard(self.crawler)
+
+    def response_received(self, response, request, spider):
+        """
+        Record the download time of a response.
+
+        Args:
+            response (scrapy.http.Response): Downloaded response.
+            request (scrapy.Request): Its request.
+            spider (scrapy.Spider): Running spider.
+        """
+        if "download_latency" in request.meta:
+            observe(self.crawler.stats, "download", request.meta["download_latency"])
@@ -0,0 +1,64 @@
+"""Downloader middlewares."""
+
+
+from datetime import timezone
+from email.utils import format_datetime
+
+
+class ConditionalRequestMiddleware:
+    """
+    Send If-None-Match / If-Modified-Since for pages that were crawled before.
+
+    The validators come from ``spider.page_state``. A 304 answer is passed to the
+    spider instead of being dropped as an HTTP error. Near-duplicates are not
+    stored, so they are fetched unconditionally: a 304 would leave no copy to
+    follow the links of.
+    """
+
+    def __init__(self, enabled=True):
+        """
+        Initialize the middleware.
+
+        Args:
+            enabled (bool): False turns conditional requests off.
+        """
+        self.enabled = enabled
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Create the middleware from the crawler settings.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+
+        Returns:
+            ConditionalRequestMiddleware: New middleware.
+        """
+        return cls(enabled=crawler.settings.getbool("INCREMENTAL_CRAWL", True))
+
+    def process_request(self, request, spider):
+        """
+        Add the stored validators of the page to the request.
+
+        Args:
+            request (scrapy.Request): Outgoing request.
+            spider (scrapy.Spider): Running spider.
+        """
+        page_state = getattr(spider, "page_state", None)
+        if not self.enabled or page_state is None or request.meta.get("dont_conditional"):
+            return
+        canonicalizer = getattr(spider, "canonicalizer", None)
+        state = page_state.get(canonicalizer.canonicalize(request.url) if canonicalizer
+                               else request.url)
+        if state is None or state.duplicate_of:
+            return
+        if state.etag:
+            request.headers.setdefault("If-None-Match", state.etag)
+        if state.last_modified_at:
+            last_modified = state.last_modified_at.replace(tzinfo=timezone.utc)
+            request.headers.setdefault("If-Modified-Since",
+                                       format_datetime(last_modified, usegmt=True))
+        if state.etag or state.last_modified_at:
+            request.meta["handle_httpstatus_list"] = (
+                list(request.meta.get("handle_httpstatus_list", [])) + [304])
@@ -0,0 +1,266 @@
+"""SimHash fingerprints of the main text of pages and a per-domain index of near-identical pages."""
+
+
+import copy
+import hashlib
+import re
+
+from lxml import etree
+
+FINGERPRINT_BITS = 64
+SHINGLE_WORDS = 3
+WORD = re.compile(r"\w+")
+
+MAIN_CONTENT = etree.XPath("//main | //*[@role='main']")
+# Visible text outside the navigation, banners and footers that most pages of a site repeat;
+# headers and footers of an article or of the main element belong to the content
+CONTENT_TEXT = etree.XPath(
+    ".//text()[not(ancestor::script or ancestor::style or ancestor::noscript "
+    "or ancestor::template or ancestor::nav or ancestor::aside or ancestor::form "
+    "or ancestor::header[not(ancestor::article or ancestor::main)] "
+    "or ancestor::footer[not(ancestor::article or ancestor::main)] "
+    "or ancestor::*[@role='navigation' or @role='banner' or @role='contentinfo' "
+    "or @role='complementary' or @role='search'])]"
+)
+
+
+def content_text(tree, template=None):
+    """
+    Return the main text of a page, without the blocks repeated across its site.
+
+    The text of ``<main>`` is used when the page has one, else the text of the
+    body. Navigation, asides, forms, and headers and footers outside an
+    article are left out, as are the blocks of the learned template of the
+    domain, which also catches repeated blocks without semantic tags.
+
+    Args:
+        tree (lxml.html.HtmlElement or None): Parsed page; not modified.
+        template (TemplateModel, optional): Template of the domain.
+
+    Returns:
+        str: Text with whitespace collapsed, "" for unparsable pages.
+    """
+    if tree is None:
+        return ""
+    if template is not None and template.blocks:
+        tree = copy.deepcopy(tree)
+        template.strip_lxml(tree)
+    roots = MAIN_CONTENT(tree)
+    root = roots[0] if roots else tree.find("body")
+    if root is None:
+        return ""
+    return " ".join(" ".join(CONTENT_TEXT(root)).split())
+
+
+def shingle_hashes(text, min_words=50):
+    """
+    Hash the overlapping word shingles of a text.
+
+    Args:
+        text (str): Main text of a page.
+        min_words (int): Texts with fewer words are not fingerprinted; thin pages
+            such as empty app shells would all look alike.
+
+    Returns:
+        set or None: Unsigned 64-bit shingle hashes, None if the text is too short.
+    """
+    words = WORD.findall(text.lower())
+    if len(words) < max(min_words, 1):
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS])
+                for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))}
+    return {int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(),
+                           "big") for shingle in shingles}
+
+
+def fingerprint_shingles(hashes):
+    """
+    Combine shingle hashes into a SimHash.
+
+    A bit of the fingerprint is set when it is set in more than half of the
+    shingle hashes. Texts that share most of their shingles get fingerprints
+    that differ in few bits.
+
+    Args:
+        hashes (set): Output of ``shingle_hashes``.
+
+    Returns:
+        int: Unsigned 64-bit fingerprint.
+    """
+    # Count the set bits per position column-wise; zip over the bit strings runs in C
+    columns = zip(*(f"{value:064b}" for value in hashes))
+    half = len(hashes) / 2
+    fingerprint = 0
+    for column in columns:
+        fingerprint = (fingerprint << 1) | (column.count("1") > half)
+    return fingerprint
+
+
+def simhash(text, min_words=50):
+    """
+    Compute the SimHash of a text from its overlapping word shingles.
+
+    Args:
+        text (str): Main text of a page.
+        min_words (int): Texts with fewer words are not fingerprinted.
+
+    Returns:
+        int or None: Unsigned 64-bit fingerprint, None if the text is too short.
+    """
+    hashes = shingle_hashes(text, min_words)
+    return None if hashes is None else fingerprint_shingles(hashes)
+
+
+def resemblance(hashes, other):
+    """
+    Return the exact share of shingles two texts have in common (Jaccard index).
+
+    SimHash only estimates it; a match of the fingerprints is confirmed with it.
+
+    Args:
+        hashes (set): Shingle hashes of one text.
+        other (set): Shingle hashes of the other text.
+
+    Returns:
+        float: Between 0 and 1.
+    """
+    union = len(hashes | other)
+    return len(hashes & other) / union if union else 0.0
+
+
+def to_signed(fingerprint):
+    """
+    Convert an unsigned fingerprint to the signed value stored in a BIGINT column.
+
+    Args:
+        fingerprint (int or None): Unsigned 64-bit fingerprint.
+
+    Returns:
+        int or None: Signed 64-bit value.
+    """
+    if fingerprint is None or fingerprint < 1 << 63:
+        return fingerprint
+    return fingerprint - (1 << 64)
+
+
+def to_unsigned(value):
+    """
+    Convert a stored signed fingerprint back to its unsigned form.
+
+    Args:
+        value (int or None): Signed 64-bit value.
+
+    Returns:
+        int or None: Unsigned 64-bit fingerprint.
+    """
+    return None if value is None else value & ((1 << 64) - 1)
+
+
+class NearDuplicateIndex:
+    """
+    Fingerprints of the original pages of one domain, searchable by Hamming distance.
+
+    A fingerprint is split into ``max_distance + 1`` bands. Two fingerprints
+    within ``max_distance`` bits of each other agree on at least one whole
+    band, so a lookup only compares the pages that share a band value instead
+    of every page of the domain.
+    """
+
+    def __init__(self, max_distance=3):
+        """
+        Initialize an empty index.
+
+        Args:
+            max_distance (int): Largest number of differing bits of near-identical pages.
+        """
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        width = FINGERPRINT_BITS // bands
+        self.bands = [(i * width, FINGERPRINT_BITS - i * width if i == bands - 1 else width)
+                      for i in range(bands)]
+        self.tables = [{} for _ in self.bands]
+        self.fingerprints = {}
+
+    def __len__(self):
+        """
+        Return the number of indexed pages.
+
+        Returns:
+            int: Number of pages.
+        """
+        return len(self.fingerprints)
+
+    def _keys(self, fingerprint):
+        """
+        Split a fingerprint into its band values.
+
+        Args:
+            fingerprint (int): Unsigned 64-bit fingerprint.
+
+        Returns:
+            list: One value per band.
+        """
+        return [(fingerprint >> shift) & ((1 << width) - 1) for shift, width in self.bands]
+
+    def add(self, url, fingerprint):
+        """
+        Index a page, replacing its previous fingerprint.
+
+        Args:
+            url (str): Page URL.
+            fingerprint (int): Unsigned 64-bit fingerprint.
+        """
+        self.remove(url)
+        self.fingerprints[url] = fingerprint
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            table.setdefault(key, set()).add(url)
+
+    def remove(self, url):
+        """
+        Remove a page from the index if it is indexed.
+
+        Args:
+            url (str): Page URL.
+        """
+        fingerprint = self.fingerprints.pop(url, None)
+        if fingerprint is None:
+            return
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            urls = table[key]
+            urls.discard(url)
+            if not urls:
+                del table[key]
+
+    def candidates(self, fingerprint, exclude=None):
+        """
+        List the indexed pages within ``max_distance`` bits of a fingerprint.
+
+        Args:
+            fingerprint (int): Unsigned 64-bit fingerprint.
+            exclude (str, optional): URL that is not a match, e.g. the page itself.
+
+        Returns:
+            list: URLs, closest first; ties are ordered by URL.
+        """
+        distances = {}
+        for table, key in zip(self.tables, self._keys(fingerprint)):
+            for url in table.get(key, ()):
+                if url != exclude and url not in distances:
+                    distances[url] = (self.fingerprints[url] ^ fingerprint).bit_count()
+        return sorted((url for url, distance in distances.items()
+                       if distance <= self.max_distance),
+                      key=lambda url: (distances[url], url))
+
+    def find(self, fingerprint, exclude=None):
+        """
+        Find the closest indexed page within ``max_distance`` bits of a fingerprint.
+
+        Args:
+            fingerprint (int): Unsigned 64-bit fingerprint.
+            exclude (str, optional): URL that is not a match, e.g. the page itself.
+
+        Returns:
+            str or None: URL of the closest page, None if no page is near enough.
+        """
+        candidates = self.candidates(fingerprint, exclude)
+        return candidates[0] if candidates else None
@@ -0,0 +1,142 @@
+"""Stored validators and content hashes of the pages of a domain, used for incremental recrawls."""
+
+
+import hashlib
+import logging
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from models.database import LinkMetadata
+
+logger = logging.getLogger(__name__)
+
+PageState = namedtuple("PageState", [
+    "etag", "last_modified_at", "content_hash", "scraped_at",
+    "check_count", "change_count", "recrawl_interval", "next_due_at", "crawl_priority",
+    "simhash", "duplicate_of",
+])
+
+
+def hash_content(body):
+    """
+    Hash a response body.
+
+    Args:
+        body (bytes): Raw body.
+
+    Returns:
+        str: Hex digest identifying the content.
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class PageStateStore:
+    """Validators, content hash and recrawl state of every known page of one domain."""
+
+    def __init__(self):
+        """Initialize an empty store."""
+        self.pages = {}
+
+    def load(self, engine, domain):
+        """
+        Load the stored state of all pages of a domain with one query.
+
+        Args:
+            engine (sqlalchemy.engine.Engine): Database engine.
+            domain (str): Normalized domain, as stored in link_metadata.domain.
+
+        Returns:
+            int: Number of pages loaded.
+        """
+        query = select(
+            LinkMetadata.url, LinkMetadata.etag, LinkMetadata.last_modified_at,
+            LinkMetadata.content_hash, LinkMetadata.scraped_at, LinkMetadata.check_count,
+            LinkMetadata.change_count, LinkMetadata.recrawl_interval, LinkMetadata.next_due_at,
+            LinkMetadata.crawl_priority, LinkMetadata.simhash, LinkMetadata.duplicate_of,
+        ).where(LinkMetadata.domain == domain)
+        with engine.connect() as connection:
+            for url, *state in connection.execute(query):
+                self.pages[url] = PageState(*state)
+        logger.info(f"Loaded stored state of {len(self.pages)} pages of {domain}")
+        return len(self.pages)
+
+    def get(self, url):
+        """
+        Return the stored state of a page.
+
+        Args:
+            url (str): Page URL.
+
+        Returns:
+            PageState or None: Stored state, None for unknown pages.
+        """
+        return self.pages.get(url)
+
+    def is_unchanged(self, url, content_hash):
+        """
+        Check a freshly downloaded body against the stored hash.
+
+        Args:
+            url (str): Page URL.
+            content_hash (str): Hash of the new body.
+
+        Returns:
+            bool: True if the page was seen before with the same content.
+        """
+        state = self.pages.get(url)
+        return state is not None and state.content_hash == content_hash
+
+    def is_due(self, url, now):
+        """
+        Check whether a page should be fetched.
+
+        Args:
+            url (str): Page URL.
+            now (datetime): Current time.
+
+        Returns:
+            bool: True for unknown pages and pages whose next due time has passed.
+        """
+        state = self.pages.get(url)
+        return state is None or state.next_due_at is None or state.next_due_at <= now
+
+    def due_pages(self, now):
+        """
+        Return the known pages that are due, most urgent first.
+
+        Args:
+            now (datetime): Current time.
+
+        Returns:
+            list: (url, PageState) pairs ordered by descending crawl priority.
+        """
+        due = [(url, state) for url, state in self.pages.items()
+               if state.next_due_at is not None and state.next_due_at <= now]
+        return sorted(due, key=lambda page: -(page[1].crawl_priority or 0))
+
+    def fingerprints(self):
+        """
+        Return the stored text fingerprints of the pages that are not near-duplicates.
+
+        Returns:
+            list: (url, signed SimHash) pairs.
+        """
+        return [(url, state.simhash) for url, state in self.pages.items()
+                if state.simhash is not None and state.duplicate_of is None]
+
+    def is_fresh(self, url, lastmod):
+        """
+        Check a sitemap ``<lastmod>`` against the last crawl of a page.
+
+        Args:
+            url (str): Page URL.
+            lastmod (datetime or None): Last modification announced by the sitemap, as a
+                naive local time like ``scraped_at``.
+
+        Returns:
+            bool: True if the page was saved after it was last modified.
+        """
+        state = self.pages.get(url)
+        return (lastmod is not None and state is not None and state.content_hash is not None
+                and state.scraped_at is not None and lastmod <= state.scraped_at)
@@ -0,0 +1,213 @@
+"""Item pipelines."""
+
+
+import logging
+import time
+
+from sqlalchemy.exc import DBAPIError, OperationalError
+from twisted.internet import defer, task, threads
+
+from models.database import LinkMetadata, bulk_upsert
+from scrapy_project.items import LinkMetadataItem
+from scrapy_project.metrics import observe
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataPipeline:
+    """
+    Buffer link metadata and upsert it into link_metadata in batches.
+
+    A batch is written when METADATA_BATCH_SIZE pages are buffered, every
+    METADATA_FLUSH_INTERVAL seconds and when the spider closes. Writes run in
+    the reactor thread pool, one batch at a time, over the pooled engine.
+    Connection errors are retried with exponential backoff; a batch rejected
+    by the database is split in halves so only the offending rows are lost.
+    """
+
+    def __init__(self, engine_factory, batch_size=500, flush_interval=5.0, retry_times=3,
+                 retry_backoff=1.0, stats=None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            engine_factory (callable): Returns the SQLAlchemy engine.
+            batch_size (int): Buffered rows that trigger a write.
+            flush_interval (float): Seconds between time-based writes.
+            retry_times (int): Retries of a batch after a connection error.
+            retry_backoff (float): Seconds before the first retry, doubled on each retry.
+            stats (scrapy.statscollectors.StatsCollector, optional): Collector for counters.
+        """
+        self.engine_factory = engine_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_times = retry_times
+        self.retry_backoff = retry_backoff
+        self.stats = stats
+        self.engine = None
+        self.buffer = {}
+        self.lock = defer.DeferredLock()
+        self.flush_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Create the pipeline from the crawler settings.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+
+        Returns:
+            MetadataPipeline: New pipeline.
+        """
+        settings = crawler.settings
+        return cls(
+            engine_factory=settings.get("DB_ENGINE_FACTORY"),
+            batch_size=settings.getint("METADATA_BATCH_SIZE", 500),
+            flush_interval=settings.getfloat("METADATA_FLUSH_INTERVAL", 5.0),
+            retry_times=settings.getint("METADATA_RETRY_TIMES", 3),
+            retry_backoff=settings.getfloat("METADATA_RETRY_BACKOFF", 1.0),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        """
+        Connect and start the periodic flush.
+
+        Args:
+            spider (scrapy.Spider): Opened spider.
+        """
+        self.engine = self.engine_factory()
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    def close_spider(self, spider):
+        """
+        Stop the periodic flush and write the remaining rows.
+
+        Args:
+            spider (scrapy.Spider): Closing spider.
+
+        Returns:
+            twisted.internet.defer.Deferred: Fires when the last batch is written.
+        """
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        return self.flush()
+
+    def process_item(self, item, spider):
+        """
+        Buffer a metadata item; later items for the same URL are merged into it.
+
+        Items only update the fields they set, e.g. an unchanged page only
+        refreshes ``scraped_at``.
+
+        Args:
+            item (scrapy.Item): Scraped item.
+            spider (scrapy.Spider): Running spider.
+
+        Returns:
+            scrapy.Item or twisted.internet.defer.Deferred: The item, after the batch
+            is written if this item filled it.
+        """
+        if not isinstance(item, LinkMetadataItem):
+            return item
+        self.buffer.setdefault(item["url"], {}).update(item)
+        if len(self.buffer) >= self.batch_size:
+            return self.flush().addBoth(lambda _: item)
+        return item
+
+    def flush(self):
+        """
+        Write the buffered rows as one batch.
+
+        Returns:
+            twisted.internet.defer.Deferred: Fires when the batch is written.
+        """
+        if not self.buffer:
+            return self.lock.run(defer.succeed, None)
+        rows = sorted(self.buffer.values(), key=lambda row: row["url"])
+        self.buffer = {}
+        d = self.lock.run(threads.deferToThread, self._timed_write, rows)
+        d.addCallbacks(self._written, self._failed, errbackArgs=(rows,))
+        return d
+
+    def _timed_write(self, rows):
+        """
+        Write rows and measure how long the batch took.
+
+        Args:
+            rows (list): Row dicts.
+
+        Returns:
+            tuple: Number of written and of rejected rows, and seconds taken.
+        """
+        started = time.perf_counter()
+        written, rejected = self._write(rows)
+        return written, rejected, time.perf_counter() - started
+
+    def _write(self, rows):
+        """
+        Upsert rows, retrying connection errors and isolating rejected rows.
+
+        Runs in a worker thread. Rows are grouped by the columns they set, with
+        one upsert statement per group, all in one transaction.
+
+        Args:
+            rows (list): Row dicts.
+
+        Returns:
+            tuple: Number of written and of rejected rows.
+        """
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        for attempt in range(self.retry_times + 1):
+            try:
+                with self.engine.begin() as connection:
+                    for group in groups.values():
+                        bulk_upsert(connection, LinkMetadata.__table__, group)
+                return len(rows), 0
+            except OperationalError as e:
+                if attempt == self.retry_times:
+                    raise
+                delay = self.retry_backoff * 2 ** attempt
+                logger.warning(f"Metadata batch of {len(rows)} rows failed, retrying in "
+                               f"{delay:.1f}s: {e}")
+                time.sleep(delay)
+            except DBAPIError as e:
+                if len(rows) == 1:
+                    logger.error(f"Failed to save metadata for URL: {rows[0]['url']}, Error: {e}")
+                    return 0, 1
+                middle = len(rows) // 2
+                first, second = self._write(rows[:middle]), self._write(rows[middle:])
+                return first[0] + second[0], first[1] + second[1]
+        return 0, len(rows)
+
+    def _written(self, result):
+        """
+        Record a written batch in the crawl stats.
+
+        Args:
+            result (tuple): Written and rejected row counts, and seconds taken.
+        """
+        written, rejected, seconds = result
+        logger.info(f"Saved metadata batch: {written} rows written, {rejected} rejected "
+                    f"in {seconds:.3f}s")
+        observe(self.stats, "db_write", seconds)
+        if self.stats is not None:
+            self.stats.inc_value("metadata/batches")
+            self.stats.inc_value("metadata/rows_written", written)
+            self.stats.inc_value("metadata/rows_failed", rejected)
+
+    def _failed(self, failure, rows):
+        """
+        Log a batch that could not be written after all retries.
+
+        Args:
+            failure (twisted.python.failure.Failure): Final error.
+            rows (list): Rows of the lost batch.
+        """
+        logger.error(f"Failed to save metadata batch of {len(rows)} rows: {failure.value}")
+        if self.stats is not None:
+            self.stats.inc_value("metadata/rows_failed", len(rows))
@@ -0,0 +1,231 @@
+"""Long-lived pool of Playwright browsers and contexts shared across a crawl."""
+
+
+import asyncio
+import logging
+
+from playwright.async_api import async_playwright
+
+logger = logging.getLogger(__name__)
+
+# Chromium exposes the JS heap of the page through the non-standard performance.memory API.
+JS_HEAP_SCRIPT = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+
+
+class PoolSlot:
+    """One reusable browser context with a single warm page."""
+
+    def __init__(self, index):
+        """
+        Initialize an empty slot.
+
+        Args:
+            index (int): Position of the slot in the pool, used to pick its browser.
+        """
+        self.index = index
+        self.context = None
+        self.page = None
+        self.uses = 0
+
+    @property
+    def is_warm(self):
+        """bool: True if the slot holds an open context and page."""
+        return self.page is not None and not self.page.is_closed()
+
+
+class BrowserPool:
+    """
+    Pool of headless browsers and contexts that are started once and reused.
+
+    Each slot owns a browser context with one page. A render borrows a slot,
+    navigates its page and hands it back. Contexts are recycled after
+    ``max_uses`` renders or when the JS heap of the page grows over
+    ``max_memory_mb``.
+    """
+
+    def __init__(self, browser_type="chromium", launch_options=None, size=4, browsers=1,
+                 max_uses=50, max_memory_mb=0):
+        """
+        Initialize the pool. Browsers are launched lazily on first use.
+
+        Args:
+            browser_type (str): Playwright browser type ("chromium", "firefox" or "webkit").
+            launch_options (dict, optional): Keyword arguments for ``browser_type.launch``.
+            size (int): Number of contexts that may render at the same time.
+            browsers (int): Number of browser processes the contexts are spread over.
+            max_uses (int): Renders after which a context is closed and recreated.
+            max_memory_mb (int): JS heap size in MB after which a context is recycled,
+                0 disables the check.
+        """
+        self.browser_type = browser_type
+        self.launch_options = launch_options or {"headless": True}
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self._playwright = None
+        self._browsers = [None] * max(1, min(browsers, self.size))
+        self._launch_lock = None
+        self._idle = None
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "browsers_launched": 0,
+            "contexts_created": 0,
+            "contexts_recycled": 0,
+        }
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create a pool configured from Scrapy settings.
+
+        Args:
+            settings (scrapy.settings.Settings): Crawler settings.
+
+        Returns:
+            BrowserPool: New, not yet started pool.
+        """
+        return cls(
+            browser_type=settings.get("PLAYWRIGHT_BROWSER_TYPE", "chromium"),
+            launch_options=settings.getdict("PLAYWRIGHT_LAUNCH_OPTIONS"),
+            size=settings.getint("PLAYWRIGHT_POOL_SIZE", 4),
+            browsers=settings.getint("PLAYWRIGHT_POOL_BROWSERS", 1),
+            max_uses=settings.getint("PLAYWRIGHT_POOL_MAX_USES", 50),
+            max_memory_mb=settings.getint("PLAYWRIGHT_POOL_MAX_MEMORY_MB", 0),
+        )
+
+    def _ensure_queue(self):
+        """Create the idle-slot queue inside the running event loop."""
+        if self._idle is None:
+            self._launch_lock = asyncio.Lock()
+            self._idle = asyncio.Queue()
+            for index in range(self.size):
+                self._idle.put_nowait(PoolSlot(index))
+
+    async def _get_browser(self, index):
+        """
+        Return the browser for a slot, launching it (and Playwright) if needed.
+
+        Args:
+            index (int): Slot index.
+
+        Returns:
+            playwright.async_api.Browser: Connected browser.
+        """
+        position = index % len(self._browsers)
+        async with self._launch_lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            browser = self._browsers[position]
+            if browser is None or not browser.is_connected():
+                launcher = getattr(self._playwright, self.browser_type)
+                browser = await launcher.launch(**self.launch_options)
+                self._browsers[position] = browser
+                self._stats["browsers_launched"] += 1
+                logger.info(f"Launched {self.browser_type} browser #{position} for the pool")
+            return browser
+
+    async def acquire(self):
+        """
+        Borrow a slot with a ready page, waiting if all slots are busy.
+
+        Returns:
+            PoolSlot: Slot whose ``page`` can be navigated.
+        """
+        self._ensure_queue()
+        slot = await self._idle.get()
+        try:
+            if slot.is_warm:
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+                await self._close_slot(slot)
+                browser = await self._get_browser(slot.index)
+                slot.context = await browser.new_context()
+                slot.page = await slot.context.new_page()
+                self._stats["contexts_created"] += 1
+        except Exception:
+            await self._close_slot(slot)
+            self._idle.put_nowait(slot)
+            raise
+        return slot
+
+    async def release(self, slot, failed=False):
+        """
+        Return a slot to the pool, recycling its context when it is worn out.
+
+        Args:
+            slot (PoolSlot): Slot obtained from ``acquire``.
+            failed (bool): True if the render failed; the context is then discarded.
+        """
+        slot.uses += 1
+        try:
+            if failed or await self._should_recycle(slot):
+                self._stats["contexts_recycled"] += 1
+                await self._close_slot(slot)
+        finally:
+            self._idle.put_nowait(slot)
+
+    async def _should_recycle(self, slot):
+        """
+        Check the use count and memory threshold of a slot.
+
+        Args:
+            slot (PoolSlot): Slot to check.
+
+        Returns:
+            bool: True if the context should be closed.
+        """
+        if not slot.is_warm:
+            return True
+        if self.max_uses and slot.uses >= self.max_uses:
+            return True
+        if self.max_memory_mb:
+            try:
+                heap = await slot.page.evaluate(JS_HEAP_SCRIPT)
+            except Exception:
+                return True
+            return heap > self.max_memory_mb * 1024 * 1024
+        return False
+
+    async def _close_slot(self, slot):
+        """
+        Close the context of a slot and reset its counters.
+
+        Args:
+            slot (PoolSlot): Slot to reset.
+        """
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except Exception as e:
+                logger.debug(f"Closing pooled context failed: {e}")
+        slot.context = None
+        slot.page = None
+        slot.uses = 0
+
+    async def close(self):
+        """Close every context and browser and stop Playwright."""
+        if self._idle is not None:
+            while not self._idle.empty():
+                await self._close_slot(self._idle.get_nowait())
+        for browser in self._browsers:
+            if browser is not None:
+                try:
+                    await browser.close()
+                except Exception as e:
+                    logger.debug(f"Closing pooled browser failed: {e}")
+        self._browsers = [None] * len(self._browsers)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        self._idle = None
+
+    def stats(self):
+        """
+        Return pool counters.
+
+        Returns:
+            dict: Hit, miss, launch and recycle counts.
+        """
+        return dict(self._stats)
@@ -0,0 +1,139 @@
+"""Per-page recrawl intervals learned from the content-hash history of the pages."""
+
+
+import math
+from datetime import timedelta
+
+
+class RecrawlPolicy:
+    """
+    Learn how often each page changes and decide when and how urgently it is fetched again.
+
+    Every fetch compares the content hash with the stored one. A change means
+    the page changes at least as often as the time since the last check, so
+    the interval is set to at most that gap and divided by ``backoff``; no
+    change means it changes less often, so the interval is set to at least the
+    gap and multiplied by ``backoff``. The interval converges to the change
+    period of the page and is clamped to ``min_interval``..``max_interval``.
+
+    The priority of a page grows with how often it changes and falls with its
+    link depth, so a crawl fetches changing shallow pages first.
+    """
+
+    def __init__(self, min_interval=3600, max_interval=30 * 86400, initial_interval=86400,
+                 backoff=1.5, depth_weight=5, new_priority=100):
+        """
+        Initialize the policy.
+
+        Args:
+            min_interval (float): Shortest recrawl interval, in seconds.
+            max_interval (float): Longest recrawl interval, in seconds.
+            initial_interval (float): Interval of a page fetched for the first time, in seconds.
+            backoff (float): Factor the interval changes by after each check.
+            depth_weight (int): Priority lost per link of depth.
+            new_priority (int): Priority of pages that were never fetched, at depth 0.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.backoff = backoff
+        self.depth_weight = depth_weight
+        self.new_priority = new_priority
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create the policy from the crawler settings.
+
+        Args:
+            settings (scrapy.settings.Settings): Crawler settings.
+
+        Returns:
+            RecrawlPolicy: New policy.
+        """
+        return cls(
+            min_interval=settings.getfloat("RECRAWL_MIN_INTERVAL", 3600),
+            max_interval=settings.getfloat("RECRAWL_MAX_INTERVAL", 30 * 86400),
+            initial_interval=settings.getfloat("RECRAWL_INITIAL_INTERVAL", 86400),
+            backoff=settings.getfloat("RECRAWL_BACKOFF", 1.5),
+            depth_weight=settings.getint("RECRAWL_DEPTH_WEIGHT", 5),
+            new_priority=settings.getint("RECRAWL_NEW_PRIORITY", 100),
+        )
+
+    def next_interval(self, state, changed, now):
+        """
+        Compute the recrawl interval of a page after a check.
+
+        Args:
+            state (PageState or None): Stored state before the check, None for a new page.
+            changed (bool): Whether the content changed since the stored hash.
+            now (datetime): Time of the check.
+
+        Returns:
+            float: Interval in seconds.
+        """
+        if state is None or state.scraped_at is None:
+            return self.initial_interval
+        interval = (state.recrawl_interval.total_seconds() if state.recrawl_interval
+                    else self.initial_interval)
+        gap = max((now - state.scraped_at).total_seconds(), self.min_interval)
+        if changed:
+            interval = min(interval, gap) / self.backoff
+        else:
+            interval = max(interval, gap) * self.backoff
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def priority(self, interval, depth):
+        """
+        Compute the priority of a page.
+
+        Args:
+            interval (float): Recrawl interval in seconds.
+            depth (int): Link depth of the page in the crawl.
+
+        Returns:
+            int: Scrapy request priority; higher is fetched first.
+        """
+        urgency = 10 * math.log2(self.max_interval / max(interval, self.min_interval))
+        return round(urgency) - self.depth_weight * depth
+
+    def update(self, state, changed, now, depth=0):
+        """
+        Compute the recrawl columns of a page after a check.
+
+        Args:
+            state (PageState or None): Stored state before the check, None for a new page.
+            changed (bool): Whether the content changed since the stored hash.
+            now (datetime): Time of the check.
+            depth (int): Link depth of the page in the crawl.
+
+        Returns:
+            dict: check_count, change_count, recrawl_interval, next_due_at and crawl_priority.
+        """
+        interval = self.next_interval(state, changed, now)
+        checks = changes = 0
+        if state is not None:
+            checks = (state.check_count or 0) + 1
+            changes = (state.change_count or 0) + int(changed)
+        return {
+            "check_count": checks,
+            "change_count": changes,
+            "recrawl_interval": timedelta(seconds=interval),
+            "next_due_at": now + timedelta(seconds=interval),
+            "crawl_priority": self.priority(interval, depth),
+        }
+
+    def request_priority(self, state, depth):
+        """
+        Return the priority of a request for a page.
+
+        Args:
+            state (PageState or None): Stored state, None for a page that was never fetched.
+            depth (int): Link depth of the request.
+
+        Returns:
+            int: Scrapy request priority.
+        """
+        if state is None or state.crawl_priority is None:
+            return self.new_priority - self.depth_weight * depth
+        return state.crawl_priority
@@ -0,0 +1,107 @@
+"""Adaptive waits that end a Playwright render as soon as the page content has settled."""
+
+
+import asyncio
+import time
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+STRATEGIES = ("mutation", "scroll", "networkidle", "fixed")
+
+# Resolves once the DOM (mode "mutation") or the scroll height (mode "scroll") has not
+# changed for quietMs, or when maxMs has passed. Scrolls to the bottom whenever the page
+# grows so lazily loaded content is triggered, like the old fixed scroll loop did.
+SETTLE_SCRIPT = """
+([mode, quietMs, maxMs]) => new Promise(resolve => {
+    const start = performance.now();
+    const height = () => (document.body ? document.body.scrollHeight : 0);
+    let last = start;
+    let lastHeight = -1;
+    const observer = new MutationObserver(() => {
+        if (mode === "mutation") { last = performance.now(); }
+    });
+    observer.observe(document, {subtree: true, childList: true, attributes: true,
+                                characterData: true});
+    const timer = setInterval(() => {
+        const now = performance.now();
+        const current = height();
+        if (current !== lastHeight) {
+            lastHeight = current;
+            last = now;
+            window.scrollTo(0, current);
+        }
+        if (now - last >= quietMs || now - start >= maxMs) {
+            clearInterval(timer);
+            observer.disconnect();
+            resolve(now - start);
+        }
+    }, 50);
+})
+"""
+
+
+class SettleWait:
+    """Wait strategy with a hard cap, configurable globally and per domain."""
+
+    def __init__(self, strategy="mutation", max_wait=5.0, quiet_window=0.5):
+        """
+        Initialize the wait.
+
+        Args:
+            strategy (str): One of "mutation", "scroll", "networkidle" or "fixed".
+            max_wait (float): Hard cap in seconds.
+            quiet_window (float): Seconds without changes after which the page is settled.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown render wait strategy: {strategy}")
+        self.strategy = strategy
+        self.max_wait = max_wait
+        self.quiet_window = quiet_window
+
+    @classmethod
+    def from_settings(cls, settings, domain):
+        """
+        Build the wait for a domain, applying RENDER_WAIT_DOMAIN_OVERRIDES.
+
+        Args:
+            settings (scrapy.settings.Settings): Crawler settings.
+            domain (str): Normalized domain of the page.
+
+        Returns:
+            SettleWait: Wait configured for the domain.
+        """
+        override = settings.getdict("RENDER_WAIT_DOMAIN_OVERRIDES").get(domain, {})
+        return cls(
+            strategy=override.get("strategy", settings.get("RENDER_WAIT_STRATEGY", "mutation")),
+            max_wait=float(override.get("max_wait", settings.getfloat("RENDER_WAIT_MAX", 5.0))),
+            quiet_window=float(override.get("quiet_window",
+                                            settings.getfloat("RENDER_WAIT_QUIET", 0.5))),
+        )
+
+    async def wait(self, page):
+        """
+        Wait until the page has settled or the hard cap is reached.
+
+        Args:
+            page (playwright.async_api.Page): Page that has been navigated.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        started = time.monotonic()
+        if self.strategy == "fixed":
+            # Legacy behaviour: scroll five times with a one second pause
+            for _ in range(5):
+                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                await asyncio.sleep(1)
+        elif self.strategy == "networkidle":
+            try:
+                await page.wait_for_load_state("networkidle", timeout=self.max_wait * 1000)
+            except PlaywrightTimeoutError:
+                pass
+        else:
+            await page.evaluate(
+                SETTLE_SCRIPT,
+                [self.strategy, self.quiet_window * 1000, self.max_wait * 1000],
+            )
+        return time.monotonic() - started
@@ -0,0 +1,142 @@
+"""Request interception that keeps rendered pages from loading sub-resources we never use."""
+
+
+import re
+
+
+class ResourceBlocker:
+    """
+    Abort Playwright sub-requests by resource type and URL pattern.
+
+    Allow rules win over block rules, so a domain can whitelist a resource
+    that is blocked by default (e.g. a stylesheet needed for lazy loading).
+    The main document is never blocked.
+    """
+
+    def __init__(self, block_types=(), allow_types=(), block_urls=(), allow_urls=(),
+                 estimated_bytes=None, stats=None):
+        """
+        Initialize the blocker.
+
+        Args:
+            block_types (iterable): Playwright resource types to abort, e.g. "image".
+            allow_types (iterable): Resource types that are always loaded.
+            block_urls (iterable): Regular expressions of URLs to abort, e.g. analytics hosts.
+            allow_urls (iterable): Regular expressions of URLs that are always loaded.
+            estimated_bytes (dict, optional): Typical size per resource type, used to
+                estimate the bytes saved because aborted requests report no size.
+            stats (scrapy.statscollectors.StatsCollector, optional): Collector for counters.
+        """
+        self.block_types = set(block_types) - set(allow_types)
+        self.block_urls = self._combine(block_urls)
+        self.allow_urls = self._combine(allow_urls)
+        self.estimated_bytes = estimated_bytes or {}
+        self.stats = stats
+
+    @staticmethod
+    def _combine(patterns):
+        """
+        Compile a list of patterns into one alternation.
+
+        Args:
+            patterns (iterable): Regular expressions.
+
+        Returns:
+            re.Pattern or None: Combined pattern, None if the list is empty.
+        """
+        patterns = list(patterns)
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+
+    @classmethod
+    def from_settings(cls, settings, domain, stats=None):
+        """
+        Build the blocker for a domain, applying RESOURCE_BLOCK_DOMAIN_OVERRIDES.
+
+        Per-domain lists replace the global ones for the keys they define.
+
+        Args:
+            settings (scrapy.settings.Settings): Crawler settings.
+            domain (str): Normalized domain of the rendered page.
+            stats (scrapy.statscollectors.StatsCollector, optional): Collector for counters.
+
+        Returns:
+            ResourceBlocker: Blocker configured for the domain.
+        """
+        override = settings.getdict("RESOURCE_BLOCK_DOMAIN_OVERRIDES").get(domain, {})
+        return cls(
+            block_types=override.get("block_types", settings.getlist("RESOURCE_BLOCK_TYPES")),
+            allow_types=override.get("allow_types", settings.getlist("RESOURCE_ALLOW_TYPES")),
+            block_urls=override.get("block_urls", settings.getlist("RESOURCE_BLOCK_URLS")),
+            allow_urls=override.get("allow_urls", settings.getlist("RESOURCE_ALLOW_URLS")),
+            estimated_bytes=settings.getdict("RESOURCE_BLOCK_ESTIMATED_BYTES"),
+            stats=stats,
+        )
+
+    def should_block(self, resource_type, url):
+        """
+        Decide whether a sub-request is aborted.
+
+        Args:
+            resource_type (str): Playwright resource type of the request.
+            url (str): Requested URL.
+
+        Returns:
+            bool: True if the request should be aborted.
+        """
+        if resource_type == "document":
+            return False
+        if self.allow_urls is not None and self.allow_urls.search(url):
+            return False
+        if resource_type in self.block_types:
+            return True
+        return self.block_urls is not None and self.block_urls.search(url) is not None
+
+    async def handle(self, route):
+        """
+        Playwright route handler that aborts or continues each request.
+
+        Args:
+            route (playwright.async_api.Route): Intercepted request.
+        """
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            self._count_blocked(request.resource_type)
+            await route.abort("blockedbyclient")
+        else:
+            if self.stats is not None:
+                self.stats.inc_value("resource_blocking/allowed_requests")
+            await route.continue_()
+
+    def _count_blocked(self, resource_type):
+        """
+        Add a blocked request to the crawl stats.
+
+        Args:
+            resource_type (str): Playwright resource type of the request.
+        """
+        if self.stats is None:
+            return
+        self.stats.inc_value("resource_blocking/blocked_requests")
+        self.stats.inc_value(f"resource_blocking/blocked/{resource_type}")
+        self.stats.inc_value("resource_blocking/blocked_bytes_estimate",
+                             self.estimated_bytes.get(resource_type, 0))
+
+    async def attach(self, page):
+        """
+        Start intercepting the requests of a page.
+
+        Args:
+            page (playwright.async_api.Page): Page to intercept.
+        """
+        await page.route("**/*", self.handle)
+
+    async def detach(self, page):
+        """
+        Stop intercepting the requests of a page so it can be reused for another domain.
+
+        Args:
+            page (playwright.async_api.Page): Page to release.
+        """
+        await page.unroute("**/*", self.handle)
@@ -1,8 +1,9 @@
 """Scrapy settings file."""
 
 import os
+import json
 from config.app_config import Config
-from models.database import get_db_session
+from models.database import get_engine
 
 BOT_NAME = Config.SCRAPY_PROJECT_NAME
 
@@ -17,27 +18,207 @@ DEFAULT_REQUEST_HEADERS = {
 #Should we be nice and obey it?
 ROBOTSTXT_OBEY = True
 
-FEEDS = {
-    'output.json': {  # This is the output file
-        'format': 'json',  # The format for the data (you can change this to csv, xml, etc.)
-        'encoding': 'utf8',  # Encoding for the output file
-        'store_empty': False,  # Skip empty items
-        'indent': 4,  # Pretty-print the output file with indentation
-    },
+# Seen URLs are kept in a memory-mapped Bloom filter with an exact SQLite fallback. With a
+# JOBDIR (set per schedule by main.py under CRAWL_STATE_DIR) the frontier and the seen store
+# are kept on disk, so an interrupted crawl resumes where it stopped
+DUPEFILTER_CLASS = 'scrapy_project.dupefilter.BloomDupeFilter'
+DUPEFILTER_CAPACITY = int(os.getenv("DUPEFILTER_CAPACITY", 10_000_000))
+DUPEFILTER_ERROR_RATE = float(os.getenv("DUPEFILTER_ERROR_RATE", 0.001))
+CRAWL_STATE_DIR = os.getenv("CRAWL_STATE_DIR", "crawls")
+
+# Links are canonicalised before they are scheduled and stored: fragments, tracking and session
+# parameters (plus the CANONICAL_DROP_PARAMS name patterns) are dropped and parameters sorted, and
+# trailing slashes are ignored when deduplicating. A domain in CANONICAL_PARAM_ALLOWLISTS keeps
+# only the listed parameters, e.g. {"example.ee": ["id", "page"]}
+REQUEST_FINGERPRINTER_CLASS = 'scrapy_project.canonical.CanonicalRequestFingerprinter'
+REQUEST_FINGERPRINTER_IMPLEMENTATION = '2.7'
+CANONICAL_DROP_PARAMS = [name for name in os.getenv("CANONICAL_DROP_PARAMS", "").split(",") if name]
+CANONICAL_PARAM_ALLOWLISTS = json.loads(os.getenv("CANONICAL_PARAM_ALLOWLISTS", "{}"))
+CANONICAL_STRIP_TRAILING_SLASH = (
+    os.getenv("CANONICAL_STRIP_TRAILING_SLASH", "true").lower() == "true")
+
+# Pages are appended to compressed WARC segments per domain in PAGE_STORE_DIR/<domain>/store.
+# Stores whose superseded versions take PAGE_STORE_COMPACT_RATIO of the space are compacted
+# when the crawl closes. New pages are written together once PAGE_STORE_COMMIT_PAGES are buffered
+# or the oldest has waited PAGE_STORE_COMMIT_INTERVAL seconds, and when the crawl closes
+PAGE_STORE_DIR = os.getenv("PAGE_STORE_DIR", "data")
+PAGE_STORE_SEGMENT_SIZE = int(os.getenv("PAGE_STORE_SEGMENT_SIZE", 256 * 1024 * 1024))
+PAGE_STORE_COMPRESSION = os.getenv("PAGE_STORE_COMPRESSION", "gzip")
+PAGE_STORE_COMPACT_RATIO = float(os.getenv("PAGE_STORE_COMPACT_RATIO", 0.5))
+PAGE_STORE_COMMIT_PAGES = int(os.getenv("PAGE_STORE_COMMIT_PAGES", 100))
+PAGE_STORE_COMMIT_INTERVAL = float(os.getenv("PAGE_STORE_COMMIT_INTERVAL", 5.0))
+
+# Crawls are also seeded from the sitemaps listed in robots.txt (or /sitemap.xml), including
+# nested sitemap indexes. Pages whose <lastmod> is older than their last crawl are skipped
+SITEMAP_SEEDING = os.getenv("SITEMAP_SEEDING", "true").lower() == "true"
+
+# Every fetch adapts the recrawl interval of a page to how often its content hash changes,
+# between RECRAWL_MIN_INTERVAL and RECRAWL_MAX_INTERVAL seconds. Crawls are seeded with the due
+# known pages, most often changing and shallowest first; pages that are not due are left for a
+# later crawl, and a schedule is due again when its first page is
+RECRAWL_ADAPTIVE = os.getenv("RECRAWL_ADAPTIVE", "true").lower() == "true"
+RECRAWL_MIN_INTERVAL = float(os.getenv("RECRAWL_MIN_INTERVAL", 3600))
+RECRAWL_MAX_INTERVAL = float(os.getenv("RECRAWL_MAX_INTERVAL", 30 * 86400))
+RECRAWL_INITIAL_INTERVAL = float(os.getenv("RECRAWL_INITIAL_INTERVAL", 86400))
+RECRAWL_BACKOFF = float(os.getenv("RECRAWL_BACKOFF", 1.5))
+RECRAWL_DEPTH_WEIGHT = int(os.getenv("RECRAWL_DEPTH_WEIGHT", 5))
+RECRAWL_NEW_PRIORITY = int(os.getenv("RECRAWL_NEW_PRIORITY", 100))
+
+# Recrawls send If-None-Match/If-Modified-Since from link_metadata; 304 answers and bodies
+# whose hash did not change are neither saved nor re-parsed
+INCREMENTAL_CRAWL = os.getenv("INCREMENTAL_CRAWL", "true").lower() == "true"
+
+DOWNLOADER_MIDDLEWARES = {
+    'scrapy_project.early_abort.EarlyAbortMiddleware': 570,
+    'scrapy_project.middlewares.ConditionalRequestMiddleware': 580,
+    'scrapy_project.throttle.AdaptiveThrottleMiddleware': 860,
 }
 
+# Page downloads are stopped once the headers or the first EARLY_ABORT_SNIFF_BYTES of the body
+# show they would be discarded: another content type, an <html lang> in EARLY_ABORT_LANGUAGES,
+# or a body over the size cap of its content type ("*" for the others). Bytes that were not
+# downloaded are counted in early_abort/bytes_saved. Stopped pages are not link sources, so
+# EARLY_ABORT_LANGUAGES (e.g. "en,ru") is empty by default
+EARLY_ABORT_ENABLED = os.getenv("EARLY_ABORT_ENABLED", "true").lower() == "true"
+EARLY_ABORT_CONTENT_TYPES = os.getenv("EARLY_ABORT_CONTENT_TYPES",
+                                      "text/html,application/xhtml+xml,application/pdf").split(",")
+EARLY_ABORT_LANGUAGES = [
+    language for language in os.getenv("EARLY_ABORT_LANGUAGES", "").split(",") if language]
+EARLY_ABORT_SNIFF_BYTES = int(os.getenv("EARLY_ABORT_SNIFF_BYTES", 4096))
+EARLY_ABORT_MAX_SIZES = json.loads(os.getenv(
+    "EARLY_ABORT_MAX_SIZES", '{"text/html": 10485760, "application/pdf": 52428800}'))
+
+# Pages whose main text (without navigation, footers and template blocks) has a SimHash within
+# NEAR_DUPLICATE_DISTANCE bits of a stored page of the same domain, and shares at least
+# NEAR_DUPLICATE_MIN_SIMILARITY of its word shingles, are not saved or parsed;
+# link_metadata.duplicate_of points to the original. Pages with fewer than
+# NEAR_DUPLICATE_MIN_WORDS words of main text are not compared
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "true").lower() == "true"
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", 3))
+NEAR_DUPLICATE_MIN_WORDS = int(os.getenv("NEAR_DUPLICATE_MIN_WORDS", 50))
+NEAR_DUPLICATE_MIN_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_MIN_SIMILARITY", 0.8))
+
+# Concurrency and delay of every host adapt to its latency, 429/503 answers, Retry-After and
+# download errors, between the floors and ceilings below (the concurrency ceiling and the start
+# default to CONCURRENT_REQUESTS_PER_DOMAIN). Windows with a mean latency under
+# THROTTLE_TARGET_LATENCY seconds are never slow. Decisions are kept in the throttle/* stats
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "true").lower() == "true"
+THROTTLE_MIN_CONCURRENCY = int(os.getenv("THROTTLE_MIN_CONCURRENCY", 1))
+THROTTLE_MIN_DELAY = float(os.getenv("THROTTLE_MIN_DELAY", 0))
+THROTTLE_MAX_DELAY = float(os.getenv("THROTTLE_MAX_DELAY", 60))
+THROTTLE_WINDOW = int(os.getenv("THROTTLE_WINDOW", 10))
+THROTTLE_TARGET_LATENCY = float(os.getenv("THROTTLE_TARGET_LATENCY", 1))
+THROTTLE_LATENCY_TOLERANCE = float(os.getenv("THROTTLE_LATENCY_TOLERANCE", 2))
+
+ITEM_PIPELINES = {
+    'scrapy_project.pipelines.MetadataPipeline': 300,
+}
+
+# Per-stage timing histograms, queue depth and in-flight renders of every running crawl are
+# served in the Prometheus text format on http://<host>:METRICS_PORT/metrics, one server per
+# process, labelled by domain and CRAWL_ID (the schedule id, set per crawl by main.py)
+EXTENSIONS = {
+    'scrapy_project.metrics.MetricsExporter': 500,
+}
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PORT = int(os.getenv("METRICS_PORT", 8000))
+
+# Link metadata is upserted in batches of METADATA_BATCH_SIZE rows or every
+# METADATA_FLUSH_INTERVAL seconds; connection errors are retried with backoff
+METADATA_BATCH_SIZE = int(os.getenv("METADATA_BATCH_SIZE", 500))
+METADATA_FLUSH_INTERVAL = float(os.getenv("METADATA_FLUSH_INTERVAL", 5))
+METADATA_RETRY_TIMES = int(os.getenv("METADATA_RETRY_TIMES", 3))
+METADATA_RETRY_BACKOFF = float(os.getenv("METADATA_RETRY_BACKOFF", 1))
+
+# Playwright runs on the asyncio event loop, so the reactor must be asyncio based
+TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
+
 # Use Playwright with Chromium (you can also use 'firefox' or 'webkit')
 PLAYWRIGHT_BROWSER_TYPE = 'chromium'
 PLAYWRIGHT_LAUNCH_OPTIONS = {"headless": True}
 
-# Set concurrency limits from environment variables or use defaults
+# JS rendering classifier: pages scoring at least the threshold are rendered. While a
+# domain/path prefix is learning, pages are compared static vs rendered (a sample share of
+# statically classified ones too); after MIN_SAMPLES comparisons the outcome is cached and saved
+# in PAGE_STORE_DIR/<domain>/js_classifier.json for later crawls, for MAX_AGE_DAYS
+JS_CLASSIFIER_THRESHOLD = float(os.getenv("JS_CLASSIFIER_THRESHOLD", 0.5))
+JS_CLASSIFIER_PATH_DEPTH = int(os.getenv("JS_CLASSIFIER_PATH_DEPTH", 1))
+JS_CLASSIFIER_MIN_SAMPLES = int(os.getenv("JS_CLASSIFIER_MIN_SAMPLES", 3))
+JS_CLASSIFIER_SAMPLE_RATE = float(os.getenv("JS_CLASSIFIER_SAMPLE_RATE", 0.1))
+JS_CLASSIFIER_MAX_AGE_DAYS = float(os.getenv("JS_CLASSIFIER_MAX_AGE_DAYS", 30))
+
+# Number of pages rendered at the same time, independent of CONCURRENT_REQUESTS, and of pages
+# waiting for a browser. Waiting pages hold scraper memory, which stalls static downloads when
+# it fills, so further pages go back to the scheduler up to RENDER_MAX_DEFERRALS times
+RENDER_CONCURRENCY = int(os.getenv("RENDER_CONCURRENCY", 4))
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", 4))
+RENDER_MAX_DEFERRALS = int(os.getenv("RENDER_MAX_DEFERRALS", 3))
+
+# Wait after navigation until the content has settled: "mutation" (DOM quiet), "scroll"
+# (scroll height stable), "networkidle" or "fixed" (old 5 x 1s scroll loop), capped at
+# RENDER_WAIT_MAX seconds. Per-domain overrides, e.g.
+# {"example.ee": {"strategy": "networkidle", "max_wait": 8}}
+RENDER_WAIT_STRATEGY = os.getenv("RENDER_WAIT_STRATEGY", "mutation")
+RENDER_WAIT_MAX = float(os.getenv("RENDER_WAIT_MAX", 5))
+RENDER_WAIT_QUIET = float(os.getenv("RENDER_WAIT_QUIET", 0.5))
+RENDER_WAIT_DOMAIN_OVERRIDES = json.loads(os.getenv("RENDER_WAIT_DOMAIN_OVERRIDES", "{}"))
+
+# Sub-resources rendered pages never load. Types are Playwright resource types, URL lists
+# are regular expressions; allow rules win over block rules. Per-domain overrides, e.g.
+# {"example.ee": {"allow_types": ["stylesheet"]}}
+RESOURCE_BLOCK_TYPES = os.getenv("RESOURCE_BLOCK_TYPES", "image,font,media,stylesheet").split(",")
+RESOURCE_ALLOW_TYPES = []
+RESOURCE_BLOCK_URLS = [
+    r"google-analytics\.com",
+    r"googletagmanager\.com",
+    r"doubleclick\.net",
+    r"connect\.facebook\.net",
+    r"hotjar\.com",
+    r"cookiebot\.com",
+    r"/gtag/js",
+]
+RESOURCE_ALLOW_URLS = []
+RESOURCE_BLOCK_DOMAIN_OVERRIDES = json.loads(os.getenv("RESOURCE_BLOCK_DOMAIN_OVERRIDES", "{}"))
+# Typical transfer size per blocked resource type, used for the blocked-bytes estimate
+RESOURCE_BLOCK_ESTIMATED_BYTES = {
+    "image": 40_000,
+    "font": 30_000,
+    "media": 500_000,
+    "stylesheet": 15_000,
+    "script": 25_000,
+}
+
+# Browser pool shared by all rendered pages: contexts are reused and recycled after
+# PLAYWRIGHT_POOL_MAX_USES renders or when a page's JS heap exceeds the memory limit (0 = off)
+PLAYWRIGHT_POOL_SIZE = int(os.getenv("PLAYWRIGHT_POOL_SIZE", RENDER_CONCURRENCY))
+PLAYWRIGHT_POOL_BROWSERS = int(os.getenv("PLAYWRIGHT_POOL_BROWSERS", 1))
+PLAYWRIGHT_POOL_MAX_USES = int(os.getenv("PLAYWRIGHT_POOL_MAX_USES", 50))
+PLAYWRIGHT_POOL_MAX_MEMORY_MB = int(os.getenv("PLAYWRIGHT_POOL_MAX_MEMORY_MB", 0))
+
+# Number of schedules main.py crawls at the same time, each with its own spider, and the
+# seconds between checks of the schedule table for newly due schedules
+MAX_CONCURRENT_CRAWLS = int(os.getenv("MAX_CONCURRENT_CRAWLS", 4))
+SCHEDULE_POLL_INTERVAL = float(os.getenv("SCHEDULE_POLL_INTERVAL", 60))
+
+# Workers claim schedules with a lease renewed every LEASE_HEARTBEAT_INTERVAL seconds; the
+# schedules of a worker that stops renewing are reclaimed after LEASE_DURATION seconds
+WORKER_ID = os.getenv("WORKER_ID")
+LEASE_DURATION = int(os.getenv("LEASE_DURATION", 300))
+LEASE_HEARTBEAT_INTERVAL = float(os.getenv("LEASE_HEARTBEAT_INTERVAL", 60))
+
+# Set concurrency limits from environment variables or use defaults (per crawl); with
+# THROTTLE_ENABLED the per-domain limit is the ceiling of the adaptive concurrency
 CONCURRENT_REQUESTS = int(os.getenv("CONCURRENT_REQUESTS", 48))
 CONCURRENT_REQUESTS_PER_DOMAIN = int(os.getenv("CONCURRENT_REQUESTS_PER_DOMAIN", 24))
 CONCURRENT_REQUESTS_PER_IP = int(os.getenv("CONCURRENT_REQUESTS_PER_IP", 24))
+THROTTLE_MAX_CONCURRENCY = int(os.getenv("THROTTLE_MAX_CONCURRENCY",
+                                          CONCURRENT_REQUESTS_PER_DOMAIN))
+THROTTLE_START_CONCURRENCY = int(os.getenv("THROTTLE_START_CONCURRENCY",
+                                            THROTTLE_MAX_CONCURRENCY))
 REACTOR_THREADPOOL_MAXSIZE = int(os.getenv("REACTOR_THREADPOOL_MAXSIZE", 30))
 
 LOG_ENABLED = True  # Ensure logging is enabled
 LOG_LEVEL = 'INFO'  # Set the logging level (e.g., DEBUG, INFO, WARNING, ERROR, CRITICAL)
 LOG_STDOUT = True  # Redirect Scrapy's logs to the terminal (STDOUT)
 
-DB_SESSION_FACTORY = get_db_session
+DB_ENGINE_FACTORY = get_engine
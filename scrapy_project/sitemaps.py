@@ -0,0 +1,110 @@
+"""Streaming reader of XML and text sitemaps and sitemap indexes."""
+
+
+import gzip
+import io
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# A <url> ("url") or <sitemap> ("sitemap") entry with its optional lastmod
+SitemapEntry = namedtuple("SitemapEntry", ["kind", "loc", "lastmod"])
+
+
+def parse_lastmod(value):
+    """
+    Convert a W3C datetime from ``<lastmod>`` to a naive local datetime.
+
+    Crawl times such as ``scraped_at`` are naive local times, so timestamps
+    with an offset are converted to the local time zone; dates and times
+    without one are taken as local already.
+
+    Args:
+        value (str): E.g. "2024-05-01", "2024-05-01T10:00+03:00" or "2024-05-01T07:00:00Z".
+
+    Returns:
+        datetime or None: Parsed timestamp, None if missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _open(body):
+    """
+    Return a file object over a sitemap body, decompressing gzip while it is read.
+
+    Args:
+        body (bytes): Downloaded body.
+
+    Returns:
+        file: Binary file object.
+    """
+    source = io.BytesIO(body)
+    if body[:2] == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=source)
+    return source
+
+
+def _iter_text(source):
+    """
+    Yield the entries of a text sitemap, one URL per line.
+
+    Args:
+        source (file): Binary file object.
+
+    Yields:
+        SitemapEntry: Page entries without lastmod.
+    """
+    for line in source:
+        loc = line.strip().decode("utf-8", "replace")
+        if loc.startswith(("http://", "https://")):
+            yield SitemapEntry("url", loc, None)
+
+
+def iter_sitemap(body):
+    """
+    Yield the entries of a sitemap or sitemap index without building its tree.
+
+    XML is read with ``iterparse`` and every entry is cleared once yielded, so
+    memory stays flat however many URLs the sitemap lists. Gzip compressed and
+    plain text sitemaps are accepted too.
+
+    Args:
+        body (bytes): Downloaded body.
+
+    Yields:
+        SitemapEntry: Page and nested sitemap entries in document order.
+    """
+    source = _open(body)
+    try:
+        head = source.peek(64) if hasattr(source, "peek") else body[:64]
+    except (OSError, EOFError) as e:
+        logger.warning(f"Unreadable sitemap: {e}")
+        return
+    if not head.lstrip().startswith(b"<"):
+        yield from _iter_text(source)
+        return
+    events = etree.iterparse(source, events=("end",), tag=("{*}url", "{*}sitemap"),
+                             resolve_entities=False, no_network=True, huge_tree=True)
+    try:
+        for _, element in events:
+            loc = element.findtext("{*}loc")
+            if loc and loc.strip():
+                yield SitemapEntry(element.tag.rpartition("}")[2], loc.strip(),
+                                   parse_lastmod(element.findtext("{*}lastmod")))
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    except (etree.XMLSyntaxError, OSError, EOFError) as e:
+        logger.warning(f"Sitemap parsing stopped early: {e}")
@@ -1,43 +1,258 @@
 """Main spider class."""
 
 
-import re
 
 import os
 import time
 import asyncio
 from urllib.parse import urljoin, urlparse
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import scrapy
-import base64
-from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright
-from scrapy.utils.project import get_project_settings
-from models.database import LinkMetadata
-from utils.parsing_utils import parse_html_links
+from protego import Protego
+from scrapy_project.canonical import UrlCanonicalizer
+from scrapy_project.items import LinkMetadataItem
+from scrapy import signals
+from scrapy.utils.defer import deferred_to_future
+from twisted.internet import threads
+from scrapy_project.js_classifier import MEMORY_FILE, JsClassifier
+from scrapy_project.metrics import timed
+from scrapy_project.near_duplicates import (NearDuplicateIndex, content_text,
+                                            fingerprint_shingles, resemblance, shingle_hashes,
+                                            to_signed, to_unsigned)
+from scrapy_project.page_state import PageStateStore, hash_content
+from scrapy_project.playwright_pool import BrowserPool
+from scrapy_project.recrawl import RecrawlPolicy
+from scrapy_project.render_wait import SettleWait
+from scrapy_project.resource_blocking import ResourceBlocker
+from scrapy_project.sitemaps import iter_sitemap
+from scrapy_project.url_rules import UrlRules, normalize_host
+from utils.boilerplate import TEMPLATE_FILE, TemplateModel
+from utils.html_document import HtmlDocument
+from utils.page_store import PageStore
 
 
 class Spider(scrapy.Spider):
     """Spider class."""
     name = "example_spider"
 
-    def __init__(self, *args, start_urls=None, **kwargs):
+    def __init__(self, *args, start_urls=None, include_patterns=None, exclude_patterns=None,
+                 **kwargs):
         """
         Initialize the spider.
 
         Args:
             start_urls (list, optional): List of start URLs for the spider.
+            include_patterns (list, optional): Path regular expressions of which a followed
+                link must match one; all links if empty.
+            exclude_patterns (list, optional): Path regular expressions of links that are
+                not followed; the default language and news exclusions if None.
         """
         super().__init__(*args, **kwargs)
         self.start_time = time.time()
         self.start_urls = start_urls or []
-        self.visited_links = set()
-        self.allowed_domains = [self._normalize_domain(urlparse(self.start_urls[0]).netloc)] \
-            if self.start_urls else [
-            ""]
+        # Ports are left out: OffsiteMiddleware ignores allowed domains that carry one
+        self.allowed_domains = [
+            self._normalize_domain(urlparse(self.start_urls[0]).hostname or "")
+        ] if self.start_urls else [""]
         self.output_file = f"{self.allowed_domains[0]}_data.json"
+        self.url_rules = UrlRules(self.allowed_domains[0], include_patterns, exclude_patterns)
+        self.canonicalizer = UrlCanonicalizer()
+        self.recrawl = RecrawlPolicy()
+        self.adaptive_recrawl = False
+        self.postponed = set()
+        self.browser_pool = None
+        self.render_semaphore = None
+        self.renders_in_flight = 0
+        self.renders_waiting = 0
+        self.resource_blockers = {}
+        self.js_classifier = None
+        self.page_state = PageStateStore()
+        self.page_stores = {}
+        self.near_duplicates = {}
+        self.templates = {}
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        """
+        Create the spider and the components that need the crawler.
 
-    def parse(self, response):
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+
+        Returns:
+            Spider: New spider instance.
+        """
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.js_classifier = JsClassifier.from_crawler(crawler)
+        if spider.allowed_domains[0]:
+            spider.js_classifier.load(spider.js_classifier_path())
+        spider.canonicalizer = UrlCanonicalizer.from_settings(crawler.settings)
+        spider.start_urls = [spider.canonicalizer.canonicalize(url) for url in spider.start_urls]
+        spider.recrawl = RecrawlPolicy.from_settings(crawler.settings)
+        spider.adaptive_recrawl = crawler.settings.getbool("RECRAWL_ADAPTIVE", True)
+        crawler.signals.connect(spider.load_page_state, signal=signals.spider_opened)
+        return spider
+
+    def js_classifier_path(self):
+        """
+        Return the file of the rendering decisions learned for the crawled domain.
+
+        Returns:
+            str: PAGE_STORE_DIR/<domain>/js_classifier.json.
+        """
+        return os.path.join(self.settings.get("PAGE_STORE_DIR", "data"), self.allowed_domains[0],
+                            MEMORY_FILE)
+
+    def load_page_state(self, spider):
+        """
+        Load the stored validators and hashes of the crawled domain before the first request.
+
+        Args:
+            spider (scrapy.Spider): Opened spider.
+
+        Returns:
+            twisted.internet.defer.Deferred or None: Fires when the state is loaded.
+        """
+        if not self.settings.getbool("INCREMENTAL_CRAWL", True) or not self.allowed_domains[0]:
+            return None
+        engine = self.settings.get("DB_ENGINE_FACTORY")()
+        return threads.deferToThread(self.page_state.load, engine, self.allowed_domains[0])
+
+    async def closed(self, reason):
+        """
+        Shut down the browser pool and record its statistics.
+
+        Args:
+            reason (str): Reason the spider was closed.
+        """
+        self.js_classifier.summarize()
+        if self.allowed_domains[0]:
+            self.js_classifier.save(self.js_classifier_path())
+        await deferred_to_future(threads.deferToThread(self.close_page_stores))
+        if self.browser_pool is None:
+            return
+        for key, value in self.browser_pool.stats().items():
+            self.crawler.stats.set_value(f"playwright_pool/{key}", value)
+        await self.browser_pool.close()
+
+    def start_requests(self):
+        """
+        Request the start URLs, the robots.txt of the site with SITEMAP_SEEDING and,
+        with RECRAWL_ADAPTIVE, the known pages that are due.
+
+        Yields:
+            scrapy.Request: Start requests.
+        """
+        yield from super().start_requests()
+        if self.start_urls and self.settings.getbool("SITEMAP_SEEDING", True):
+            yield self.sitemap_request(urljoin(self.start_urls[0], "/robots.txt"),
+                                       self.parse_robots)
+        if not self.adaptive_recrawl:
+            return
+        # The page state is loaded by now: start requests are consumed after spider_opened
+        for url, state in self.page_state.due_pages(datetime.now()):
+            if url not in self.start_urls and self.is_valid_url(url):
+                self.crawler.stats.inc_value("recrawl/seeded_due")
+                yield scrapy.Request(url, callback=self.parse,
+                                     priority=self.recrawl.request_priority(state, 0))
+
+    def parse_robots(self, response):
+        """
+        Request the sitemaps listed in robots.txt, or /sitemap.xml if it lists none.
+
+        Args:
+            response (scrapy.http.Response): robots.txt response.
+
+        Yields:
+            scrapy.Request: Sitemap requests.
+        """
+        robots = response.body.decode("utf-8", "replace") if response.status == 200 else ""
+        sitemaps = list(Protego.parse(robots).sitemaps)
+        for sitemap_url in sitemaps or [urljoin(response.url, "/sitemap.xml")]:
+            yield self.sitemap_request(sitemap_url, self.parse_sitemap)
+
+    def parse_sitemap(self, response):
+        """
+        Seed the crawl from a sitemap, following nested sitemap indexes.
+
+        Pages whose ``<lastmod>`` is older than their last crawl are marked as
+        seen instead, so they are not fetched when found as links either.
+
+        Args:
+            response (scrapy.http.Response): Sitemap or sitemap index response.
+
+        Yields:
+            scrapy.Request: Nested sitemap and page requests.
+        """
+        stats = self.crawler.stats
+        if response.status != 200:
+            self.logger.info(f"No sitemap at {response.url} ({response.status})")
+            return
+        stats.inc_value("sitemap/sitemaps")
+        for entry in iter_sitemap(response.body):
+            url = self.canonicalizer.canonicalize(urljoin(response.url, entry.loc))
+            if entry.kind == "sitemap":
+                if normalize_host(urlparse(url).netloc) == self.allowed_domains[0]:
+                    yield self.sitemap_request(url, self.parse_sitemap)
+                continue
+            stats.inc_value("sitemap/urls")
+            if not self.is_valid_url(url):
+                continue
+            if self.page_state.is_fresh(url, entry.lastmod):
+                stats.inc_value("sitemap/skipped_unchanged")
+                self.mark_seen(url)
+                continue
+            # A newer lastmod is a known change; without one the page waits until it is due
+            if entry.lastmod is None and self.is_postponed(url):
+                continue
+            stats.inc_value("sitemap/seeded")
+            yield scrapy.Request(url, callback=self.parse, meta={"raw_url": entry.loc},
+                                 priority=self.recrawl.request_priority(
+                                     self.page_state.get(url), 1))
+
+    def sitemap_request(self, url, callback):
+        """
+        Build the request of a robots.txt or sitemap; a missing file is not an error.
+
+        Args:
+            url (str): URL of the file.
+            callback (callable): Callback handling the response.
+
+        Returns:
+            scrapy.Request: New request.
+        """
+        return scrapy.Request(url, callback=callback, errback=self.sitemap_failed,
+                              meta={"dont_conditional": True, "handle_httpstatus_list": [404]})
+
+    def sitemap_failed(self, failure):
+        """
+        Log a robots.txt or sitemap request that could not be downloaded.
+
+        Args:
+            failure (twisted.python.failure.Failure): Download failure.
+        """
+        self.crawler.stats.inc_value("sitemap/errors")
+        self.logger.warning(f"Sitemap seeding request {failure.request.url} failed: "
+                            f"{failure.getErrorMessage()}")
+
+    def mark_seen(self, url, raw_url=None):
+        """
+        Record a URL in the duplicate filter without requesting it.
+
+        Args:
+            url (str): Canonical URL.
+            raw_url (str, optional): Link the URL was derived from.
+
+        Returns:
+            bool: True if the URL had been seen already.
+        """
+        scheduler = getattr(self.crawler.engine.slot, "scheduler", None)
+        if scheduler is None:
+            return False
+        return scheduler.df.request_seen(scrapy.Request(url, meta={"raw_url": raw_url or url}))
+
+    async def parse(self, response):
         """
         Main parse method to handle the response and process links.
 
@@ -47,150 +262,224 @@ class Spider(scrapy.Spider):
         Yields:
             scrapy.Request: New requests for further crawling.
         """
-        url = response.url
+        url = self.canonicalizer.canonicalize(response.url)
 
         self.logger.info(f"Parsing {url}")
 
+        depth = response.meta.get("depth", 0)
+
+        if response.status == 304:
+            saved = self.load_saved_content(url)
+            if saved is None:
+                # No stored copy to follow the links of: fetch the page again in full
+                self.crawler.stats.inc_value("incremental/not_modified_without_copy")
+                request = response.request.replace(dont_filter=True)
+                request.meta["dont_conditional"] = True
+                for header in ("If-None-Match", "If-Modified-Since"):
+                    request.headers.pop(header, None)
+                yield request
+                return
+            # Not modified: nothing to save, follow the links of the stored copy
+            self.crawler.stats.inc_value("incremental/not_modified")
+            yield self.build_unchanged_item(url, depth)
+            for request in self.follow_links(response, saved):
+                yield request
+            return
+
         # Detect language
         if self.check_for_pdf(response):
             self.save_pdf(response)
             return
         else:
-            language = self.detect_language(response)
+            document = HtmlDocument.from_response(response)
+            canonical = self.resolve_canonical(url, document)
+            if canonical is None:
+                # Not saved, but its links may lead to pages the original does not link
+                for request in self.follow_links(response, document):
+                    yield request
+                return
+            url = canonical
+            response.meta["page_url"] = url
+            with timed(self.crawler.stats, "language_detection"):
+                language = self.detect_language(document)
 
         # Get response metadata
         status_code = response.status
         last_modified = response.headers.get('Last-Modified', b'').decode('utf-8')
+        etag = response.headers.get('ETag', b'').decode('utf-8')
+        content_hash = hash_content(response.body)
+        unchanged = self.page_state.is_unchanged(url, content_hash)
 
-        # Save metadata to database
-        self.save_metadata_to_db(
+        # Save metadata to database through MetadataPipeline
+        metadata = self.build_metadata_item(
             url=url,
             language=language,
             last_modified_at=last_modified,
             status_code=status_code,
+            etag=etag,
+            content_hash=content_hash,
+            changed=not unchanged,
+            depth=depth,
         )
+        if metadata is not None:
+            yield metadata
+
+        saved = self.load_saved_content(url) if unchanged else None
+        if saved is not None:
+            # Same body as last time: skip rendering and saving, follow the stored links
+            self.crawler.stats.inc_value("incremental/unchanged")
+            for request in self.follow_links(response, saved):
+                yield request
+            return
+        # Pages without a stored copy (near-duplicates, a cleared store) are handled as new
 
         # Check if the URL should be skipped based on file types
         if (not url.endswith(".pdf") and not url.endswith(".docx")
                 and not self.check_for_pdf(response)):
-            if self.requires_javascript(response):
-                yield from self.scrape_with_playwright(response)
+            with timed(self.crawler.stats, "js_classification"):
+                decision = self.requires_javascript(url, document)
+            if decision.render:
+                async for request in self.scrape_with_playwright(response, document,
+                                                                 decision.compare):
+                    yield request
             else:
-                yield from self.scrape_with_beautifulsoup(response)
+                for request in self.scrape_static(response, document):
+                    yield request
         else:
-            yield from self.scrape_with_beautifulsoup(response)
+            for request in self.scrape_static(response, document):
+                yield request
 
     def save_pdf(self, response):
         """
-        Save PDF file from the response using the same logic as HTML files.
+        Save PDF file from the response in the page store of its domain.
         Args:
             response (scrapy.http.Response): Response object from the request.
         """
-        url = response.url
-        folder_name = self._normalize_domain(urlparse(url).netloc)
-        encoded_file_name = self.encode_url(urlparse(url).path) + ".pdf"  # Encode URL for filename
+        url = self.page_url(response)
+        with timed(self.crawler.stats, "save"):
+            self.get_page_store(url).put(url, response.body, "application/pdf")
 
-        current_directory = os.getcwd()
-        folder_path = os.path.join(current_directory, "data", folder_name)
+        self.logger.info(f"Saved PDF file: {url}")
 
-
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-
-        file_path = os.path.join(folder_path, encoded_file_name)
-
-        with open(file_path, 'wb') as file:
-            file.write(response.body)  # Save raw PDF content as bytes
-
-        self.logger.info(f"Saved PDF file: {file_path}")
-
-    def save_metadata_to_db(self, url, language, last_modified_at, status_code):
+    def build_metadata_item(self, url, language, last_modified_at, status_code, etag=None,
+                            content_hash=None, changed=True, depth=0):
         """
-        Save link metadata to the database, updating it if it already exists.
+        Build the link metadata item of a page.
 
         Args:
             url (str): The URL of the page.
             language (str): Detected language of the page.
-            last_modified_at (str): Last modified timestamp of the page.
+            last_modified_at (str): Value of the Last-Modified header.
             status_code (int): HTTP status code of the response.
+            etag (str, optional): Value of the ETag header.
+            content_hash (str, optional): Hash of the response body.
+            changed (bool): False if the body is the same as on the last crawl.
+            depth (int): Link depth of the page in the crawl.
+
+        Returns:
+            LinkMetadataItem or None: Item to save, None if the page is skipped.
         """
         # Only save metadata if the language is "et" or "unknown"
         if language not in ("et", "unknown"):
             self.logger.info(f"Skipping metadata save for URL: {url} due to language: {language}")
-            return
+            return None
 
-        session_factory = get_project_settings().get("DB_SESSION_FACTORY")
-        if session_factory is None:
-            self.logger.error("DB_SESSION_FACTORY is not configured in settings.")
-            return
+        item = LinkMetadataItem(
+            url=url,
+            domain=self._normalize_domain(urlparse(url).hostname or ""),
+            language=language,
+            last_modified_at=self.parse_http_date(last_modified_at),
+            etag=etag or None,
+            content_hash=content_hash,
+            status_code=status_code,
+            scraped_at=datetime.now(),
+        )
+        if changed:
+            item["content_changed_at"] = item["scraped_at"]
+        item.update(self.recrawl.update(self.page_state.get(url), changed, item["scraped_at"],
+                                        depth))
+        return item
 
-        session = session_factory()  # Dynamically fetch the session
+    def build_unchanged_item(self, url, depth=0):
+        """
+        Build the metadata item of a page that has not changed since the last crawl.
+
+        Args:
+            url (str): The URL of the page.
+            depth (int): Link depth of the page in the crawl.
+
+        Returns:
+            LinkMetadataItem: Item that only refreshes the scrape timestamp and the
+            recrawl schedule.
+        """
+        item = LinkMetadataItem(
+            url=url,
+            domain=self._normalize_domain(urlparse(url).hostname or ""),
+            scraped_at=datetime.now(),
+        )
+        item.update(self.recrawl.update(self.page_state.get(url), False, item["scraped_at"],
+                                        depth))
+        return item
+
+    def parse_http_date(self, value):
+        """
+        Convert an HTTP date header to a naive UTC datetime.
+
+        Args:
+            value (str): Header value, e.g. "Wed, 21 Oct 2015 07:28:00 GMT".
+
+        Returns:
+            datetime or None: Parsed timestamp, None if missing or invalid.
+        """
+        if not value:
+            return None
         try:
-            # Check if the metadata already exists based on the unique URL
-            existing_metadata = session.query(LinkMetadata).filter_by(url=url).first()
-            if existing_metadata:
-                # Update the existing record
-                existing_metadata.language = language
-                existing_metadata.last_modified_at = last_modified_at or None
-                existing_metadata.status_code = status_code
-                existing_metadata.scraped_at = datetime.now()  # Update the scraped timestamp
-                self.logger.info(f"Updated metadata for URL: {url}")
-            else:
-                # Insert a new record
-                metadata = LinkMetadata(
-                    url=url,
-                    language=language,
-                    last_modified_at=last_modified_at or None,
-                    status_code=status_code,
-                    scraped_at=datetime.now(),  # Add the current UTC time
-                )
-                session.add(metadata)
-                self.logger.info(f"Saved metadata for URL: {url}")
-
-            session.commit()
-        except Exception as e:
-            session.rollback()
-            self.logger.error(f"Failed to save metadata for URL: {url}, Error: {e}")
-        finally:
-            session.close()
+            parsed = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
 
-    def detect_language(self, response):
+    def detect_language(self, document):
         """
-        Detect the language of the response content.
+        Detect the language of the page from its ``<html lang>`` attribute.
 
         Args:
-            response (scrapy.http.Response): Response object from the request.
+            document (HtmlDocument): Parsed page.
 
         Returns:
             str: Detected language code (e.g., "en", "et", or "unknown").
         """
-        # Look for the language in the HTML content
-        soup = BeautifulSoup(response.text, "html.parser")
-        html_tag = soup.find("html")
-        if html_tag and html_tag.get("lang"):
-            return html_tag["lang"].split("-")[0]
-
-        # Return unknown if no language is detected
-        return "unknown"
+        return document.lang
 
-    def requires_javascript(self, response):
+    def requires_javascript(self, url, document):
         """
         Determine if a page requires JavaScript rendering.
 
         Args:
-            response (scrapy.http.Response): Response object from the request.
+            url (str): URL of the page.
+            document (HtmlDocument): Parsed page.
 
         Returns:
-            bool: True if JavaScript rendering is needed, False otherwise.
-        """
-        content = response.text.lower()
-        js_frameworks = ["react", "angular", "vue", "next.js", "svelte"]
-        if any(framework in content for framework in js_frameworks):
-            return True
-        dynamic_indicators = ["<script", "spinner", "loading", "aria-busy"]
-        if any(indicator in content for indicator in dynamic_indicators):
-            return True
-        return False
+            RenderDecision: Whether to render and whether to compare with the static page.
+        """
+        return self.js_classifier.classify(url, document)
+
+    def get_browser_pool(self):
+        """
+        Return the shared browser pool, creating it on first use.
+
+        The pool runs on the event loop of the asyncio reactor, so browsers and
+        contexts survive between pages and renders never block the reactor.
+
+        Returns:
+            BrowserPool: Pool shared by all rendered pages of this crawl.
+        """
+        if self.browser_pool is None:
+            self.browser_pool = BrowserPool.from_settings(self.settings)
+            self.render_semaphore = asyncio.Semaphore(self.settings.getint("RENDER_CONCURRENCY", 4))
+        return self.browser_pool
 
     async def scrape_with_playwright_async(self, url):
         """
@@ -202,75 +491,232 @@ class Spider(scrapy.Spider):
         Returns:
             str: Rendered HTML content of the page.
         """
-        async with async_playwright() as playwright:
-            browser = await playwright.chromium.launch(headless=True)
-            page = await browser.new_page()
+        domain = self._normalize_domain(urlparse(url).hostname or "")
+        blocker = self.get_resource_blocker(domain)
+        pool = self.get_browser_pool()
+        slot = await pool.acquire()
+        failed = True
+        try:
+            page = slot.page
+            await blocker.attach(page)
             await page.goto(url, wait_until="domcontentloaded")
 
-            # Scroll and wait for content to load
-            for _ in range(5):
-                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                await asyncio.sleep(1)  # Use asyncio-compatible sleep
+            # Wait until the content has settled, capped per domain
+            settle_wait = SettleWait.from_settings(self.settings, domain)
+            waited = await settle_wait.wait(page)
+            self.record_render_wait(url, settle_wait, waited)
 
             # Extract content after rendering
             content = await page.content()
-            await browser.close()
+            await blocker.detach(page)
+            failed = False
             return content  # Return the rendered content
+        finally:
+            await pool.release(slot, failed=failed)
+
+    def get_resource_blocker(self, domain):
+        """
+        Return the sub-resource blocker of a domain, building it on first use.
 
-    def scrape_with_playwright(self, response):
+        Args:
+            domain (str): Normalized domain of the rendered page.
+
+        Returns:
+            ResourceBlocker: Blocker with the domain's allow and deny lists.
         """
-        Wrapper for asynchronous Playwright scraping to integrate with Scrapy.
+        if domain not in self.resource_blockers:
+            self.resource_blockers[domain] = ResourceBlocker.from_settings(
+                self.settings, domain, stats=self.crawler.stats)
+        return self.resource_blockers[domain]
+
+    def record_render_wait(self, url, settle_wait, waited):
+        """
+        Log the wait of a rendered page and add it to the crawl stats.
+
+        Args:
+            url (str): Rendered URL.
+            settle_wait (SettleWait): Wait strategy that was used.
+            waited (float): Seconds spent waiting for the content to settle.
+        """
+        self.logger.info(f"Content of {url} settled after {waited:.2f}s ({settle_wait.strategy})")
+        stats = self.crawler.stats
+        stats.inc_value("render_wait/pages")
+        stats.inc_value("render_wait/seconds", waited)
+        # The old fixed scroll loop always waited five seconds
+        stats.inc_value("render_wait/saved_seconds", max(0.0, 5.0 - waited))
+        stats.max_value("render_wait/max_seconds", waited)
+
+    async def scrape_with_playwright(self, response, static_document, compare=False):
+        """
+        Render the page with Playwright without blocking other downloads.
+
+        At most RENDER_CONCURRENCY pages render at once and RENDER_QUEUE_SIZE more
+        wait for a browser. A waiting response still counts against the scraper
+        slot, and a full slot stops the downloader, so responses beyond the queue
+        are sent back to the scheduler with a lower priority instead of waiting;
+        after RENDER_MAX_DEFERRALS returns a page waits like the others. If the
+        render fails, the static page is saved and followed instead.
 
         Args:
             response (scrapy.http.Response): Response object from the request.
+            static_document (HtmlDocument): Static page, already parsed.
+            compare (bool): Compare the rendered page with the static page, so the
+                JS classifier can learn.
 
         Yields:
             scrapy.Request: New requests for further crawling.
         """
         url = response.url
-        content = asyncio.run(self.scrape_with_playwright_async(url))
-        self.save_content(content, response)
+        self.get_browser_pool()
+        deferrals = response.meta.get("render_deferrals", 0)
+        capacity = (self.settings.getint("RENDER_CONCURRENCY", 4)
+                    + self.settings.getint("RENDER_QUEUE_SIZE", 4))
+        if (self.renders_in_flight + self.renders_waiting >= capacity
+                and deferrals < self.settings.getint("RENDER_MAX_DEFERRALS", 3)):
+            self.crawler.stats.inc_value("render/deferred")
+            request = response.request.replace(dont_filter=True,
+                                               priority=response.request.priority - 1)
+            request.meta["render_deferrals"] = deferrals + 1
+            yield request
+            return
+        self.renders_waiting += 1
+        try:
+            await self.render_semaphore.acquire()
+        finally:
+            self.renders_waiting -= 1
+        self.renders_in_flight += 1
+        try:
+            with timed(self.crawler.stats, "render"):
+                content = await self.scrape_with_playwright_async(url)
+        except Exception as e:
+            self.logger.warning(f"Rendering {url} failed, keeping the static page: {e}")
+            self.crawler.stats.inc_value("render/failed")
+            content = None
+        finally:
+            self.renders_in_flight -= 1
+            self.render_semaphore.release()
+        if content is None:
+            for request in self.scrape_static(response, static_document):
+                yield request
+            return
+        rendered = HtmlDocument(content)
+        if compare:
+            self.js_classifier.record(url, static_document, rendered)
+        item = self.save_content(rendered, response)
+        if item is not None:
+            yield item
         # Extract links dynamically for further crawling
-        links = parse_html_links(content)
+        for request in self.follow_links(response, rendered):
+            yield request
 
-        for link in links:
-            full_link = urljoin(url, link)
-            if self.is_valid_url(full_link):
-                yield response.follow(full_link, self.parse)
+    def scrape_static(self, response, document):
+        """
+        Save a static page and follow its links.
 
-    def scrape_with_beautifulsoup(self, response):
+        Args:
+            response (scrapy.http.Response): Response object from the request.
+            document (HtmlDocument): Parsed page.
+
+        Yields:
+            scrapy.Request: New requests for further crawling.
+        """
+        item = self.save_content(document, response)
+        if item is not None:
+            yield item
+        yield from self.follow_links(response, document)
+
+    def follow_links(self, response, document):
         """
-        Scrape static pages using BeautifulSoup.
+        Follow the valid links of a page.
 
         Args:
             response (scrapy.http.Response): Response object from the request.
+            document (HtmlDocument): Parsed page whose links are followed.
 
         Yields:
             scrapy.Request: New requests for further crawling.
         """
-        soup = BeautifulSoup(response.body, "html.parser")
-        self.save_content(soup.prettify(), response)
-        links = parse_html_links(response.body)
+        links = document.links
+        depth = response.meta.get("depth", 0) + 1
 
         # Filter and follow valid links for further scraping
         self.logger.info(f"Found {len(links)} links on {response.url}")
         for link in links:
             full_link = urljoin(response.url, link)
-            if self.is_valid_url(full_link):
-                yield response.follow(full_link, self.parse)
+            url = self.canonicalizer.canonicalize(full_link)
+            if self.is_valid_url(url) and not self.is_postponed(url):
+                if url != full_link:
+                    self.crawler.stats.inc_value("canonical/links_rewritten")
+                # The dupefilter counts the duplicates that canonicalisation avoided
+                yield response.follow(url, self.parse, meta={"raw_url": full_link},
+                                      priority=self.recrawl.request_priority(
+                                          self.page_state.get(url), depth))
 
-    def save_content(self, content, response):
+    def is_postponed(self, url):
         """
-        Save page content to a file.
+        Check whether a known page is left for a later crawl because it is not due yet.
 
         Args:
-            content (str): Content of the page.
+            url (str): Canonical URL.
+
+        Returns:
+            bool: True if RECRAWL_ADAPTIVE is on and the page is not due.
+        """
+        if not self.adaptive_recrawl or self.page_state.is_due(url, datetime.now()):
+            return False
+        if url not in self.postponed:
+            self.postponed.add(url)
+            self.crawler.stats.inc_value("recrawl/postponed")
+        return True
+
+    def resolve_canonical(self, url, document):
+        """
+        Apply the ``<link rel="canonical">`` of a page.
+
+        A page declaring another followed URL of the domain as canonical is
+        stored under that URL, which is marked as seen so that it is not
+        fetched again. If the canonical URL was fetched already, the page is a
+        duplicate and is not saved; its links are still followed.
+
+        Args:
+            url (str): Canonical form of the fetched URL.
+            document (HtmlDocument): Parsed page.
+
+        Returns:
+            str or None: URL to store the page under, None if the page is a duplicate.
+        """
+        if not document.canonical_url:
+            return url
+        declared = self.canonicalizer.canonicalize(urljoin(url, document.canonical_url))
+        if (not self.is_valid_url(declared)
+                or self.canonicalizer.key(declared) == self.canonicalizer.key(url)):
+            return url
+        if self.mark_seen(declared, raw_url=url):
+            self.logger.info(f"Skipping {url}: duplicate of its canonical URL {declared}")
+            self.crawler.stats.inc_value("canonical/rel_canonical_duplicates")
+            return None
+        self.crawler.stats.inc_value("canonical/rel_canonical_pages")
+        return declared
+
+    def save_content(self, document, response):
+        """
+        Save page content in the page store of its domain.
+
+        Near-duplicates of a page that is already stored are not saved, so
+        they are not parsed either.
+
+        Args:
+            document (HtmlDocument): Parsed page; its source is saved as downloaded.
             response (scrapy.http.Response): Response object from the request.
+
+        Returns:
+            LinkMetadataItem or None: Item recording the text fingerprint of the page
+            and the page it duplicates, None if there is nothing to record.
         """
-        url = response.url
+        url = self.page_url(response)
+        item = None
 
         if not self.ignore_xml(url):
-            folder_name = self._normalize_domain(urlparse(url).netloc)
             parsed_link = urlparse(url)
             output_file = ""
 
@@ -280,46 +726,196 @@ class Spider(scrapy.Spider):
                 output_file = parsed_link.path + ".docx"
             elif url.endswith(".doc"):
                 output_file = parsed_link.path + ".doc"
-            elif not self.ignore_language(content):
-                output_file = parsed_link.path  # No encoding yet
-                encoded_file_name = self.encode_url(output_file) + ".html"  # Apply encoding once
-                self.create_folder_and_file(folder_name, encoded_file_name, content)
+            elif not self.ignore_language(document):
+                output_file = url
+                item = self.fingerprint_page(url, document)
+                if item is not None and item["duplicate_of"]:
+                    self.logger.info(f"Skipping {url}: near-duplicate of {item['duplicate_of']}")
+                    return item
+                with timed(self.crawler.stats, "save"):
+                    self.get_page_store(url).put(url, document.html)
 
             self.logger.info(f"Saved file: {output_file}")
+        return item
+
+    def fingerprint_page(self, url, document):
+        """
+        Fingerprint the main text of a page and look for a near-identical page of its domain.
+
+        The first page with a given text is the original and is indexed; a later
+        page within NEAR_DUPLICATE_DISTANCE bits of it is its duplicate when at
+        least NEAR_DUPLICATE_MIN_SIMILARITY of their shingles are the same.
+        Navigation, footers and the template blocks of the domain are left out,
+        so pages sharing only their boilerplate are not duplicates. Pages with
+        fewer than NEAR_DUPLICATE_MIN_WORDS words of main text are not compared.
+
+        Args:
+            url (str): URL the page is stored under.
+            document (HtmlDocument): Parsed page.
+
+        Returns:
+            LinkMetadataItem or None: Item with the fingerprint and the URL of the
+            original (None for originals), None if the page is not compared.
+        """
+        if not self.settings.getbool("NEAR_DUPLICATE_ENABLED", True):
+            return None
+        domain = self._normalize_domain(urlparse(url).hostname or "")
+        index = self.get_near_duplicate_index(domain)
+        stats = self.crawler.stats
+        original = None
+        with timed(stats, "near_duplicate"):
+            shingles = self.page_shingles(domain, document)
+            fingerprint = fingerprint_shingles(shingles) if shingles is not None else None
+            if fingerprint is not None:
+                original = self.confirm_near_duplicate(
+                    domain, shingles, index.candidates(fingerprint, exclude=url))
+        state = self.page_state.get(url)
+        if fingerprint is None:
+            index.remove(url)
+            # Clear the fingerprint of a page that lost its text since the last crawl
+            if state is not None and state.simhash is not None:
+                return LinkMetadataItem(url=url, domain=domain, simhash=None, duplicate_of=None)
+            return None
+        stats.inc_value("near_duplicate/fingerprinted")
+        if original is None:
+            index.add(url, fingerprint)
+        else:
+            index.remove(url)
+            stats.inc_value("near_duplicate/duplicates")
+        return LinkMetadataItem(url=url, domain=domain, simhash=to_signed(fingerprint),
+                                duplicate_of=original)
 
-    def create_folder_and_file(self, folder_name, file_name, file_content):
+    def page_shingles(self, domain, document):
         """
-        Create a folder and save content to a file.
+        Hash the shingles of the main text of a page.
 
         Args:
-            folder_name (str): Name of the folder.
-            file_name (str): Name of the file.
-            file_content (str): Content to save in the file.
+            domain (str): Normalized domain of the page.
+            document (HtmlDocument): Parsed page.
+
+        Returns:
+            set or None: Shingle hashes, None if the page has too few words.
+        """
+        return shingle_hashes(content_text(document.tree, self.get_template(domain)),
+                              self.settings.getint("NEAR_DUPLICATE_MIN_WORDS", 50))
+
+    def confirm_near_duplicate(self, domain, shingles, candidates):
+        """
+        Return the first candidate original whose stored copy shares enough shingles.
+
+        Candidates without a stored copy cannot be originals and are dropped
+        from the index.
+
+        Args:
+            domain (str): Normalized domain of the page.
+            shingles (set): Shingle hashes of the page.
+            candidates (list): URLs of the indexed pages with a near fingerprint.
+
+        Returns:
+            str or None: URL of the original, None if no candidate is confirmed.
+        """
+        min_similarity = self.settings.getfloat("NEAR_DUPLICATE_MIN_SIMILARITY", 0.8)
+        for candidate in candidates:
+            saved = self.load_saved_content(candidate)
+            if saved is None:
+                self.near_duplicates[domain].remove(candidate)
+                continue
+            other = self.page_shingles(domain, saved)
+            if other is not None and resemblance(shingles, other) >= min_similarity:
+                return candidate
+            self.crawler.stats.inc_value("near_duplicate/rejected")
+        return None
+
+    def get_near_duplicate_index(self, domain):
+        """
+        Return the near-duplicate index of a domain, building it on first use.
+
+        The index starts with the stored fingerprints of the original pages, so
+        copies are recognised across crawls.
+
+        Args:
+            domain (str): Normalized domain.
+
+        Returns:
+            NearDuplicateIndex: Index of the original pages of the domain.
         """
-        current_directory = os.getcwd()
-        folder_path = os.path.join(current_directory, "data", folder_name)
+        index = self.near_duplicates.get(domain)
+        if index is None:
+            index = self.near_duplicates[domain] = NearDuplicateIndex(
+                self.settings.getint("NEAR_DUPLICATE_DISTANCE", 3))
+            for url, fingerprint in self.page_state.fingerprints():
+                if self._normalize_domain(urlparse(url).hostname or "") == domain:
+                    index.add(url, to_unsigned(fingerprint))
+        return index
 
+    def get_template(self, domain):
+        """
+        Return the template learned by ``parse_raw_data.py`` for a domain, loading it once.
+
+        Args:
+            domain (str): Normalized domain.
 
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
+        Returns:
+            TemplateModel or None: Template, None if the domain has none yet.
+        """
+        if domain not in self.templates:
+            self.templates[domain] = TemplateModel.load(
+                os.path.join(self.settings.get("PAGE_STORE_DIR", "data"), domain, TEMPLATE_FILE))
+        return self.templates[domain]
+
+    def page_url(self, response):
+        """
+        Return the URL a page is stored under.
 
-        file_path = os.path.join(folder_path, file_name)
+        Args:
+            response (scrapy.http.Response): Response object from the request.
 
-        with open(file_path, 'w', encoding="utf-8") as file:
-            file.write(file_content)
+        Returns:
+            str: Declared canonical URL of the page, else the canonical form of its URL.
+        """
+        return response.meta.get("page_url") or self.canonicalizer.canonicalize(response.url)
 
-    def encode_url(self, url):
+    def load_saved_content(self, url):
         """
-        Encodes the URL in base64 format for safe file storage.
+        Load the copy of a page saved by ``save_content`` on an earlier crawl.
 
         Args:
-            url (str): The original URL.
+            url (str): The URL of the page.
 
         Returns:
-            str: Base64 encoded string without padding (=).
+            HtmlDocument or None: Saved page, None if no copy exists.
+        """
+        body = self.get_page_store(url).get(url)
+        return HtmlDocument(body) if body is not None else None
+
+    def get_page_store(self, url):
         """
-        encoded = base64.urlsafe_b64encode(url.encode()).decode()
-        return encoded.rstrip("=")  # Remove padding characters to keep it clean
+        Return the page store of the domain of a URL, opening it on first use.
+
+        Args:
+            url (str): Page URL.
+
+        Returns:
+            PageStore: Store in PAGE_STORE_DIR/<domain>/store.
+        """
+        domain = self._normalize_domain(urlparse(url).hostname or "")
+        store = self.page_stores.get(domain)
+        if store is None:
+            store = self.page_stores[domain] = PageStore.for_domain(
+                self.settings.get("PAGE_STORE_DIR", "data"), domain, self.settings)
+        return store
+
+    def close_page_stores(self):
+        """Close the page stores, compacting those with many superseded versions."""
+        compact_ratio = self.settings.getfloat("PAGE_STORE_COMPACT_RATIO", 0.5)
+        for domain, store in self.page_stores.items():
+            try:
+                if store.garbage_ratio() >= compact_ratio:
+                    self.crawler.stats.inc_value("page_store/bytes_reclaimed", store.compact())
+            except OSError as e:
+                self.logger.error(f"Failed to compact the page store of {domain}: {e}")
+            store.close()
+        self.page_stores = {}
 
     def _normalize_domain(self, domain):
         """
@@ -331,23 +927,19 @@ class Spider(scrapy.Spider):
         Returns:
             str: Normalized domain name.
         """
-        return domain.lower().lstrip("www.").rstrip("/")
+        return normalize_host(domain)
 
-    def ignore_language(self, content):
+    def ignore_language(self, document):
         """
         Check if the page should be ignored based on its language.
 
         Args:
-            content (str): HTML content of the page.
+            document (HtmlDocument): Parsed page.
 
         Returns:
             bool: True if the language is to be ignored, False otherwise.
         """
-        if 'lang="et"' in content:
-            return False
-        if 'lang="en"' in content or 'lang="ru"' in content or 'lang="en-US"' in content:
-            return True
-        return False
+        return document.lang in ("en", "ru")
 
     def ignore_xml(self, url):
         """
@@ -371,22 +963,7 @@ class Spider(scrapy.Spider):
         Returns:
             bool: True if the URL is valid, False otherwise.
         """
-        parsed = urlparse(url)
-
-        # Matches '/ru/' or '/en/' in the URL path
-        language_pattern = re.compile(r"/(?:ru|en)/")
-        # Matches 'uudised' or 'uudis' or 'news' anywhere in the path
-        news_pattern = re.compile(r"uudis(ed)?|news")
-
-        # Check if the URL path matches any of the patterns
-        if language_pattern.search(parsed.path.lower()) or news_pattern.search(parsed.path.lower()):
-            return False
-
-        if (parsed.scheme not in ('http', 'https')
-                or self._normalize_domain(parsed.netloc) != self.allowed_domains[0]):
-            return False
-
-        return True
+        return self.url_rules.allows(url)
 
     def check_for_pdf(self, response):
         """
@@ -0,0 +1,327 @@
+"""Per-domain concurrency and delay adapted to the latency and rate limiting of each site."""
+
+
+import logging
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from scrapy.exceptions import IgnoreRequest, NotConfigured, StopDownload
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_STATUSES = (429, 503)
+
+
+def parse_retry_after(value, now=None):
+    """
+    Convert a Retry-After header to seconds.
+
+    Args:
+        value (bytes or str): Delay in seconds or an HTTP date.
+        now (datetime, optional): Current UTC time, for HTTP dates.
+
+    Returns:
+        float or None: Seconds to wait, None if missing or invalid.
+    """
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode("latin-1")
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        until = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=timezone.utc)
+    return max(0.0, (until - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+class SlotState:
+    """Current decisions and the open measurement window of one downloader slot."""
+
+    def __init__(self, concurrency, delay):
+        """
+        Initialize the state.
+
+        Args:
+            concurrency (int): Allowed parallel requests.
+            delay (float): Seconds between requests.
+        """
+        self.concurrency = concurrency
+        self.delay = delay
+        self.baseline = None
+        self.latency_sum = 0.0
+        self.responses = 0
+        self.decreased_at = 0.0
+        self.paused_until = 0.0
+
+    def slot_delay(self, now):
+        """
+        Return the delay to set on the downloader slot.
+
+        Args:
+            now (float): Monotonic time.
+
+        Returns:
+            float: The delay, or the rest of a Retry-After pause if longer.
+        """
+        return max(self.delay, self.paused_until - now)
+
+
+class AdaptiveThrottleMiddleware:
+    """
+    Adapt the concurrency and delay of every downloader slot (one per host).
+
+    Slots start at THROTTLE_START_CONCURRENCY, by default the ceiling.
+    Responses are measured in windows of THROTTLE_WINDOW. A window is slow
+    when its mean latency is above THROTTLE_TARGET_LATENCY and above
+    THROTTLE_LATENCY_TOLERANCE times the lowest mean seen on the slot, so
+    jitter on a fast host is not mistaken for overload. A slow window removes
+    one concurrent request; any other window first removes delay, then
+    doubles the concurrency. A 429 or 503 answer or a download error halves
+    the concurrency at once, at most once per THROTTLE_COOLDOWN seconds. At
+    the concurrency floor, backing off doubles the delay between requests
+    instead; latency alone never adds delay. A Retry-After header pauses the
+    slot for as long as asked. Both values stay between their configured
+    floors and ceilings, and the current decisions of every slot are kept in
+    the crawl stats.
+    """
+
+    def __init__(self, crawler, min_concurrency=1, max_concurrency=24, start_concurrency=None,
+                 min_delay=0.0, max_delay=60.0, backoff_delay=1.0, window=10,
+                 target_latency=1.0, latency_tolerance=2.0, cooldown=5.0):
+        """
+        Initialize the middleware.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+            min_concurrency (int): Concurrency floor.
+            max_concurrency (int): Concurrency ceiling.
+            start_concurrency (int, optional): Concurrency of a new slot; the ceiling if None.
+            min_delay (float): Delay floor, in seconds.
+            max_delay (float): Delay ceiling, in seconds.
+            backoff_delay (float): First delay of a slot that backs off at the concurrency floor.
+            window (int): Responses per latency measurement.
+            target_latency (float): Mean latency in seconds below which a window is never slow.
+            latency_tolerance (float): Mean latency, relative to the slot's best, above
+                which a window is slow.
+            cooldown (float): Minimum seconds between two backoffs of a slot.
+        """
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        if start_concurrency is None:
+            start_concurrency = self.max_concurrency
+        self.start_concurrency = min(max(start_concurrency, min_concurrency),
+                                     self.max_concurrency)
+        self.min_delay = min_delay
+        self.max_delay = max(max_delay, min_delay)
+        self.backoff_delay = backoff_delay
+        self.window = window
+        self.target_latency = target_latency
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.states = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Create the middleware from the crawler settings.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Running crawler.
+
+        Returns:
+            AdaptiveThrottleMiddleware: New middleware.
+        """
+        settings = crawler.settings
+        if not settings.getbool("THROTTLE_ENABLED", True):
+            raise NotConfigured
+        max_concurrency = settings.getint("THROTTLE_MAX_CONCURRENCY",
+                                          settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN"))
+        return cls(
+            crawler,
+            min_concurrency=settings.getint("THROTTLE_MIN_CONCURRENCY", 1),
+            max_concurrency=max_concurrency,
+            start_concurrency=settings.getint("THROTTLE_START_CONCURRENCY", max_concurrency),
+            min_delay=settings.getfloat("THROTTLE_MIN_DELAY", settings.getfloat("DOWNLOAD_DELAY")),
+            max_delay=settings.getfloat("THROTTLE_MAX_DELAY", 60),
+            backoff_delay=settings.getfloat("THROTTLE_BACKOFF_DELAY", 1),
+            window=settings.getint("THROTTLE_WINDOW", 10),
+            target_latency=settings.getfloat("THROTTLE_TARGET_LATENCY", 1),
+            latency_tolerance=settings.getfloat("THROTTLE_LATENCY_TOLERANCE", 2),
+            cooldown=settings.getfloat("THROTTLE_COOLDOWN", 5),
+        )
+
+    def process_response(self, request, response, spider):
+        """
+        Measure a response and adapt its slot.
+
+        The downloader names the slot of every request in its ``download_slot``
+        meta key. A slot is measured from its first response; the downloader
+        drops slots after a minute of idleness, so a recreated slot gets the
+        decisions back with its next response.
+
+        Args:
+            request (scrapy.Request): Downloaded request.
+            response (scrapy.http.Response): Its response.
+            spider (scrapy.Spider): Running spider.
+
+        Returns:
+            scrapy.http.Response: The response, unchanged.
+        """
+        key = request.meta.get("download_slot")
+        if key is None:
+            return response
+        state = self.state(key)
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            retry_after = min(retry_after, self.max_delay)
+            state.paused_until = max(state.paused_until, time.monotonic() + retry_after)
+            self.stats.inc_value("throttle/retry_after_seconds", retry_after)
+            self.apply(key, state)
+        if response.status in RATE_LIMIT_STATUSES:
+            self.stats.inc_value("throttle/rate_limited")
+            self.back_off(key, state)
+            return response
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            state.latency_sum += latency
+            state.responses += 1
+            if state.responses >= self.window:
+                self.close_window(key, state)
+                return response
+        self.sync(key, state)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        """
+        Back off the slot of a request that failed to download, e.g. on a timeout.
+
+        Args:
+            request (scrapy.Request): Failed request.
+            exception (Exception): Download error.
+            spider (scrapy.Spider): Running spider.
+        """
+        key = request.meta.get("download_slot")
+        # Downloads stopped or dropped on purpose say nothing about the server
+        if key is not None and not isinstance(exception, (StopDownload, IgnoreRequest)):
+            self.stats.inc_value("throttle/download_errors")
+            self.back_off(key, self.state(key))
+
+    def state(self, key):
+        """
+        Return the state of a slot, starting it on its first response.
+
+        Args:
+            key (str): Slot key.
+
+        Returns:
+            SlotState: State of the slot.
+        """
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = SlotState(self.start_concurrency, self.min_delay)
+            self.record(key, state)
+        return state
+
+    def back_off(self, key, state):
+        """
+        Halve the concurrency of an overloaded slot, or double its delay at the floor.
+
+        Args:
+            key (str): Slot key.
+            state (SlotState): State of the slot.
+        """
+        now = time.monotonic()
+        if now - state.decreased_at >= self.cooldown:
+            state.decreased_at = now
+            if state.concurrency > self.min_concurrency:
+                state.concurrency = max(self.min_concurrency, state.concurrency // 2)
+            else:
+                self.increase_delay(state)
+            self.stats.inc_value("throttle/decreases")
+        state.latency_sum, state.responses = 0.0, 0
+        self.apply(key, state)
+
+    def increase_delay(self, state):
+        """
+        Double the delay of a slot, starting from THROTTLE_BACKOFF_DELAY.
+
+        Args:
+            state (SlotState): State of the slot.
+        """
+        state.delay = min(max(state.delay * 2, self.backoff_delay, self.min_delay),
+                          self.max_delay)
+
+    def close_window(self, key, state):
+        """
+        Adapt a slot to the mean latency of its last window of responses.
+
+        Args:
+            key (str): Slot key.
+            state (SlotState): State of the slot.
+        """
+        latency = state.latency_sum / state.responses
+        state.latency_sum, state.responses = 0.0, 0
+        # The best mean creeps up so a slot that got slower for good gets a new reference
+        state.baseline = latency if state.baseline is None else min(latency,
+                                                                    state.baseline * 1.05)
+        if latency > max(self.target_latency, state.baseline * self.latency_tolerance):
+            # Only rate limiting and errors add delay
+            if state.concurrency > self.min_concurrency:
+                state.concurrency -= 1
+                self.stats.inc_value("throttle/decreases")
+        elif state.delay > self.min_delay:
+            state.delay = max(self.min_delay, state.delay / 2)
+            if state.delay < 0.05:
+                state.delay = self.min_delay
+            self.stats.inc_value("throttle/increases")
+        elif state.concurrency < self.max_concurrency:
+            state.concurrency = min(self.max_concurrency, state.concurrency * 2)
+            self.stats.inc_value("throttle/increases")
+        self.stats.set_value(f"throttle/latency/{key}", round(latency, 3))
+        self.apply(key, state)
+
+    def sync(self, key, state):
+        """
+        Set the decisions of a slot on the downloader if its slot does not have them.
+
+        Args:
+            key (str): Slot key.
+            state (SlotState): State of the slot.
+        """
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None and (slot.concurrency, slot.delay) != (
+                state.concurrency, state.slot_delay(time.monotonic())):
+            self.apply(key, state)
+
+    def apply(self, key, state):
+        """
+        Set the decisions of a slot on the downloader and in the stats.
+
+        Args:
+            key (str): Slot key.
+            state (SlotState): State of the slot.
+        """
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.concurrency = state.concurrency
+            slot.delay = state.slot_delay(time.monotonic())
+        self.record(key, state)
+
+    def record(self, key, state):
+        """
+        Keep the decisions of a slot in the crawl stats.
+
+        Args:
+            key (str): Slot key.
+            state (SlotState): State of the slot.
+        """
+        self.stats.set_value(f"throttle/concurrency/{key}", state.concurrency)
+        self.stats.set_value(f"throttle/delay/{key}", round(state.delay, 3))
@@ -0,0 +1,108 @@
+"""URL include/exclude rules of a crawl, compiled once into a single matcher."""
+
+
+import re
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+# Language versions and news sections are skipped unless a schedule sets its own exclusions
+DEFAULT_EXCLUDE_PATTERNS = (r"/(?:ru|en)/", r"uudis(?:ed)?|news")
+
+
+@lru_cache(maxsize=65536)
+def normalize_host(netloc):
+    """
+    Normalize a host name for comparisons and folder names.
+
+    Args:
+        netloc (str): Host name, or URL network location with optional user and port.
+
+    Returns:
+        str: Lowercase host without user, port, a leading ``www.`` or trailing dot or slash.
+    """
+    host = netloc.rpartition("@")[2].lower().rstrip("/")
+    if host.startswith("["):
+        host = host[:host.find("]") + 1]
+    else:
+        host = host.partition(":")[0]
+    host = host.rstrip(".")
+    return host[4:] if host.startswith("www.") else host
+
+
+def compile_rules(include_patterns=(), exclude_patterns=()):
+    """
+    Combine include and exclude patterns into one regular expression.
+
+    The expression matches at the start of a path when no exclude pattern
+    occurs anywhere in it and, if include patterns are given, at least one
+    include pattern does.
+
+    Args:
+        include_patterns (iterable): Regular expressions of which one must match.
+        exclude_patterns (iterable): Regular expressions of which none may match.
+
+    Returns:
+        re.Pattern: Combined matcher.
+
+    Raises:
+        ValueError: If a pattern is not a valid regular expression.
+    """
+    for pattern in (*include_patterns, *exclude_patterns):
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid URL rule {pattern!r}: {e}") from e
+    combined = ""
+    if exclude_patterns:
+        combined += "(?!.*(?:" + "|".join(f"(?:{p})" for p in exclude_patterns) + "))"
+    if include_patterns:
+        combined += "(?=.*(?:" + "|".join(f"(?:{p})" for p in include_patterns) + "))"
+    try:
+        return re.compile(combined, re.DOTALL)
+    except re.error as e:
+        raise ValueError(f"URL rules cannot be combined: {e}") from e
+
+
+class UrlRules:
+    """Decide which links of a crawl are followed."""
+
+    def __init__(self, domain, include_patterns=None, exclude_patterns=None):
+        """
+        Compile the rules of a crawl.
+
+        Args:
+            domain (str): Normalized domain the crawl is limited to.
+            include_patterns (list, optional): Regular expressions matched against the
+                lowercased path; a link must match one of them. No restriction if empty.
+            exclude_patterns (list, optional): Regular expressions matched against the
+                lowercased path; a link matching any of them is skipped.
+                DEFAULT_EXCLUDE_PATTERNS if None.
+
+        Raises:
+            ValueError: If a pattern is not a valid regular expression.
+        """
+        self.domain = domain
+        self.include_patterns = tuple(include_patterns or ())
+        self.exclude_patterns = tuple(DEFAULT_EXCLUDE_PATTERNS if exclude_patterns is None
+                                      else exclude_patterns)
+        self.matcher = compile_rules(self.include_patterns, self.exclude_patterns)
+
+    def allows(self, url):
+        """
+        Check whether a link is followed.
+
+        Args:
+            url (str): Absolute URL.
+
+        Returns:
+            bool: True for http(s) URLs of the crawled domain that pass the rules.
+        """
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return False
+        if parts.scheme not in ("http", "https"):
+            return False
+        if normalize_host(parts.netloc) != self.domain:
+            return False
+        return self.matcher.match(parts.path.lower()) is not None
@@ -0,0 +1,103 @@
+"""Tests of URL canonicalization and of the canonical request fingerprints."""
+
+
+import unittest
+
+from scrapy import Request
+
+from scrapy_project.canonical import CanonicalRequestFingerprinter, UrlCanonicalizer
+
+
+class CanonicalizeTest(unittest.TestCase):
+    """Variants of one page get one URL; parameters that select content are kept."""
+
+    def setUp(self):
+        self.canonicalizer = UrlCanonicalizer()
+
+    def test_tracking_and_session_parameters_are_dropped(self):
+        self.assertEqual(self.canonicalizer.canonicalize(
+            "HTTPS://Vald.EE/teenused?utm_source=fb&b=2&PHPSESSID=ab12&a=1&fbclid=x#kontakt"),
+            "https://vald.ee/teenused?a=1&b=2")
+
+    def test_sid_is_kept_unless_configured(self):
+        url = "https://vald.ee/uudised?sid=42"
+        self.assertEqual(self.canonicalizer.canonicalize(url), url)
+        self.assertEqual(UrlCanonicalizer(drop_params=["sid"]).canonicalize(url),
+                         "https://vald.ee/uudised")
+
+    def test_path_session_id_is_dropped(self):
+        self.assertEqual(self.canonicalizer.canonicalize(
+            "https://vald.ee/teenused;jsessionid=AB12CD?lk=2"), "https://vald.ee/teenused?lk=2")
+
+    def test_default_port_is_dropped(self):
+        self.assertEqual(self.canonicalizer.canonicalize("http://vald.ee:80/a"),
+                         "http://vald.ee/a")
+        self.assertEqual(self.canonicalizer.canonicalize("https://vald.ee:443/a"),
+                         "https://vald.ee/a")
+        self.assertEqual(self.canonicalizer.canonicalize("https://vald.ee:8443/a"),
+                         "https://vald.ee:8443/a")
+        self.assertEqual(self.canonicalizer.canonicalize("http://vald.ee:443/a"),
+                         "http://vald.ee:443/a")
+
+    def test_allowlist_keeps_only_the_listed_parameters(self):
+        canonicalizer = UrlCanonicalizer(param_allowlists={"www.vald.ee": ["id"]})
+        self.assertEqual(canonicalizer.canonicalize("https://vald.ee/a?page=2&id=7&sid=1"),
+                         "https://vald.ee/a?id=7")
+        # Other domains keep their parameters
+        self.assertEqual(canonicalizer.canonicalize("https://linn.ee/a?page=2&id=7"),
+                         "https://linn.ee/a?id=7&page=2")
+
+    def test_other_schemes_are_unchanged(self):
+        self.assertEqual(self.canonicalizer.canonicalize("mailto:Vald@Vald.ee"),
+                         "mailto:Vald@Vald.ee")
+
+
+class KeyTest(unittest.TestCase):
+    """Paths with and without a trailing slash share a key, except at the root."""
+
+    def test_trailing_slash_below_the_root(self):
+        canonicalizer = UrlCanonicalizer()
+        self.assertEqual(canonicalizer.key("https://vald.ee/teenused/"),
+                         "https://vald.ee/teenused")
+        self.assertEqual(canonicalizer.key("https://vald.ee/teenused//?lk=2"),
+                         "https://vald.ee/teenused?lk=2")
+        self.assertEqual(canonicalizer.key("https://vald.ee/teenused"),
+                         "https://vald.ee/teenused")
+
+    def test_root_keeps_its_slash(self):
+        canonicalizer = UrlCanonicalizer()
+        self.assertEqual(canonicalizer.key("https://vald.ee/"), "https://vald.ee/")
+        self.assertEqual(canonicalizer.key("https://vald.ee"), "https://vald.ee/")
+        self.assertEqual(canonicalizer.key("https://vald.ee/?lk=2"), "https://vald.ee/?lk=2")
+
+    def test_trailing_slash_can_be_significant(self):
+        canonicalizer = UrlCanonicalizer(strip_trailing_slash=False)
+        self.assertEqual(canonicalizer.key("https://vald.ee/teenused/"),
+                         "https://vald.ee/teenused/")
+
+
+class CanonicalRequestFingerprinterTest(unittest.TestCase):
+    """Requests of one page share a fingerprint, except the target of a redirect."""
+
+    def setUp(self):
+        self.fingerprinter = CanonicalRequestFingerprinter()
+
+    def test_variants_share_a_fingerprint(self):
+        fingerprint = self.fingerprinter.fingerprint(Request("https://vald.ee/teenused"))
+        for url in ("https://vald.ee/teenused/", "https://VALD.ee:443/teenused?utm_source=fb",
+                    "https://vald.ee/teenused;jsessionid=AB12#kontakt"):
+            self.assertEqual(self.fingerprinter.fingerprint(Request(url)), fingerprint)
+        self.assertNotEqual(self.fingerprinter.fingerprint(Request("https://vald.ee/teenused",
+                                                                   method="POST")),
+                            fingerprint)
+
+    def test_redirect_target_is_not_a_duplicate_of_its_source(self):
+        source = Request("https://vald.ee/teenused")
+        redirected = Request("https://vald.ee/teenused/",
+                             meta={"redirect_urls": ["https://vald.ee/teenused"]})
+        self.assertNotEqual(self.fingerprinter.fingerprint(redirected),
+                            self.fingerprinter.fingerprint(source))
+
+
+if __name__ == "__main__":
+    unittest.main()
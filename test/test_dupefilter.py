@@ -0,0 +1,132 @@
+"""Tests of the Bloom filter backed duplicate filter."""
+
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+from scrapy import Request
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+
+from scrapy_project.canonical import CanonicalRequestFingerprinter
+from scrapy_project.dupefilter import BloomDupeFilter, BloomFilter
+
+
+def fingerprint(value):
+    """
+    Hash a value to a Bloom filter fingerprint.
+
+    Args:
+        value (str): Value to hash.
+
+    Returns:
+        bytes: 16-byte digest.
+    """
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+
+
+class BloomFilterTest(unittest.TestCase):
+    """The memory-mapped filter remembers what was added, across reopening."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def test_add_reports_presence(self):
+        bloom = BloomFilter(self.directory, 1000, 0.001)
+        self.assertFalse(bloom.add(fingerprint("a")))
+        self.assertTrue(bloom.add(fingerprint("a")))
+        self.assertFalse(bloom.add(fingerprint("b")))
+        bloom.close()
+
+    def test_reopened_filter_keeps_its_bits(self):
+        bloom = BloomFilter(self.directory, 1000, 0.001)
+        bloom.add(fingerprint("a"))
+        bloom.close()
+        reopened = BloomFilter(self.directory, 1000, 0.001)
+        self.assertTrue(reopened.add(fingerprint("a")))
+        reopened.close()
+
+    def test_resident_bytes_do_not_exceed_the_mapping(self):
+        bloom = BloomFilter(self.directory, 100_000, 0.001)
+        for index in range(1000):
+            bloom.add(fingerprint(str(index)))
+        resident = bloom.resident_bytes()
+        if resident is not None:
+            self.assertGreater(resident, 0)
+            self.assertLessEqual(resident, bloom.size + 4096)
+        bloom.close()
+
+
+class BloomDupeFilterTest(unittest.TestCase):
+    """Duplicates are dropped, new URLs never are, and the state survives a restart."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stats = MemoryStatsCollector(get_crawler())
+        self.fingerprinter = CanonicalRequestFingerprinter()
+
+    def open_filter(self, capacity=1000, path=None):
+        """
+        Open a filter in the test directory.
+
+        Args:
+            capacity (int): Bloom filter capacity.
+            path (str, optional): Job directory; the test directory if None.
+
+        Returns:
+            BloomDupeFilter: Open filter.
+        """
+        return BloomDupeFilter(path or self.directory, fingerprinter=self.fingerprinter,
+                               capacity=capacity, stats=self.stats)
+
+    def test_duplicate_is_seen(self):
+        dupefilter = self.open_filter()
+        self.assertFalse(dupefilter.request_seen(Request("https://vald.ee/a")))
+        self.assertTrue(dupefilter.request_seen(Request("https://vald.ee/a")))
+        self.assertFalse(dupefilter.request_seen(Request("https://vald.ee/b")))
+        dupefilter.close("finished")
+
+    def test_saturated_bloom_filter_never_drops_new_urls(self):
+        dupefilter = self.open_filter(capacity=1)
+        urls = [f"https://vald.ee/{index}" for index in range(300)]
+        self.assertFalse(any(dupefilter.request_seen(Request(url)) for url in urls))
+        self.assertTrue(all(dupefilter.request_seen(Request(url)) for url in urls))
+        self.assertGreater(self.stats.get_value("dupefilter/bloom_false_positives", 0), 0)
+        dupefilter.close("finished")
+
+    def test_seen_urls_survive_a_restart(self):
+        dupefilter = self.open_filter()
+        dupefilter.request_seen(Request("https://vald.ee/a"))
+        dupefilter.close("shutdown")
+        resumed = self.open_filter()
+        self.assertEqual(resumed.seen, 1)
+        self.assertTrue(resumed.request_seen(Request("https://vald.ee/a")))
+        resumed.close("finished")
+
+    def test_canonical_duplicates_are_counted(self):
+        dupefilter = self.open_filter()
+        dupefilter.request_seen(Request("https://vald.ee/a"))
+        raw_url = "https://vald.ee/a?utm_source=x"
+        self.assertTrue(dupefilter.request_seen(
+            Request("https://vald.ee/a", meta={"raw_url": raw_url})))
+        self.assertEqual(self.stats.get_value("canonical/duplicates_avoided"), 1)
+        dupefilter.close("finished")
+
+    def test_close_reports_memory(self):
+        dupefilter = self.open_filter()
+        dupefilter.request_seen(Request("https://vald.ee/a"))
+        dupefilter.close("finished")
+        self.assertEqual(self.stats.get_value("dupefilter/seen"), 1)
+        self.assertGreater(self.stats.get_value("dupefilter/bloom_bytes"), 0)
+
+    def test_temporary_directory_is_removed(self):
+        dupefilter = BloomDupeFilter(fingerprinter=self.fingerprinter, capacity=1000)
+        directory = dupefilter.directory
+        dupefilter.close("finished")
+        self.assertFalse(os.path.exists(directory))
+
+
+if __name__ == "__main__":
+    unittest.main()
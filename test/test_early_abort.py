@@ -0,0 +1,127 @@
+"""Tests of the downloads stopped from their headers or first body bytes."""
+
+
+import gzip
+import unittest
+from types import SimpleNamespace
+
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest, StopDownload
+from scrapy.http import Headers
+from scrapy.utils.test import get_crawler
+
+from scrapy_project.early_abort import EarlyAbortMiddleware
+from scrapy_project.spiders.spider import Spider
+
+UNKNOWN_LENGTH = -1
+PAGE = (b"<!DOCTYPE html><html class='page' lang='ru-RU'><head><title>Uslugi</title></head>"
+        b"<body>" + b"<p>Tekst</p>" * 200 + b"</body></html>")
+
+
+class EarlyAbortTest(unittest.TestCase):
+    """Page downloads stop as soon as they are known to be discarded."""
+
+    def setUp(self):
+        crawler = get_crawler(Spider)
+        self.spider = Spider.from_crawler(crawler, start_urls=["https://vald.ee/"])
+        self.stats = crawler.stats
+        self.middleware = EarlyAbortMiddleware(
+            SimpleNamespace(stats=self.stats), content_types=["text/html", "application/pdf"],
+            languages=["en", "ru"], sniff_bytes=1024,
+            max_sizes={"text/html": 4096, "*": 1024 * 1024})
+
+    def headers(self, request, content_type="text/html; charset=utf-8", length=UNKNOWN_LENGTH,
+                **headers):
+        """
+        Pass the headers of a download to the middleware.
+
+        Args:
+            request (scrapy.Request): Request being downloaded.
+            content_type (str): Content-Type header.
+            length (int): Announced body length.
+            **headers: Other headers.
+        """
+        headers = Headers({"Content-Type": content_type, **headers})
+        self.middleware.headers_received(headers, length, request, self.spider)
+
+    def body(self, request, data, chunk_size):
+        """
+        Pass a body to the middleware in chunks.
+
+        Args:
+            request (scrapy.Request): Request being downloaded.
+            data (bytes): Body as sent by the server.
+            chunk_size (int): Bytes per chunk.
+        """
+        for start in range(0, len(data), chunk_size):
+            self.middleware.bytes_received(data[start:start + chunk_size], request, self.spider)
+
+    def assertStopped(self, request, reason, function, *args):
+        """
+        Check that a call stops the download.
+
+        Args:
+            request (scrapy.Request): Request being downloaded.
+            reason (str): Expected reason.
+            function (callable): Middleware call.
+            *args: Its arguments.
+        """
+        with self.assertRaises(StopDownload):
+            function(*args)
+        self.assertEqual(request.meta["early_abort"], reason)
+        self.assertEqual(self.stats.get_value(f"early_abort/reason/{reason}"), 1)
+        with self.assertRaises(IgnoreRequest):
+            self.middleware.process_exception(request, StopDownload(fail=True), self.spider)
+
+    def test_other_content_type_is_stopped(self):
+        request = Request("https://vald.ee/pilt.png")
+        self.assertStopped(request, "content_type", self.headers, request, "image/png", 5000)
+        self.assertEqual(self.stats.get_value("early_abort/bytes_saved"), 5000)
+
+    def test_announced_size_above_the_cap_is_stopped(self):
+        request = Request("https://vald.ee/suur")
+        self.assertStopped(request, "max_size", self.headers, request, "text/html", 5000)
+        # Types without their own cap use "*"
+        self.headers(Request("https://vald.ee/a.pdf"), "application/pdf", 5000)
+
+    def test_size_is_also_checked_while_streaming(self):
+        request = Request("https://vald.ee/suur")
+        self.headers(request, "text/html")
+        body = b"<html><body>" + b"x" * 5000
+        self.assertStopped(request, "max_size", self.body, request, body, 1000)
+        self.assertEqual(self.stats.get_value("early_abort/unknown_length"), 1)
+        self.assertEqual(self.stats.get_value("early_abort/bytes_received"), 5000)
+
+    def test_html_lang_is_found_across_gzip_chunks(self):
+        request = Request("https://vald.ee/ru/uslugi")
+        compressed = gzip.compress(PAGE)
+        self.headers(request, length=len(compressed), **{"Content-Encoding": "gzip"})
+        # Chunks of 16 bytes split the <html> tag between chunks
+        with self.assertRaises(StopDownload):
+            self.body(request, compressed, 16)
+        self.assertEqual(request.meta["early_abort"], "html_lang")
+        self.assertLess(self.stats.get_value("early_abort/bytes_received"), len(compressed))
+
+    def test_pages_in_other_languages_are_downloaded(self):
+        request = Request("https://vald.ee/teenused")
+        page = PAGE.replace(b"lang='ru-RU'", b"lang='et'")
+        self.headers(request)
+        self.body(request, page, 16)
+        self.assertNotIn("early_abort", request.meta)
+        self.assertIsNone(self.stats.get_value("early_abort/requests"))
+
+    def test_robots_and_sitemaps_are_not_checked(self):
+        for request in (self.spider.sitemap_request("https://vald.ee/robots.txt",
+                                                    self.spider.parse_robots),
+                        self.spider.sitemap_request("https://vald.ee/sitemap.xml.gz",
+                                                    self.spider.parse_sitemap)):
+            self.headers(request, "text/plain", 10 ** 9)
+            self.body(request, b"\0" * 100, 100)
+            self.assertNotIn("early_abort", request.meta)
+        self.assertTrue(self.middleware.is_checked(Request("https://vald.ee/"), self.spider))
+        self.assertTrue(self.middleware.is_checked(
+            Request("https://vald.ee/", callback=self.spider.parse), self.spider))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Golden-output tests of the content extraction backends."""
+
+
+import json
+import os
+import unittest
+
+from utils.boilerplate import TemplateModel
+from utils.extraction import BACKENDS, extract_content
+from utils.parsing_utils import parse_html_titles_and_contents
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "golden")
+
+
+def golden_pages():
+    """
+    List the golden pages.
+
+    Returns:
+        list: ``(name, html bytes, expected dict)`` tuples.
+    """
+    pages = []
+    for filename in sorted(os.listdir(GOLDEN_DIR)):
+        if not filename.endswith(".html"):
+            continue
+        name = filename[:-len(".html")]
+        with open(os.path.join(GOLDEN_DIR, filename), "rb") as f:
+            html = f.read()
+        with open(os.path.join(GOLDEN_DIR, name + ".json"), encoding="utf-8") as f:
+            pages.append((name, html, json.load(f)))
+    return pages
+
+
+class ExtractionGoldenTest(unittest.TestCase):
+    """Every backend must reproduce the golden output of every page."""
+
+    def test_backends_match_golden_output(self):
+        for name, html, expected in golden_pages():
+            for backend in BACKENDS:
+                with self.subTest(page=name, backend=backend):
+                    self.assertEqual(extract_content(html, backend=backend), expected)
+
+    def test_text_input_matches_bytes_input(self):
+        for name, html, expected in golden_pages():
+            for backend in BACKENDS:
+                with self.subTest(page=name, backend=backend):
+                    self.assertEqual(extract_content(html.decode("utf-8"), backend=backend),
+                                     expected)
+
+    def test_empty_document(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                self.assertEqual(extract_content("", backend=backend),
+                                 {"title": "", "content": []})
+
+    def test_titles_and_contents_use_the_same_sections(self):
+        _, html, expected = next(page for page in golden_pages() if page[0] == "article")
+        self.assertEqual(
+            parse_html_titles_and_contents(html),
+            [(section["header"], " ".join(section["paragraphs"]))
+             for section in expected["content"] if section["paragraphs"]],
+        )
+
+
+def templated_page(index):
+    """
+    Build a page with a banner and a footer that every page repeats.
+
+    Args:
+        index (int): Page number, varies the content and the sidebar.
+
+    Returns:
+        str: Page source.
+    """
+    return (
+        '<html lang="et"><body>'
+        '<div id="cookie" class="banner"><h3>Küpsised</h3><p>Kasutame küpsiseid.</p></div>'
+        f"<main><h1>Leht {index}</h1><p>Sisu {index}.</p>"
+        f'<aside class="side"><h4>Vaata ka</h4><p>Seotud {index % 3}</p></aside></main>'
+        "<footer><h2>Kontakt</h2><p>Aadress 1, Tallinn</p></footer></body></html>"
+    )
+
+
+class TemplateTest(unittest.TestCase):
+    """Blocks repeated across a domain are skipped the same way by every backend."""
+
+    def setUp(self):
+        self.template = TemplateModel.learn(templated_page(index) for index in range(10))
+
+    def test_repeated_blocks_are_skipped(self):
+        expected = {"title": "", "content": [
+            {"header": "Leht 10", "paragraphs": ["Sisu 10."]},
+            {"header": "Vaata ka", "paragraphs": ["Seotud 1"]},
+        ]}
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                self.assertEqual(extract_content(templated_page(10), backend=backend,
+                                                 template=self.template), expected)
+
+    def test_blocks_match_again_with_other_markup(self):
+        expected = extract_content(templated_page(10), template=self.template)
+        # Seen before: matched by its markup
+        self.assertEqual(extract_content(templated_page(10), template=self.template), expected)
+        page = templated_page(10).replace("<p>Aadress 1, Tallinn</p>",
+                                          '<p class="address">Aadress 1, <b>Tallinn</b></p>')
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                self.assertEqual(extract_content(page, backend=backend,
+                                                 template=self.template), expected)
+
+    def test_only_outermost_blocks_are_learned(self):
+        self.assertEqual(sorted(self.template.blocks),
+                         [("div", "cookie", "banner"), ("footer", "", "")])
+
+    def test_small_sample_learns_nothing(self):
+        template = TemplateModel.learn(templated_page(index) for index in range(3))
+        self.assertEqual(len(template), 0)
+        self.assertEqual(extract_content(templated_page(0), template=template),
+                         extract_content(templated_page(0)))
+
+    def test_round_trip(self):
+        restored = TemplateModel.from_dict(self.template.to_dict())
+        self.assertEqual(restored.blocks, self.template.blocks)
+        self.assertEqual(restored.version, self.template.version)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""Tests of conditional requests and of not-modified answers."""
+
+
+import asyncio
+import unittest
+from datetime import datetime
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from scrapy_project.items import LinkMetadataItem
+from scrapy_project.middlewares import ConditionalRequestMiddleware
+from scrapy_project.page_state import PageState
+from scrapy_project.spiders.spider import Spider
+from utils.html_document import HtmlDocument
+
+SAVED = "<html><body><a href='/teenused'>Teenused</a></body></html>"
+
+
+def page_state(etag=None, last_modified_at=None, duplicate_of=None):
+    """
+    Build the stored state of a page.
+
+    Args:
+        etag (str, optional): Stored ETag.
+        last_modified_at (datetime, optional): Stored Last-Modified time.
+        duplicate_of (str, optional): Page this one is a near-duplicate of.
+
+    Returns:
+        PageState: Stored state.
+    """
+    return PageState(etag, last_modified_at, "hash", datetime(2024, 5, 1), 1, 0, None, None,
+                     None, None, duplicate_of)
+
+
+class IncrementalTest(unittest.TestCase):
+    """Base of the tests, with a spider of vald.ee that knows no pages yet."""
+
+    def setUp(self):
+        self.crawler = get_crawler(Spider)
+        self.spider = Spider.from_crawler(self.crawler, start_urls=["https://vald.ee/"])
+        self.saved = {}
+        self.spider.load_saved_content = lambda url: (
+            HtmlDocument(self.saved[url]) if url in self.saved else None)
+
+
+class ConditionalRequestMiddlewareTest(IncrementalTest):
+    """Validators are sent only for stored pages that were saved."""
+
+    def setUp(self):
+        super().setUp()
+        self.middleware = ConditionalRequestMiddleware.from_crawler(self.crawler)
+
+    def request(self, state=None):
+        """
+        Pass a request of a page with a stored state through the middleware.
+
+        Args:
+            state (PageState, optional): Stored state of the page.
+
+        Returns:
+            scrapy.Request: Processed request.
+        """
+        if state is not None:
+            self.spider.page_state.pages["https://vald.ee/a"] = state
+        request = Request("https://vald.ee/a")
+        self.middleware.process_request(request, self.spider)
+        return request
+
+    def test_validators_of_a_stored_page(self):
+        request = self.request(page_state('"1"', datetime(2024, 5, 1, 9, 30)))
+        self.assertEqual(request.headers.get("If-None-Match"), b'"1"')
+        self.assertEqual(request.headers.get("If-Modified-Since"),
+                         b"Wed, 01 May 2024 09:30:00 GMT")
+        self.assertEqual(request.meta["handle_httpstatus_list"], [304])
+
+    def test_no_validators_without_a_stored_copy(self):
+        for state in (None, page_state(), page_state('"1"', duplicate_of="https://vald.ee/b")):
+            request = self.request(state)
+            self.assertNotIn(b"If-None-Match", request.headers)
+            self.assertNotIn(b"If-Modified-Since", request.headers)
+            self.assertNotIn("handle_httpstatus_list", request.meta)
+
+    def test_refetch_is_unconditional(self):
+        self.spider.page_state.pages["https://vald.ee/a"] = page_state('"1"')
+        request = Request("https://vald.ee/a", meta={"dont_conditional": True})
+        self.middleware.process_request(request, self.spider)
+        self.assertNotIn(b"If-None-Match", request.headers)
+
+
+class NotModifiedTest(IncrementalTest):
+    """A 304 follows the links of the stored copy, or fetches the page again without one."""
+
+    def parse(self):
+        """
+        Parse a 304 answer to a conditional request of https://vald.ee/a.
+
+        Returns:
+            list: Yielded items and requests.
+        """
+        request = Request("https://vald.ee/a", headers={"If-None-Match": '"1"'},
+                          meta={"handle_httpstatus_list": [304]})
+        response = HtmlResponse("https://vald.ee/a", status=304, request=request)
+
+        async def collect():
+            return [result async for result in self.spider.parse(response)]
+
+        return asyncio.run(collect())
+
+    def test_links_of_the_stored_copy_are_followed(self):
+        self.saved["https://vald.ee/a"] = SAVED
+        results = self.parse()
+        self.assertIsInstance(results[0], LinkMetadataItem)
+        self.assertEqual(results[0]["url"], "https://vald.ee/a")
+        self.assertEqual([request.url for request in results[1:]], ["https://vald.ee/teenused"])
+        self.assertEqual(self.crawler.stats.get_value("incremental/not_modified"), 1)
+
+    def test_page_without_a_stored_copy_is_fetched_again(self):
+        results = self.parse()
+        self.assertEqual(len(results), 1)
+        request = results[0]
+        self.assertEqual(request.url, "https://vald.ee/a")
+        self.assertTrue(request.dont_filter)
+        self.assertTrue(request.meta["dont_conditional"])
+        self.assertNotIn(b"If-None-Match", request.headers)
+        self.assertEqual(
+            self.crawler.stats.get_value("incremental/not_modified_without_copy"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Tests of the JavaScript rendering score, the classifier thresholds and the saved decisions."""
+
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+
+from scrapy_project.js_classifier import JsClassifier
+from utils.html_document import HtmlDocument
+
+TEXT = " ".join(["Valla teenused ja taotlused elanikele."] * 40)
+APP_SHELL = ("<html><body><div id='root'></div><noscript>You need to enable JavaScript"
+             "</noscript><script src='/static/js/main.react.js'></script></body></html>")
+STATIC_PAGE = f"<html><body><h1>Teenused</h1><p>{TEXT}</p></body></html>"
+
+
+def page(score=0.0, links=0, text_length=0):
+    """
+    Build a stand-in for a parsed page.
+
+    Args:
+        score (float): JavaScript score.
+        links (int): Number of links.
+        text_length (int): Visible text characters.
+
+    Returns:
+        types.SimpleNamespace: Object with the attributes the classifier reads.
+    """
+    return SimpleNamespace(js_score=score, links=["/"] * links, text_length=text_length)
+
+
+class JsScoreTest(unittest.TestCase):
+    """App shells score above the default threshold, text pages without scripts score 0."""
+
+    def test_app_shell(self):
+        self.assertEqual(HtmlDocument(APP_SHELL).js_score, 1.0)
+
+    def test_page_without_scripts(self):
+        self.assertEqual(HtmlDocument(STATIC_PAGE).js_score, 0.0)
+
+    def test_text_page_with_a_framework_stays_static(self):
+        html = STATIC_PAGE.replace("</body>", "<script src='/vue.min.js'></script></body>")
+        self.assertLess(HtmlDocument(html).js_score, 0.5)
+
+
+class JsClassifierTest(unittest.TestCase):
+    """Pages at the threshold are rendered; after enough comparisons the prefix decides."""
+
+    def setUp(self):
+        self.stats = MemoryStatsCollector(get_crawler())
+        self.classifier = JsClassifier(threshold=0.5, min_samples=3, sample_rate=0.0,
+                                       stats=self.stats)
+
+    def test_threshold(self):
+        self.assertEqual(self.classifier.classify("https://vald.ee/a", page(0.5)), (True, True))
+        self.assertEqual(self.classifier.classify("https://vald.ee/a", page(0.49)),
+                         (False, False))
+        self.assertEqual(self.stats.get_value("js_classifier/rendered"), 1)
+
+    def test_static_pages_are_sampled_while_learning(self):
+        self.classifier.sample_rate = 0.1
+        with mock.patch("random.random", return_value=0.05):
+            self.assertEqual(self.classifier.classify("https://vald.ee/a", page()), (True, True))
+        with mock.patch("random.random", return_value=0.5):
+            self.assertEqual(self.classifier.classify("https://vald.ee/a", page()),
+                             (False, False))
+
+    def test_rendering_is_needed_for_more_links_or_text(self):
+        static = page(links=10, text_length=1000)
+        self.assertFalse(self.classifier.record("https://vald.ee/a", static,
+                                                page(links=14, text_length=1300)))
+        self.assertTrue(self.classifier.record("https://vald.ee/a", static, page(links=15)))
+        self.assertTrue(self.classifier.record("https://vald.ee/a", static,
+                                               page(text_length=1301)))
+
+    def test_majority_decision_is_cached_per_prefix(self):
+        static, rendered = page(0.9, text_length=100), page(text_length=1000)
+        for needed in (True, False, True):
+            self.classifier.record("https://vald.ee/teenused/x",
+                                   static, rendered if needed else static)
+        self.assertEqual(self.classifier.classify("https://vald.ee/teenused/y", page(0.0)),
+                         (True, False))
+        # Another prefix is still learning
+        self.assertEqual(self.classifier.classify("https://vald.ee/kontakt", page(0.0)),
+                         (False, False))
+        self.assertEqual(self.stats.get_value("js_classifier/cached_decisions"), 1)
+        self.assertEqual(self.stats.get_value("js_classifier/agreed"), 2)
+
+    def test_decisions_survive_a_new_crawl(self):
+        static = page(0.9, text_length=1000)
+        for _ in range(3):
+            self.classifier.record("https://vald.ee/teenused/x", static, static)
+        self.classifier.record("https://vald.ee/uudised/x", static, static)
+        path = os.path.join(tempfile.mkdtemp(), "vald.ee", "js_classifier.json")
+        self.classifier.save(path)
+
+        later = JsClassifier(threshold=0.5, min_samples=3, sample_rate=0.0)
+        self.assertEqual(later.load(path), 1)
+        self.assertEqual(later.classify("https://vald.ee/teenused/y", page(0.9)), (False, False))
+        self.assertEqual(later.classify("https://vald.ee/uudised/y", page(0.9)), (True, True))
+
+        expired = JsClassifier(max_age=timedelta(days=30))
+        self.assertEqual(expired.load(path, now=datetime.now() + timedelta(days=31)), 0)
+
+    def test_missing_or_broken_file(self):
+        directory = tempfile.mkdtemp()
+        self.assertEqual(self.classifier.load(os.path.join(directory, "missing.json")), 0)
+        path = os.path.join(directory, "broken.json")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{")
+        self.assertEqual(self.classifier.load(path), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Tests of the Prometheus metrics of the running crawls."""
+
+
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+
+from scrapy_project import metrics
+from scrapy_project.metrics import observe, render_metrics, serve_metrics
+
+
+def crawler(crawl_id, seconds):
+    """
+    Build a running crawl of vald.ee.
+
+    Args:
+        crawl_id (str): CRAWL_ID of the crawl.
+        seconds (float): Duration of its one download.
+
+    Returns:
+        types.SimpleNamespace: Object with the attributes the metrics read.
+    """
+    stats = MemoryStatsCollector(get_crawler())
+    observe(stats, "download", seconds)
+    spider = SimpleNamespace(name="spider", allowed_domains=["vald.ee"], renders_in_flight=1)
+    return SimpleNamespace(spider=spider, stats=stats, engine=None,
+                           settings=Settings({"CRAWL_ID": crawl_id}))
+
+
+class RenderMetricsTest(unittest.TestCase):
+    """Every crawl has its own series, also when two crawls share a domain."""
+
+    def test_crawls_of_one_domain_are_labelled_apart(self):
+        text = render_metrics([crawler("1", 0.002), crawler("2", 0.2)])
+        self.assertIn('crawler_stage_seconds_bucket{domain="vald.ee",crawl="1",stage="download",'
+                      'le="0.005"} 1', text)
+        self.assertIn('crawler_stage_seconds_bucket{domain="vald.ee",crawl="2",stage="download",'
+                      'le="0.005"} 0', text)
+        self.assertIn('crawler_renders_in_flight{domain="vald.ee",crawl="1"} 1', text)
+        self.assertIn('crawler_renders_in_flight{domain="vald.ee",crawl="2"} 1', text)
+
+    def test_crawl_without_an_id_is_labelled_with_its_domain(self):
+        text = render_metrics([crawler(None, 0.002)])
+        self.assertIn('crawler_queue_depth{domain="vald.ee",crawl="vald.ee"} 0', text)
+
+
+class ServeMetricsTest(unittest.TestCase):
+    """The process listens once, whatever the number of crawlers."""
+
+    def test_server_is_started_once(self):
+        with mock.patch.object(metrics, "_resource", None), \
+                mock.patch("twisted.internet.reactor.listenTCP") as listen:
+            resource = serve_metrics(8000)
+            self.assertIs(serve_metrics(8000), resource)
+        self.assertEqual(listen.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+"""Tests of the SimHash fingerprints, the main-text extraction and the near-duplicate index."""
+
+
+import random
+import unittest
+
+from scrapy_project.near_duplicates import (NearDuplicateIndex, content_text, resemblance,
+                                            shingle_hashes, simhash, to_signed, to_unsigned)
+from utils.boilerplate import TemplateModel
+from utils.html_document import HtmlDocument
+
+WORDS = ("vald teenus taotlus toetus elanik kool lasteaed teave avaldus kord haridus kultuur "
+         "sport noored eakad tervis transport keskkond ehitus planeering maks arve leping "
+         "koosolek otsus volikogu eelarve hange projekt").split()
+
+
+def words(count, seed):
+    """
+    Build a deterministic run of words.
+
+    Args:
+        count (int): Number of words.
+        seed (int): Seed of the generator.
+
+    Returns:
+        str: Words separated by spaces.
+    """
+    generator = random.Random(seed)
+    return " ".join(generator.choice(WORDS) for _ in range(count))
+
+
+def page(content, semantic=True):
+    """
+    Build a page with a large navigation and footer around its content.
+
+    Args:
+        content (str): Text of the page itself.
+        semantic (bool): False wraps the boilerplate in plain divs.
+
+    Returns:
+        str: Page source.
+    """
+    navigation = words(300, seed=1)
+    footer = words(100, seed=2)
+    if semantic:
+        return (f"<html><body><header><nav><p>{navigation}</p></nav></header>"
+                f"<div class='content'><h1>Pealkiri</h1><p>{content}</p></div>"
+                f"<footer><p>{footer}</p></footer></body></html>")
+    return (f"<html><body><div id='menu'><p>{navigation}</p></div>"
+            f"<div class='content'><h1>Pealkiri</h1><p>{content}</p></div>"
+            f"<div id='footer'><p>{footer}</p></div></body></html>")
+
+
+def main_shingles(html, template=None):
+    """
+    Hash the shingles of the main text of a page.
+
+    Args:
+        html (str): Page source.
+        template (TemplateModel, optional): Template of the domain.
+
+    Returns:
+        set or None: Shingle hashes.
+    """
+    return shingle_hashes(content_text(HtmlDocument(html).tree, template))
+
+
+class SimhashTest(unittest.TestCase):
+    """Similar texts get close fingerprints, different texts distant ones."""
+
+    def test_short_text_is_not_fingerprinted(self):
+        self.assertIsNone(simhash(words(49, seed=3)))
+        self.assertIsNotNone(simhash(words(50, seed=3)))
+
+    def test_equal_texts_have_equal_fingerprints(self):
+        text = words(200, seed=3)
+        self.assertEqual(simhash(text), simhash(text.upper()))
+
+    def test_small_edit_changes_few_bits(self):
+        text = words(400, seed=3)
+        edited = text + " kontakt"
+        self.assertLessEqual((simhash(text) ^ simhash(edited)).bit_count(), 3)
+
+    def test_different_texts_are_far_apart(self):
+        self.assertGreater((simhash(words(400, seed=3)) ^ simhash(words(400, seed=4))).bit_count(),
+                           10)
+
+    def test_signed_round_trip(self):
+        for fingerprint in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+            signed = to_signed(fingerprint)
+            self.assertTrue(-(1 << 63) <= signed < 1 << 63)
+            self.assertEqual(to_unsigned(signed), fingerprint)
+
+    def test_resemblance(self):
+        self.assertEqual(resemblance({1, 2, 3}, {1, 2, 3}), 1.0)
+        self.assertEqual(resemblance({1, 2, 3}, {2, 3, 4}), 0.5)
+        self.assertEqual(resemblance(set(), set()), 0.0)
+
+
+class NearDuplicateIndexTest(unittest.TestCase):
+    """Lookups find every page within the distance, through any band."""
+
+    def test_find_within_distance(self):
+        index = NearDuplicateIndex(max_distance=3)
+        index.add("https://vald.ee/a", 0)
+        self.assertEqual(index.find(0b111), "https://vald.ee/a")
+        # One differing bit in every band: no band is shared
+        self.assertIsNone(index.find(1 | 1 << 16 | 1 << 32 | 1 << 48))
+        self.assertIsNone(index.find(0b1111))
+
+    def test_closest_page_first(self):
+        index = NearDuplicateIndex(max_distance=3)
+        index.add("https://vald.ee/b", 0b11)
+        index.add("https://vald.ee/a", 0b1)
+        index.add("https://vald.ee/c", 0b1 << 63)
+        self.assertEqual(index.candidates(0),
+                         ["https://vald.ee/a", "https://vald.ee/c", "https://vald.ee/b"])
+
+    def test_exclude_and_remove(self):
+        index = NearDuplicateIndex(max_distance=3)
+        index.add("https://vald.ee/a", 5)
+        self.assertIsNone(index.find(5, exclude="https://vald.ee/a"))
+        index.add("https://vald.ee/a", 0b1111 << 40)
+        self.assertIsNone(index.find(5))
+        index.remove("https://vald.ee/a")
+        index.remove("https://vald.ee/a")
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.tables, [{} for _ in index.bands])
+
+
+class ContentTextTest(unittest.TestCase):
+    """Fingerprints cover the main text, so shared boilerplate does not make pages alike."""
+
+    def test_main_element_is_preferred(self):
+        html = ("<html><body><div>Menüü</div><main><header><h1>Pealkiri</h1></header>"
+                "<p>Sisu</p><nav>Lehed</nav></main><script>x = 1</script></body></html>")
+        self.assertEqual(content_text(HtmlDocument(html).tree), "Pealkiri Sisu")
+
+    def test_boilerplate_outside_articles_is_left_out(self):
+        html = ("<html><body><header>Logo</header><div role='navigation'>Menüü</div>"
+                "<article><header>Pealkiri</header><p>Sisu</p><footer>Autor</footer></article>"
+                "<form>Otsi</form><footer>Kontakt</footer></body></html>")
+        self.assertEqual(content_text(HtmlDocument(html).tree), "Pealkiri Sisu Autor")
+
+    def test_distinct_pages_sharing_boilerplate_are_not_near_duplicates(self):
+        first, second = page(words(80, seed=5)), page(words(80, seed=6))
+        # The whole text is mostly the shared navigation and footer
+        self.assertGreater(resemblance(*(shingle_hashes(HtmlDocument(html).text)
+                                         for html in (first, second))), 0.6)
+        index = NearDuplicateIndex(max_distance=3)
+        index.add("https://vald.ee/a", simhash(content_text(HtmlDocument(first).tree)))
+        self.assertIsNone(index.find(simhash(content_text(HtmlDocument(second).tree))))
+        self.assertLess(resemblance(main_shingles(first), main_shingles(second)), 0.8)
+
+    def test_pages_with_few_own_words_are_not_compared(self):
+        self.assertIsNone(main_shingles(page(words(30, seed=5))))
+
+    def test_template_blocks_are_left_out(self):
+        pages = [page(words(80, seed=seed), semantic=False) for seed in range(10, 16)]
+        template = TemplateModel.learn(pages)
+        self.assertGreater(resemblance(*(shingle_hashes(HtmlDocument(html).text)
+                                         for html in pages[:2])), 0.5)
+        self.assertLess(resemblance(main_shingles(pages[0], template),
+                                    main_shingles(pages[1], template)), 0.8)
+        # The parsed page is left as it was
+        document = HtmlDocument(pages[0])
+        content_text(document.tree, template)
+        self.assertIn(words(100, seed=2), document.text)
+
+    def test_print_view_is_a_near_duplicate(self):
+        content = words(200, seed=7)
+        printed = f"<html><body><h1>Pealkiri</h1><p>{content}</p><p>Prindi</p></body></html>"
+        self.assertGreaterEqual(resemblance(main_shingles(page(content)),
+                                            main_shingles(printed)), 0.8)
+
+
+if __name__ == "__main__":
+    unittest.main()
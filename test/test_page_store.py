@@ -0,0 +1,124 @@
+"""Tests of the append-only page store and its compaction."""
+
+
+import gzip
+import tempfile
+import unittest
+
+from utils.page_store import PageStore
+
+
+class PageStoreTest(unittest.TestCase):
+    """Pages read back as written, across new versions, segments, compaction and reopening."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Every page is written on put; batching is tested by BatchedCommitTest
+        self.store = PageStore(self.directory, commit_pages=1)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_put_and_get(self):
+        digest = self.store.put("https://vald.ee/a", "<p>Tere</p>")
+        self.assertEqual(self.store.get("https://vald.ee/a"), "<p>Tere</p>".encode("utf-8"))
+        self.assertIn("https://vald.ee/a", self.store)
+        self.assertEqual(self.store.digests(), [("https://vald.ee/a", digest)])
+        self.assertIsNone(self.store.get("https://vald.ee/b"))
+
+    def test_new_version_replaces_the_old_one(self):
+        self.store.put("https://vald.ee/a", b"old")
+        self.store.put("https://vald.ee/a", b"new")
+        self.assertEqual(self.store.get("https://vald.ee/a"), b"new")
+        self.assertEqual(len(self.store), 1)
+        self.assertGreater(self.store.garbage_ratio(), 0)
+
+    def test_segments_are_valid_gzip_warc_files(self):
+        self.store.put("https://vald.ee/a", b"body")
+        self.store.close()
+        with gzip.open(self.store.segment_path(self.store.segments()[0]), "rb") as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b"WARC/1.1\r\n"))
+        self.assertIn(b"WARC-Target-URI: https://vald.ee/a", data)
+        self.store = PageStore(self.directory)
+
+    def test_full_segment_starts_a_new_one(self):
+        self.store.close()
+        self.store = PageStore(self.directory, segment_size=1, commit_pages=1)
+        for index in range(3):
+            self.store.put(f"https://vald.ee/{index}", b"x" * 100)
+        self.assertEqual(len(self.store.segments()), 3)
+        self.assertEqual(self.store.get("https://vald.ee/1"), b"x" * 100)
+
+    def test_compaction_keeps_the_latest_versions(self):
+        for version in range(5):
+            self.store.put("https://vald.ee/a", f"a{version}" * 100)
+        self.store.put("https://vald.ee/b", "b" * 100)
+        old_segments = self.store.segments()
+        self.assertGreater(self.store.compact(), 0)
+        self.assertTrue(set(old_segments).isdisjoint(self.store.segments()))
+        self.assertEqual(self.store.garbage_ratio(), 0.0)
+        self.assertEqual(self.store.get("https://vald.ee/a"), ("a4" * 100).encode("utf-8"))
+        self.assertEqual(self.store.get("https://vald.ee/b"), b"b" * 100)
+        self.store.put("https://vald.ee/c", b"c")
+        self.assertEqual(self.store.get("https://vald.ee/c"), b"c")
+
+    def test_compacting_an_empty_store(self):
+        self.assertEqual(self.store.compact(), 0)
+        self.assertEqual(self.store.garbage_ratio(), 0.0)
+
+    def test_reopened_store_reads_its_pages(self):
+        self.store.put("https://vald.ee/a", b"first")
+        self.store.compact()
+        self.store.put("https://vald.ee/b", b"second")
+        self.store.close()
+        self.store = PageStore(self.directory)
+        self.assertEqual(self.store.get("https://vald.ee/a"), b"first")
+        self.assertEqual(self.store.get("https://vald.ee/b"), b"second")
+        self.assertEqual([page.url for page in self.store.iter_pages()],
+                         ["https://vald.ee/a", "https://vald.ee/b"])
+
+
+class BatchedCommitTest(unittest.TestCase):
+    """Pages are written together, and are readable from the store before they are."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = PageStore(self.directory, commit_pages=3, commit_interval=60)
+        self.reader = PageStore(self.directory)
+
+    def tearDown(self):
+        self.store.close()
+        self.reader.close()
+
+    def test_pages_are_written_when_the_batch_is_full(self):
+        self.store.put("https://vald.ee/a", b"old")
+        self.store.put("https://vald.ee/a", b"new")
+        self.store.put("https://vald.ee/b", b"b")
+        self.assertEqual(self.store.get("https://vald.ee/a"), b"new")
+        self.assertIn("https://vald.ee/b", self.store)
+        self.assertEqual(self.store.segments(), [])
+        self.assertNotIn("https://vald.ee/a", self.reader)
+
+        self.store.put("https://vald.ee/c", b"c")
+        self.assertEqual(self.store.pending, {})
+        self.assertEqual(self.reader.get("https://vald.ee/a"), b"new")
+        self.assertEqual(self.reader.get("https://vald.ee/c"), b"c")
+        # The replaced version was never written
+        self.assertEqual(self.store.garbage_ratio(), 0.0)
+
+    def test_pages_are_written_after_the_interval(self):
+        self.store.commit_interval = 0
+        self.store.put("https://vald.ee/a", b"a")
+        self.assertEqual(self.reader.get("https://vald.ee/a"), b"a")
+
+    def test_pages_are_written_on_close(self):
+        self.store.put("https://vald.ee/a", b"a")
+        self.store.close()
+        self.assertEqual(self.reader.get("https://vald.ee/a"), b"a")
+        self.store = PageStore(self.directory)
+        self.assertEqual(len(self.store), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Tests of the incremental parse of the saved pages."""
+
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+import parse_raw_data
+from models.database import Base, LinkMetadata
+from utils.page_store import PageStore
+
+
+def html(title):
+    """
+    Build a saved page.
+
+    Args:
+        title (str): Title and heading of the page.
+
+    Returns:
+        str: Page source.
+    """
+    return (f"<html><head><title>{title}</title></head>"
+            f"<body><h1>{title}</h1><p>Valla teenused ja taotlused.</p></body></html>")
+
+
+class IncrementalParseTest(unittest.TestCase):
+    """Only pages whose content changed since their last parse are parsed again."""
+
+    def setUp(self):
+        self.domain_dir = os.path.join(tempfile.mkdtemp(), "vald.ee")
+        self.store = PageStore(os.path.join(self.domain_dir, "store"))
+        for path in ("a", "b", "c"):
+            self.store.put(f"https://vald.ee/{path}", html(path.upper()))
+        self.store.commit()
+
+        self.engine = create_engine(f"sqlite:///{self.domain_dir}/meta.db")
+        Base.metadata.create_all(self.engine)
+        Session = sessionmaker(bind=self.engine)
+        self.parse_task = mock.Mock(wraps=parse_raw_data.parse_task)
+        for patcher in (mock.patch.object(parse_raw_data, "get_db_session", Session),
+                        mock.patch.object(parse_raw_data, "get_engine", lambda: self.engine),
+                        mock.patch.object(parse_raw_data, "parse_task", self.parse_task),
+                        mock.patch.object(parse_raw_data, "TEMPLATE_LEARNING", False)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.store.close()
+
+    def parse(self):
+        """
+        Parse the domain directory in this process.
+
+        Returns:
+            list: Sorted URLs of the pages that were parsed.
+        """
+        self.parse_task.reset_mock()
+        parse_raw_data.process_files(self.domain_dir)
+        return sorted(call.args[0][1] for call in self.parse_task.call_args_list)
+
+    def parsed_titles(self):
+        """
+        Read the stored parse results.
+
+        Returns:
+            dict: Parsed title of every URL.
+        """
+        with self.engine.connect() as connection:
+            rows = connection.execute(select(LinkMetadata.url, LinkMetadata.parsed_data))
+            return {url: data["title"] for url, data in rows}
+
+    def test_only_changed_pages_are_parsed_again(self):
+        self.assertEqual(self.parse(), ["https://vald.ee/a", "https://vald.ee/b",
+                                        "https://vald.ee/c"])
+        self.assertEqual(self.parse(), [])
+
+        self.store.put("https://vald.ee/b", html("B2"))
+        # Saved again without changes: same digest, nothing to parse
+        self.store.put("https://vald.ee/c", html("C"))
+        self.store.commit()
+        self.assertEqual(self.parse(), ["https://vald.ee/b"])
+        self.assertEqual(self.parsed_titles(), {"https://vald.ee/a": "A",
+                                                "https://vald.ee/b": "B2",
+                                                "https://vald.ee/c": "C"})
+
+    def test_full_parse_ignores_the_fingerprints(self):
+        self.parse()
+        self.parse_task.reset_mock()
+        parse_raw_data.process_files(self.domain_dir, full=True)
+        self.assertEqual(self.parse_task.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
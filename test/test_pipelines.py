@@ -0,0 +1,121 @@
+"""Tests of the batched metadata writes."""
+
+
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from scrapy.utils.test import get_crawler
+from sqlalchemy import create_engine, select
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from models.database import Base, LinkMetadata
+from scrapy_project.items import LinkMetadataItem
+from scrapy_project.pipelines import MetadataPipeline
+
+SCRAPED_AT = datetime(2024, 5, 1, 12)
+
+
+def item(path, **fields):
+    """
+    Build the metadata of a page.
+
+    Args:
+        path (str): URL path.
+        **fields: Other columns.
+
+    Returns:
+        LinkMetadataItem: Item of https://vald.ee/<path>.
+    """
+    return LinkMetadataItem(url=f"https://vald.ee/{path}", domain="vald.ee", **fields)
+
+
+class MetadataPipelineTest(unittest.TestCase):
+    """Rows are written when the batch fills up and on close, and update stored pages."""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.stats = get_crawler().stats
+        self.pipeline = MetadataPipeline(lambda: self.engine, batch_size=3, stats=self.stats)
+        self.pipeline.engine = self.engine
+        # Write in the calling thread instead of the reactor thread pool
+        patcher = mock.patch("twisted.internet.threads.deferToThread", defer.maybeDeferred)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rows(self):
+        """
+        Read the stored metadata.
+
+        Returns:
+            dict: Stored row of every URL.
+        """
+        with self.engine.connect() as connection:
+            return {row.url: row for row in connection.execute(select(LinkMetadata.__table__))}
+
+    def result_of(self, d):
+        """
+        Return the result of a deferred that has already fired.
+
+        Args:
+            d (twisted.internet.defer.Deferred): Fired deferred.
+
+        Returns:
+            object: Its result.
+        """
+        results = []
+        d.addBoth(results.append)
+        self.assertEqual(len(results), 1)
+        self.assertNotIsInstance(results[0], Failure)
+        return results[0]
+
+    def test_batch_is_written_when_full(self):
+        self.pipeline.process_item(item("a", status_code=200), None)
+        # Later items of a URL are merged into its buffered row
+        self.pipeline.process_item(item("a", language="et"), None)
+        self.pipeline.process_item(item("b", status_code=200), None)
+        self.assertEqual(self.rows(), {})
+
+        result = self.pipeline.process_item(item("c", status_code=404), None)
+        self.assertIsInstance(result, defer.Deferred)
+        self.assertEqual(self.result_of(result)["url"], "https://vald.ee/c")
+        rows = self.rows()
+        self.assertEqual(sorted(rows), ["https://vald.ee/a", "https://vald.ee/b",
+                                        "https://vald.ee/c"])
+        self.assertEqual((rows["https://vald.ee/a"].status_code,
+                          rows["https://vald.ee/a"].language), (200, "et"))
+        self.assertEqual(self.pipeline.buffer, {})
+        self.assertEqual(self.stats.get_value("metadata/batches"), 1)
+        self.assertEqual(self.stats.get_value("metadata/rows_written"), 3)
+
+    def test_remaining_rows_are_written_on_close(self):
+        self.pipeline.process_item(item("a", status_code=200), None)
+        self.assertEqual(self.rows(), {})
+        self.result_of(self.pipeline.close_spider(None))
+        self.assertEqual(list(self.rows()), ["https://vald.ee/a"])
+        # Closing with an empty buffer writes nothing
+        self.result_of(self.pipeline.close_spider(None))
+        self.assertEqual(self.stats.get_value("metadata/batches"), 1)
+
+    def test_stored_page_is_updated(self):
+        self.pipeline.process_item(item("a", status_code=200, language="et", etag='"1"',
+                                        scraped_at=SCRAPED_AT), None)
+        self.result_of(self.pipeline.flush())
+        stored_id = self.rows()["https://vald.ee/a"].id
+
+        # A recheck only sets some columns; the others keep their stored values
+        later = SCRAPED_AT.replace(hour=18)
+        self.pipeline.process_item(item("a", status_code=304, scraped_at=later), None)
+        self.pipeline.process_item(item("b", status_code=200), None)
+        self.result_of(self.pipeline.flush())
+        row = self.rows()["https://vald.ee/a"]
+        self.assertEqual((row.id, row.status_code, row.scraped_at, row.language, row.etag),
+                         (stored_id, 304, later, "et", '"1"'))
+        self.assertEqual(len(self.rows()), 2)
+        self.assertEqual(self.stats.get_value("metadata/rows_failed", 0), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
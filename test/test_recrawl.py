@@ -0,0 +1,107 @@
+"""Tests of the adaptive recrawl intervals and priorities."""
+
+
+import unittest
+from datetime import datetime, timedelta
+
+from scrapy_project.page_state import PageState
+from scrapy_project.recrawl import RecrawlPolicy
+
+HOUR = 3600
+DAY = 86400
+NOW = datetime(2024, 5, 1, 12)
+
+
+def page_state(scraped_hours_ago, interval=None, checks=1, changes=0, priority=None):
+    """
+    Build the stored state of a page.
+
+    Args:
+        scraped_hours_ago (float): Hours since the last check.
+        interval (float, optional): Stored recrawl interval in seconds.
+        checks (int): Stored check count.
+        changes (int): Stored change count.
+        priority (int, optional): Stored crawl priority.
+
+    Returns:
+        PageState: State of a page checked ``scraped_hours_ago`` before NOW.
+    """
+    return PageState(None, None, "hash", NOW - timedelta(hours=scraped_hours_ago), checks,
+                     changes, timedelta(seconds=interval) if interval else None, None, priority,
+                     None, None)
+
+
+class NextIntervalTest(unittest.TestCase):
+    """The interval shrinks after changes, grows after unchanged checks, and stays clamped."""
+
+    def setUp(self):
+        self.policy = RecrawlPolicy()
+
+    def test_new_page_gets_the_initial_interval(self):
+        self.assertEqual(self.policy.next_interval(None, True, NOW), DAY)
+        self.assertEqual(self.policy.next_interval(page_state(0)._replace(scraped_at=None),
+                                                   False, NOW), DAY)
+
+    def test_change_shortens_the_interval_to_below_the_gap(self):
+        interval = self.policy.next_interval(page_state(6, interval=DAY), True, NOW)
+        self.assertEqual(interval, 6 * HOUR / 1.5)
+
+    def test_unchanged_page_waits_longer_than_the_gap(self):
+        interval = self.policy.next_interval(page_state(48, interval=DAY), False, NOW)
+        self.assertEqual(interval, 48 * HOUR * 1.5)
+
+    def test_interval_is_clamped(self):
+        self.assertEqual(self.policy.next_interval(page_state(0.1, interval=HOUR), True, NOW),
+                         HOUR)
+        self.assertEqual(self.policy.next_interval(page_state(24 * 40, interval=DAY),
+                                                   False, NOW), 30 * DAY)
+
+    def test_interval_settles_just_below_the_change_period(self):
+        # The page changes every 8 hours and is checked whenever it is due
+        period = timedelta(hours=8)
+        state, now = page_state(0, interval=DAY), NOW + timedelta(hours=1)
+        intervals = []
+        for _ in range(60):
+            changed = (now - NOW) // period != (state.scraped_at - NOW) // period
+            update = self.policy.update(state, changed, now)
+            intervals.append(update["recrawl_interval"])
+            state = state._replace(scraped_at=now, recrawl_interval=update["recrawl_interval"])
+            now = update["next_due_at"]
+        # Every change is seen, without checking much more often than it changes
+        for interval in intervals[-20:]:
+            self.assertLessEqual(interval, period)
+            self.assertGreaterEqual(interval, period / 1.5 ** 3)
+
+
+class PriorityTest(unittest.TestCase):
+    """Pages that change often and shallow pages are fetched first."""
+
+    def setUp(self):
+        self.policy = RecrawlPolicy()
+
+    def test_priority_grows_with_change_frequency_and_falls_with_depth(self):
+        self.assertGreater(self.policy.priority(HOUR, 0), self.policy.priority(DAY, 0))
+        self.assertEqual(self.policy.priority(30 * DAY, 0), 0)
+        self.assertEqual(self.policy.priority(DAY, 0) - self.policy.priority(DAY, 2), 10)
+
+    def test_request_priority(self):
+        self.assertEqual(self.policy.request_priority(None, 2), 90)
+        self.assertEqual(self.policy.request_priority(page_state(1, priority=42), 2), 42)
+
+
+class UpdateTest(unittest.TestCase):
+    """An update counts the check and schedules the next one."""
+
+    def test_counts_and_due_time(self):
+        policy = RecrawlPolicy()
+        update = policy.update(page_state(6, interval=DAY, checks=3, changes=1), True, NOW,
+                               depth=1)
+        self.assertEqual(update["check_count"], 4)
+        self.assertEqual(update["change_count"], 2)
+        self.assertEqual(update["recrawl_interval"], timedelta(hours=4))
+        self.assertEqual(update["next_due_at"], NOW + timedelta(hours=4))
+        self.assertEqual(update["crawl_priority"], policy.priority(4 * HOUR, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
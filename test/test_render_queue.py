@@ -0,0 +1,91 @@
+"""Tests of the bounded queue of pages waiting to be rendered."""
+
+
+import asyncio
+import unittest
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from scrapy_project.spiders.spider import Spider
+from utils.html_document import HtmlDocument
+
+
+def response(path, meta=None):
+    """
+    Build a downloaded page.
+
+    Args:
+        path (str): URL path.
+        meta (dict, optional): Request meta.
+
+    Returns:
+        scrapy.http.HtmlResponse: Response with its request.
+    """
+    url = f"https://vald.ee/{path}"
+    return HtmlResponse(url, body=b"<html><body></body></html>",
+                        request=Request(url, meta=meta or {}))
+
+
+class RenderQueueTest(unittest.TestCase):
+    """Pages beyond the render queue go back to the scheduler instead of waiting."""
+
+    def setUp(self):
+        self.crawler = get_crawler(Spider, {"RENDER_CONCURRENCY": 1, "RENDER_QUEUE_SIZE": 1,
+                                            "RENDER_MAX_DEFERRALS": 2})
+        self.spider = Spider.from_crawler(self.crawler, start_urls=["https://vald.ee/"])
+        self.spider.scrape_with_playwright_async = self.render
+        self.spider.scrape_static = lambda response, document: iter([response.url])
+
+    async def render(self, url):
+        """Block until the test lets the renders finish, then fail like a missing browser."""
+        await self.finish.wait()
+        raise RuntimeError("no browser")
+
+    async def collect(self, response):
+        """
+        Run the render callback of a page.
+
+        Args:
+            response (scrapy.http.Response): Downloaded page.
+
+        Returns:
+            list: Yielded requests and static results.
+        """
+        return [result async for result in self.spider.scrape_with_playwright(
+            response, HtmlDocument(response.body))]
+
+    def test_pages_beyond_the_queue_are_deferred(self):
+        async def scenario():
+            self.finish = asyncio.Event()
+            rendering = asyncio.create_task(self.collect(response("a")))
+            waiting = asyncio.create_task(self.collect(response("b")))
+            await asyncio.sleep(0)
+            self.assertEqual((self.spider.renders_in_flight, self.spider.renders_waiting), (1, 1))
+
+            deferred = await self.collect(response("c"))
+            self.assertEqual(len(deferred), 1)
+            self.assertIsInstance(deferred[0], Request)
+            self.assertTrue(deferred[0].dont_filter)
+            self.assertEqual(deferred[0].priority, -1)
+            self.assertEqual(deferred[0].meta["render_deferrals"], 1)
+
+            # A page deferred RENDER_MAX_DEFERRALS times waits like the others
+            last = asyncio.create_task(self.collect(response("d", {"render_deferrals": 2})))
+            await asyncio.sleep(0)
+            self.assertEqual(self.spider.renders_waiting, 2)
+
+            self.finish.set()
+            results = await asyncio.gather(rendering, waiting, last)
+            self.assertEqual(results, [["https://vald.ee/a"], ["https://vald.ee/b"],
+                                       ["https://vald.ee/d"]])
+            self.assertEqual((self.spider.renders_in_flight, self.spider.renders_waiting), (0, 0))
+
+        asyncio.run(scenario())
+        self.assertEqual(self.crawler.stats.get_value("render/deferred"), 1)
+        self.assertEqual(self.crawler.stats.get_value("render/failed"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Tests of the scheduler that claims due schedules and crawls them."""
+
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.project import get_project_settings
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from twisted.internet import defer
+
+from models.database import Base, LinkMetadata, ScrapingSchedule
+from scrapy_project import main
+
+
+class FakeProcess:
+    """Crawler process that starts nothing; the test finishes the crawls."""
+
+    def __init__(self, settings):
+        """
+        Initialize the process.
+
+        Args:
+            settings (scrapy.settings.Settings): Project settings.
+        """
+        self.crawls = []
+
+    def crawl(self, crawler, start_urls, **kwargs):
+        """
+        Record a crawl.
+
+        Args:
+            crawler (scrapy.crawler.Crawler): Crawler of the schedule.
+            start_urls (list): Start URL of the schedule.
+            **kwargs: Other spider arguments.
+
+        Returns:
+            twisted.internet.defer.Deferred: Fired by the test when the crawl ends.
+        """
+        crawler.stats = MemoryStatsCollector(crawler)
+        d = defer.Deferred()
+        self.crawls.append((start_urls[0], crawler, d))
+        return d
+
+
+class CrawlSchedulerTest(unittest.TestCase):
+    """A worker records every finished crawl and claims the next due schedule."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'meta.db')}")
+        Base.metadata.create_all(engine)
+        self.Session = sessionmaker(bind=engine)
+        with self.Session() as db_session:
+            for host in ("vald.ee", "linn.ee", "kula.ee"):
+                db_session.add(ScrapingSchedule(title=host, url=f"https://{host}/",
+                                                scraped_at=None,
+                                                scraping_interval=timedelta(days=1)))
+                # Makes the schedule due again a day after its crawl
+                db_session.add(LinkMetadata(url=f"https://{host}/", domain=host,
+                                            next_due_at=datetime.now() + timedelta(days=10)))
+            db_session.commit()
+
+        settings = get_project_settings()
+        settings.set("CRAWL_STATE_DIR", directory)
+        settings.set("MAX_CONCURRENT_CRAWLS", 2)
+        settings.set("WORKER_ID", "worker-1")
+        for patcher in (mock.patch.object(main, "get_db_session", self.Session),
+                        mock.patch.object(main, "CrawlerProcess", FakeProcess),
+                        mock.patch.object(main, "install_reactor")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.scheduler = main.CrawlScheduler(settings)
+
+    def schedules(self):
+        """
+        Read the schedules.
+
+        Returns:
+            dict: Schedule of every URL.
+        """
+        with self.Session() as db_session:
+            return {entry.url: entry for entry in db_session.query(ScrapingSchedule)}
+
+    def finish(self, index):
+        """
+        Finish a started crawl.
+
+        Args:
+            index (int): Position of the crawl among the started ones.
+
+        Returns:
+            str: Start URL of the crawl.
+        """
+        url, crawler, d = self.scheduler.process.crawls[index]
+        crawler.stats.set_value("finish_reason", "finished")
+        d.callback(None)
+        return url
+
+    def test_crawls_in_a_row(self):
+        self.scheduler.top_up()
+        crawls = self.scheduler.process.crawls
+        self.assertEqual(len(crawls), 2)
+        first, second = crawls[0][0], crawls[1][0]
+        schedules = self.schedules()
+        self.assertEqual({schedules[first].lease_owner, schedules[second].lease_owner},
+                         {"worker-1"})
+
+        self.assertEqual(self.finish(0), first)
+        schedules = self.schedules()
+        self.assertIsNone(schedules[first].lease_owner)
+        self.assertIsNotNone(schedules[first].scraped_at)
+        # The finished crawl made room for the last schedule
+        self.assertEqual(len(crawls), 3)
+        third = crawls[2][0]
+        self.assertEqual(set(self.scheduler.running), {schedules[second].id, schedules[third].id})
+
+        self.finish(1)
+        self.finish(2)
+        self.assertEqual(self.scheduler.running, {})
+        self.assertEqual(len(crawls), 3)
+        for entry in self.schedules().values():
+            self.assertIsNone(entry.lease_owner)
+            self.assertIsNone(entry.lease_expires_at)
+            self.assertEqual(entry.next_due_at, entry.scraped_at + timedelta(days=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Tests of the sitemap reader and the freshness check of sitemap entries."""
+
+
+import os
+import time
+import unittest
+from datetime import datetime
+
+from scrapy_project.page_state import PageState, PageStateStore
+from scrapy_project.sitemaps import iter_sitemap, parse_lastmod
+
+SITEMAP = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>https://vald.ee/a</loc><lastmod>2024-05-01T07:00:00Z</lastmod></url>
+  <url><loc> https://vald.ee/b </loc></url>
+  <url><lastmod>2024-05-01</lastmod></url>
+</urlset>"""
+
+
+class LocalTimeTest(unittest.TestCase):
+    """Runs in the Estonian time zone, three hours ahead of UTC in summer."""
+
+    def setUp(self):
+        self.timezone = os.environ.get("TZ")
+        os.environ["TZ"] = "Europe/Tallinn"
+        time.tzset()
+
+    def tearDown(self):
+        if self.timezone is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = self.timezone
+        time.tzset()
+
+
+class ParseLastmodTest(LocalTimeTest):
+    """``<lastmod>`` values become naive local times."""
+
+    def test_offsets_are_converted_to_local_time(self):
+        self.assertEqual(parse_lastmod("2024-05-01T07:00:00Z"), datetime(2024, 5, 1, 10))
+        self.assertEqual(parse_lastmod("2024-05-01T10:00+03:00"), datetime(2024, 5, 1, 10))
+
+    def test_values_without_offset_are_kept(self):
+        self.assertEqual(parse_lastmod("2024-05-01"), datetime(2024, 5, 1))
+
+    def test_invalid_values(self):
+        self.assertIsNone(parse_lastmod(""))
+        self.assertIsNone(parse_lastmod("yesterday"))
+
+
+class IsFreshTest(LocalTimeTest):
+    """A page is fresh when it was saved after the sitemap says it changed."""
+
+    def setUp(self):
+        super().setUp()
+        self.store = PageStateStore()
+        # Saved at 09:30 local time, 06:30 UTC
+        self.store.pages["https://vald.ee/a"] = PageState(
+            None, None, "hash", datetime(2024, 5, 1, 9, 30), 1, 0, None, None, None, None, None)
+
+    def test_change_after_the_crawl_is_not_fresh(self):
+        # 07:00 UTC is after the crawl, although 07:00 is before 09:30
+        self.assertFalse(self.store.is_fresh("https://vald.ee/a",
+                                             parse_lastmod("2024-05-01T07:00:00Z")))
+
+    def test_change_before_the_crawl_is_fresh(self):
+        self.assertTrue(self.store.is_fresh("https://vald.ee/a",
+                                            parse_lastmod("2024-05-01T06:00:00Z")))
+
+    def test_unknown_page_or_lastmod_is_not_fresh(self):
+        self.assertFalse(self.store.is_fresh("https://vald.ee/b", datetime(2000, 1, 1)))
+        self.assertFalse(self.store.is_fresh("https://vald.ee/a", None))
+
+
+class IterSitemapTest(unittest.TestCase):
+    """Entries without a location are skipped; locations are stripped."""
+
+    def test_entries(self):
+        entries = list(iter_sitemap(SITEMAP))
+        self.assertEqual([(entry.kind, entry.loc) for entry in entries],
+                         [("url", "https://vald.ee/a"), ("url", "https://vald.ee/b")])
+        self.assertIsNone(entries[1].lastmod)
+
+    def test_text_sitemap(self):
+        entries = list(iter_sitemap(b"https://vald.ee/a\nnot a url\nhttps://vald.ee/b\n"))
+        self.assertEqual([entry.loc for entry in entries],
+                         ["https://vald.ee/a", "https://vald.ee/b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
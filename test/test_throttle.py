@@ -0,0 +1,187 @@
+"""Tests of the per-host concurrency and delay controller."""
+
+
+import unittest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+from scrapy import Request
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import StopDownload
+from scrapy.http import Response
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+from twisted.internet.error import TimeoutError
+
+from scrapy_project.throttle import AdaptiveThrottleMiddleware, parse_retry_after
+
+KEY = "vald.ee"
+
+
+class ThrottleTest(unittest.TestCase):
+    """Base of the tests, with one downloader slot of vald.ee at the configured defaults."""
+
+    def setUp(self):
+        self.slot = Slot(24, 0.0, False)
+        downloader = SimpleNamespace(slots={KEY: self.slot})
+        crawler = SimpleNamespace(stats=MemoryStatsCollector(get_crawler()),
+                                  engine=SimpleNamespace(downloader=downloader))
+        self.stats = crawler.stats
+        self.middleware = AdaptiveThrottleMiddleware(crawler, max_concurrency=24, window=10,
+                                                     target_latency=1.0, cooldown=5.0)
+        self.now = 1000.0
+        patcher = mock.patch("time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, latency=0.1, status=200, headers=None):
+        """
+        Pass one response of the slot through the middleware.
+
+        Args:
+            latency (float): Download latency in seconds.
+            status (int): HTTP status.
+            headers (dict, optional): Response headers.
+        """
+        request = Request(f"https://{KEY}/", meta={"download_slot": KEY,
+                                                   "download_latency": latency})
+        response = Response(request.url, status=status, headers=headers, request=request)
+        self.assertIs(self.middleware.process_response(request, response, None), response)
+
+    def window(self, latency):
+        """
+        Pass a full window of responses with the same latency.
+
+        Args:
+            latency (float): Download latency in seconds.
+        """
+        for _ in range(self.middleware.window):
+            self.respond(latency)
+
+    def state_at(self, concurrency, delay=0.0):
+        """
+        Start the slot with the given decisions.
+
+        Args:
+            concurrency (int): Concurrency of the slot.
+            delay (float): Delay of the slot.
+
+        Returns:
+            SlotState: State of the slot.
+        """
+        state = self.middleware.state(KEY)
+        state.concurrency, state.delay = concurrency, delay
+        return state
+
+    @property
+    def state(self):
+        """SlotState: State of the slot."""
+        return self.middleware.states[KEY]
+
+
+class CloseWindowTest(ThrottleTest):
+    """Latency lowers the concurrency only when it is both high and well above the best."""
+
+    def test_new_slot_starts_at_the_ceiling(self):
+        self.respond()
+        self.assertEqual(self.state.concurrency, 24)
+        self.assertEqual(self.stats.get_value(f"throttle/concurrency/{KEY}"), 24)
+
+    def test_jitter_on_a_fast_host_is_not_overload(self):
+        self.window(0.003)
+        self.window(0.03)
+        self.window(0.9)
+        self.assertEqual((self.state.concurrency, self.state.delay), (24, 0.0))
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (24, 0.0))
+        self.assertIsNone(self.stats.get_value("throttle/decreases"))
+
+    def test_slow_window_removes_one_request(self):
+        self.window(0.4)
+        self.window(1.2)
+        self.assertEqual(self.state.concurrency, 23)
+        self.assertEqual(self.slot.concurrency, 23)
+        self.assertEqual(self.stats.get_value(f"throttle/latency/{KEY}"), 1.2)
+
+    def test_latency_alone_never_adds_delay(self):
+        self.state_at(concurrency=1)
+        self.window(0.4)
+        self.window(5.0)
+        self.assertEqual((self.state.concurrency, self.state.delay), (1, 0.0))
+
+    def test_healthy_windows_remove_delay_then_double_the_concurrency(self):
+        self.state_at(concurrency=3, delay=0.4)
+        self.window(0.1)
+        self.assertEqual((self.state.concurrency, self.state.delay), (3, 0.2))
+        for expected in (0.1, 0.05, 0.0):
+            self.window(0.1)
+            self.assertEqual(self.state.delay, expected)
+        for expected in (6, 12, 24, 24):
+            self.window(0.1)
+            self.assertEqual(self.state.concurrency, expected)
+        self.assertEqual(self.slot.concurrency, 24)
+
+
+class BackOffTest(ThrottleTest):
+    """Rate limiting and errors halve the concurrency, then add delay at the floor."""
+
+    def test_rate_limited_answers_halve_the_concurrency(self):
+        self.respond(status=429)
+        self.assertEqual(self.state.concurrency, 12)
+        self.assertEqual(self.slot.concurrency, 12)
+        # Within the cooldown further answers do not back off again
+        self.respond(status=503)
+        self.assertEqual(self.state.concurrency, 12)
+        self.now += 5
+        self.respond(status=503)
+        self.assertEqual(self.state.concurrency, 6)
+        self.assertEqual(self.stats.get_value("throttle/rate_limited"), 3)
+        self.assertEqual(self.stats.get_value("throttle/decreases"), 2)
+
+    def test_delay_is_added_at_the_floor(self):
+        self.state_at(concurrency=1)
+        for expected in (1.0, 2.0, 4.0):
+            self.respond(status=429)
+            self.assertEqual(self.state.delay, expected)
+            self.now += 5
+        self.assertEqual((self.slot.concurrency, self.slot.delay), (1, 4.0))
+
+    def test_retry_after_pauses_the_slot(self):
+        self.respond(status=503, headers={"Retry-After": "30"})
+        self.assertEqual(self.slot.delay, 30)
+        self.assertEqual(self.state.delay, 0.0)
+        # Once the pause is over the next response restores the delay
+        self.now += 31
+        self.respond()
+        self.assertEqual(self.slot.delay, 0.0)
+
+    def test_download_errors_back_off(self):
+        request = Request(f"https://{KEY}/", meta={"download_slot": KEY})
+        self.middleware.process_exception(request, StopDownload(fail=False), None)
+        self.assertNotIn(KEY, self.middleware.states)
+        self.middleware.process_exception(request, TimeoutError(), None)
+        self.assertEqual(self.state.concurrency, 12)
+        self.assertEqual(self.stats.get_value("throttle/download_errors"), 1)
+
+    def test_recreated_slot_gets_the_decisions_back(self):
+        self.respond(status=429)
+        # The downloader dropped the idle slot and made a new one with its defaults
+        self.slot = self.middleware.crawler.engine.downloader.slots[KEY] = Slot(24, 0.0, False)
+        self.respond()
+        self.assertEqual(self.slot.concurrency, 12)
+
+
+class RetryAfterTest(unittest.TestCase):
+    """Retry-After is read as seconds or as an HTTP date."""
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after(b"120"), 120.0)
+        now = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+        self.assertEqual(parse_retry_after("Wed, 01 May 2024 12:00:30 GMT", now), 30.0)
+        self.assertEqual(parse_retry_after("Wed, 01 May 2024 11:00:00 GMT", now), 0.0)
+        self.assertIsNone(parse_retry_after(b"soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
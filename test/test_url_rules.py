@@ -0,0 +1,54 @@
+"""Tests of host normalization and the link rules of a crawl."""
+
+
+import unittest
+
+from scrapy_project.url_rules import UrlRules, compile_rules, normalize_host
+
+
+class NormalizeHostTest(unittest.TestCase):
+    """Hosts compare equal whatever their case, port, user, trailing dot or ``www.``."""
+
+    def test_leading_www_is_removed(self):
+        self.assertEqual(normalize_host("www.vald.ee"), "vald.ee")
+        self.assertEqual(normalize_host("WWW.Vald.EE"), "vald.ee")
+
+    def test_hosts_starting_with_w_keep_their_name(self):
+        # Regression: lstrip("www.") removed every leading "w" and "."
+        self.assertEqual(normalize_host("web.ee"), "web.ee")
+        self.assertEqual(normalize_host("www.web.ee"), "web.ee")
+        self.assertEqual(normalize_host("wwwald.ee"), "wwwald.ee")
+        self.assertEqual(normalize_host("w.ee"), "w.ee")
+
+    def test_user_port_and_trailing_characters_are_removed(self):
+        self.assertEqual(normalize_host("user:secret@www.vald.ee:8080"), "vald.ee")
+        self.assertEqual(normalize_host("vald.ee./"), "vald.ee")
+
+    def test_ipv6_host_keeps_its_brackets(self):
+        self.assertEqual(normalize_host("[::1]:8080"), "[::1]")
+
+
+class UrlRulesTest(unittest.TestCase):
+    """Only http(s) links of the crawled domain that pass the patterns are followed."""
+
+    def test_default_rules(self):
+        rules = UrlRules("vald.ee")
+        self.assertTrue(rules.allows("https://www.vald.ee/teenused/kool"))
+        self.assertFalse(rules.allows("https://vald.ee/en/services"))
+        self.assertFalse(rules.allows("https://vald.ee/uudised/2024"))
+        self.assertFalse(rules.allows("https://web.ee/teenused"))
+        self.assertFalse(rules.allows("mailto:vald@vald.ee"))
+        self.assertFalse(rules.allows("https://[invalid/"))
+
+    def test_include_patterns_restrict_the_paths(self):
+        rules = UrlRules("vald.ee", include_patterns=[r"/teenused/"], exclude_patterns=[])
+        self.assertTrue(rules.allows("https://vald.ee/teenused/kool"))
+        self.assertFalse(rules.allows("https://vald.ee/kontakt"))
+
+    def test_invalid_pattern_is_rejected(self):
+        with self.assertRaises(ValueError):
+            compile_rules(include_patterns=["("])
+
+
+if __name__ == "__main__":
+    unittest.main()
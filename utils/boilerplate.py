@@ -0,0 +1,330 @@
+"""Per-domain template of the blocks (navigation, header, footer, banners) every page repeats."""
+
+
+import hashlib
+import json
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+
+from bs4.element import Tag
+from lxml import etree
+
+from utils.extraction import CONTENT_TAGS, normalize_text
+from utils.html_document import HtmlDocument
+
+logger = logging.getLogger(__name__)
+
+# Elements that can be a repeated block; content tags themselves never are
+BLOCK_TAGS = ("header", "nav", "footer", "aside", "div", "section", "ul", "ol", "form")
+CONTENT_NAMES = frozenset(CONTENT_TAGS)
+# File of the learned template in the data directory of a domain
+TEMPLATE_FILE = "template.json"
+# Markup of matched blocks remembered by a model before it starts over
+MATCHED_MARKUP_LIMIT = 1024
+
+
+def lxml_shape(element):
+    """
+    Return the tag, id and class of an lxml element.
+
+    Args:
+        element (lxml.html.HtmlElement): Element.
+
+    Returns:
+        tuple: ``(tag, id, class)`` with the classes separated by single spaces.
+    """
+    return (element.tag, element.get("id") or "",
+            " ".join((element.get("class") or "").split()))
+
+
+def soup_shape(element):
+    """
+    Return the tag, id and class of a BeautifulSoup element.
+
+    Args:
+        element (bs4.element.Tag): Element.
+
+    Returns:
+        tuple: ``(tag, id, class)`` with the classes separated by single spaces.
+    """
+    classes = element.get("class") or []
+    if isinstance(classes, str):
+        classes = classes.split()
+    return element.name, element.get("id") or "", " ".join(classes)
+
+
+def lxml_pairs(element):
+    """
+    Return the headers and paragraphs inside an lxml element, as extraction sees them.
+
+    Args:
+        element (lxml.html.HtmlElement): Element.
+
+    Returns:
+        list: ``(tag, text)`` pairs in document order.
+    """
+    return [(child.tag, normalize_text(child.text_content()))
+            for child in element.iter(*CONTENT_TAGS)]
+
+
+def soup_iter(element, names):
+    """
+    Yield the descendants of a BeautifulSoup element with one of the given tag names.
+
+    Equivalent to ``element.find_all(names)``, without its per-element matching overhead.
+
+    Args:
+        element (bs4.element.Tag): Element.
+        names (frozenset): Tag names.
+
+    Yields:
+        bs4.element.Tag: Matching descendants in document order.
+    """
+    for descendant in element.descendants:
+        if descendant.name in names and isinstance(descendant, Tag):
+            yield descendant
+
+
+def soup_pairs(element):
+    """
+    Return the headers and paragraphs inside a BeautifulSoup element, as extraction sees them.
+
+    Args:
+        element (bs4.element.Tag): Element.
+
+    Returns:
+        list: ``(tag, text)`` pairs in document order.
+    """
+    return [(child.name, normalize_text(child.get_text()))
+            for child in soup_iter(element, CONTENT_NAMES)]
+
+
+def block_signature(shape, pairs):
+    """
+    Hash a block by its shape and the extracted content inside it.
+
+    Both extraction backends yield the same pairs for the same page, so a
+    block has the same signature whichever backend reads it.
+
+    Args:
+        shape (tuple): ``(tag, id, class)`` of the block element.
+        pairs (list): ``(tag, text)`` pairs inside the block.
+
+    Returns:
+        str: Hex digest.
+    """
+    data = json.dumps([shape, pairs], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class TemplateModel:
+    """
+    Signatures of the blocks repeated across the pages of one domain.
+
+    A block is an element of BLOCK_TAGS holding at least one header or
+    paragraph. It is part of the template when the same tag, id, class and
+    extracted text occur on at least ``min_share`` of a sample of pages.
+    Blocks that only occur inside other template blocks are left out, as they
+    are dropped with them. Extraction drops template blocks before walking
+    the page, so their headers and paragraphs never reach ``parsed_data``. A
+    block whose text differs on a page, e.g. a sidebar with page-specific
+    content, is kept.
+    """
+
+    def __init__(self, blocks=None, pages=0, learned_at=None):
+        """
+        Initialize the model.
+
+        Args:
+            blocks (dict, optional): Block shape to the set of its template signatures.
+            pages (int): Number of pages the model was learned from.
+            learned_at (datetime, optional): When the model was learned.
+        """
+        self.blocks = {tuple(shape): set(signatures)
+                       for shape, signatures in (blocks or {}).items()}
+        self.pages = pages
+        self.learned_at = learned_at or datetime.now()
+        self.tags = tuple({shape[0] for shape in self.blocks})
+        # Template blocks mostly repeat verbatim: markup seen matching before
+        # matches again without computing its pairs and signature
+        self._matched_markup = set()
+
+    @classmethod
+    def learn(cls, bodies, min_share=0.5, min_pages=5):
+        """
+        Learn the template of a domain from a sample of its pages.
+
+        Args:
+            bodies (iterable): Page sources (str or bytes).
+            min_share (float): Share of the sampled pages a block must occur on.
+            min_pages (int): Smallest sample a template is learned from; smaller
+                samples give an empty model.
+
+        Returns:
+            TemplateModel: Learned model.
+        """
+        counts = Counter()
+        # Every occurrence of a block with the blocks enclosing it
+        occurrences = []
+        pages = 0
+        for body in bodies:
+            tree = HtmlDocument(body).tree
+            if tree is None:
+                continue
+            pages += 1
+            keys = {}
+            for element in tree.iter(*BLOCK_TAGS):
+                pairs = lxml_pairs(element)
+                if pairs:
+                    shape = lxml_shape(element)
+                    keys[element] = (shape, block_signature(shape, pairs))
+            for element, key in keys.items():
+                occurrences.append((key, [keys[parent] for parent in element.iterancestors()
+                                          if parent in keys]))
+            counts.update(set(keys.values()))
+        blocks = {}
+        if pages >= min_pages:
+            threshold = max(2, min_share * pages)
+            template = {key for key, count in counts.items() if count >= threshold}
+            outermost = {key for key, enclosing in occurrences
+                         if key in template and not template.intersection(enclosing)}
+            for shape, signature in outermost:
+                blocks.setdefault(shape, set()).add(signature)
+        return cls(blocks, pages)
+
+    @property
+    def version(self):
+        """str: Digest of the learned blocks; equal models have equal versions."""
+        data = json.dumps(sorted([list(shape), sorted(signatures)]
+                                 for shape, signatures in self.blocks.items()),
+                          ensure_ascii=False)
+        return hashlib.blake2b(data.encode("utf-8"), digest_size=8).hexdigest()
+
+    def __len__(self):
+        """
+        Return the number of template block signatures.
+
+        Returns:
+            int: Number of signatures.
+        """
+        return sum(len(signatures) for signatures in self.blocks.values())
+
+    def strip_lxml(self, tree):
+        """
+        Drop the template blocks from an lxml tree.
+
+        Args:
+            tree (lxml.html.HtmlElement): Parsed page; modified in place.
+
+        Returns:
+            int: Number of blocks dropped.
+        """
+        if not self.blocks:
+            return 0
+        matched = []
+        for element in tree.iter(*self.tags):
+            shape = lxml_shape(element)
+            signatures = self.blocks.get(shape)
+            if not signatures:
+                continue
+            # Equal markup has equal shape and pairs
+            markup = etree.tostring(element, with_tail=False)
+            if markup in self._matched_markup:
+                matched.append(element)
+            elif block_signature(shape, lxml_pairs(element)) in signatures:
+                if len(self._matched_markup) >= MATCHED_MARKUP_LIMIT:
+                    self._matched_markup.clear()
+                self._matched_markup.add(markup)
+                matched.append(element)
+        for element in matched:
+            # Blocks nested in a dropped block are dropped with it
+            if element.getparent() is not None:
+                element.drop_tree()
+        return len(matched)
+
+    def strip_soup(self, soup):
+        """
+        Drop the template blocks from a BeautifulSoup tree.
+
+        Args:
+            soup (bs4.BeautifulSoup): Parsed page; modified in place.
+
+        Returns:
+            int: Number of blocks dropped.
+        """
+        if not self.blocks:
+            return 0
+        matched = []
+        for element in soup_iter(soup, frozenset(self.tags)):
+            shape = soup_shape(element)
+            signatures = self.blocks.get(shape)
+            if signatures and block_signature(shape, soup_pairs(element)) in signatures:
+                matched.append(element)
+        for element in matched:
+            if not element.decomposed:
+                element.decompose()
+        return len(matched)
+
+    def to_dict(self):
+        """
+        Serialize the model.
+
+        Returns:
+            dict: JSON-compatible representation.
+        """
+        return {
+            "version": self.version,
+            "pages": self.pages,
+            "learned_at": self.learned_at.isoformat(),
+            "blocks": [[*shape, sorted(signatures)]
+                       for shape, signatures in sorted(self.blocks.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Deserialize a model.
+
+        Args:
+            data (dict): Output of ``to_dict``.
+
+        Returns:
+            TemplateModel: Model.
+        """
+        blocks = {(tag, element_id, classes): signatures
+                  for tag, element_id, classes, signatures in data["blocks"]}
+        return cls(blocks, data["pages"], datetime.fromisoformat(data["learned_at"]))
+
+    def save(self, path):
+        """
+        Write the model to a JSON file, replacing it atomically.
+
+        Args:
+            path (str): Target file.
+        """
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a model saved by ``save``.
+
+        Args:
+            path (str): Model file.
+
+        Returns:
+            TemplateModel or None: Model, None if the file is missing or unreadable.
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable template model {path}: {e}")
+            return None
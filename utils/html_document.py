@@ -0,0 +1,191 @@
+"""HTML document that is parsed once and shared by every stage of the spider."""
+
+
+from functools import cached_property
+
+import lxml.html
+from lxml import etree
+
+FRAMEWORK_MARKERS = ("react", "angular", "vue", "next", "nuxt", "svelte", "ember")
+FRAMEWORK_ATTRIBUTES = ("data-reactroot", "ng-version", "ng-app", "data-v-app",
+                        "data-server-rendered")
+APP_ROOT_IDS = ("root", "app", "__next", "__nuxt", "___gatsby", "svelte")
+NOSCRIPT_HINTS = ("javascript", "enable js")
+
+VISIBLE_TEXT = etree.XPath(
+    "//body//text()[not(ancestor::script or ancestor::style "
+    "or ancestor::noscript or ancestor::template)]"
+)
+
+_PARSERS = {}
+
+
+def _parser_for(encoding):
+    """
+    Return a cached lxml HTML parser for an encoding.
+
+    Args:
+        encoding (str): Encoding of the raw body.
+
+    Returns:
+        lxml.html.HTMLParser: Parser instance.
+    """
+    if encoding not in _PARSERS:
+        _PARSERS[encoding] = lxml.html.HTMLParser(encoding=encoding)
+    return _PARSERS[encoding]
+
+
+class HtmlDocument:
+    """
+    Parsed HTML page with lazily computed properties.
+
+    The lxml tree is built on first access and every derived value is cached,
+    so language detection, JS classification, link extraction and saving all
+    share a single parse.
+    """
+
+    def __init__(self, html, encoding="utf-8"):
+        """
+        Initialize the document without parsing it.
+
+        Args:
+            html (str or bytes): Page source; bytes are decoded with ``encoding``.
+            encoding (str): Encoding of ``html`` when it is bytes.
+        """
+        self.source = html
+        self.encoding = encoding or "utf-8"
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        Create a document from a Scrapy response.
+
+        Args:
+            response (scrapy.http.Response): Downloaded response.
+
+        Returns:
+            HtmlDocument: Unparsed document for the response body.
+        """
+        return cls(response.body, encoding=getattr(response, "encoding", None))
+
+    @cached_property
+    def html(self):
+        """str: Page source as text, exactly as downloaded."""
+        if isinstance(self.source, bytes):
+            return self.source.decode(self.encoding, errors="replace")
+        return self.source
+
+    @cached_property
+    def tree(self):
+        """lxml.html.HtmlElement or None: Root element, None for empty or unparsable pages."""
+        try:
+            if isinstance(self.source, bytes):
+                return lxml.html.document_fromstring(self.source,
+                                                     parser=_parser_for(self.encoding))
+            try:
+                return lxml.html.document_fromstring(self.source)
+            except ValueError:
+                # Unicode strings with an XML encoding declaration must be parsed as bytes
+                return lxml.html.document_fromstring(self.source.encode("utf-8"),
+                                                     parser=_parser_for("utf-8"))
+        except (etree.ParserError, ValueError):
+            return None
+
+    @cached_property
+    def lang(self):
+        """str: Primary language subtag of ``<html lang>``, "unknown" if missing."""
+        if self.tree is not None and self.tree.get("lang"):
+            return self.tree.get("lang").split("-")[0]
+        return "unknown"
+
+    @cached_property
+    def links(self):
+        """list: ``href`` values of all anchors, in document order."""
+        if self.tree is None:
+            return []
+        return [anchor.get("href") for anchor in self.tree.iter("a")
+                if anchor.get("href") is not None]
+
+    @cached_property
+    def canonical_url(self):
+        """str or None: ``href`` of the first ``<link rel="canonical">``, None if missing."""
+        if self.tree is None:
+            return None
+        for link in self.tree.iter("link"):
+            if "canonical" in (link.get("rel") or "").lower().split() and link.get("href"):
+                return link.get("href").strip()
+        return None
+
+    @cached_property
+    def text(self):
+        """str: Visible text, ignoring scripts, styles and noscript, with whitespace collapsed."""
+        if self.tree is None:
+            return ""
+        return " ".join(" ".join(VISIBLE_TEXT(self.tree)).split())
+
+    @cached_property
+    def text_length(self):
+        """int: Number of visible text characters, ignoring scripts, styles and noscript."""
+        if self.tree is None:
+            return 0
+        return sum(len(text.strip()) for text in VISIBLE_TEXT(self.tree))
+
+    @cached_property
+    def text_ratio(self):
+        """float: Visible text characters per character of markup."""
+        return self.text_length / max(len(self.html), 1)
+
+    @cached_property
+    def script_features(self):
+        """
+        dict: Script-related features collected in one pass over the tree.
+
+        ``scripts`` is the number of script elements, ``framework`` is True when
+        a client-side framework is referenced, ``empty_root`` is True when an
+        app mount point (e.g. ``<div id="root">``) has no content and
+        ``noscript_hint`` is True when a noscript block asks for JavaScript.
+        """
+        features = {"scripts": 0, "framework": False, "empty_root": False,
+                    "noscript_hint": False}
+        if self.tree is None:
+            return features
+        for element in self.tree.iter(tag=etree.Element):
+            tag = element.tag
+            if tag == "script":
+                features["scripts"] += 1
+                source = (element.get("src") or element.get("id") or "").lower()
+                if any(marker in source for marker in FRAMEWORK_MARKERS):
+                    features["framework"] = True
+            elif tag == "noscript":
+                hint = element.text_content().lower()
+                if any(marker in hint for marker in NOSCRIPT_HINTS):
+                    features["noscript_hint"] = True
+            elif element.get("id") in APP_ROOT_IDS and not element.text_content().strip():
+                features["empty_root"] = True
+            if any(attribute in element.attrib for attribute in FRAMEWORK_ATTRIBUTES):
+                features["framework"] = True
+        return features
+
+    @cached_property
+    def js_score(self):
+        """
+        float: Likelihood between 0 and 1 that the page needs JavaScript rendering.
+
+        Pages without scripts score 0. An empty app root, a noscript warning,
+        a framework reference and little visible text each raise the score.
+        """
+        features = self.script_features
+        if not features["scripts"]:
+            return 0.0
+        score = 0.0
+        if features["empty_root"]:
+            score += 0.5
+        if features["noscript_hint"]:
+            score += 0.3
+        if features["framework"]:
+            score += 0.2
+        if self.text_length < 200:
+            score += 0.3
+        elif self.text_ratio < 0.02:
+            score += 0.2
+        return min(score, 1.0)
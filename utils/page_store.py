@@ -0,0 +1,518 @@
+"""Append-only, compressed segment store for the saved pages of one domain."""
+
+
+import fcntl
+import gzip
+import hashlib
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.warc\.(gz|zst)$")
+
+StoredPage = namedtuple("StoredPage", ["url", "content_type", "body", "digest", "stored_at"])
+
+
+class PageStore:
+    """
+    Pages of one domain stored as WARC ``resource`` records in compressed segments.
+
+    Every record is compressed on its own (a gzip member or a zstd frame), so a
+    segment is a valid ``.warc.gz`` / ``.warc.zst`` file and any record can be
+    read without decompressing its neighbours. Records are only ever appended;
+    a side SQLite index maps each URL to the segment, offset and length of its
+    latest version. Reads slice a memory map of the segment. Superseded
+    versions stay in the segments until ``compact`` copies the live records
+    into new segments and deletes the old ones.
+
+    New pages are buffered and written together, with one index transaction,
+    once ``commit_pages`` are buffered or the oldest has waited ``commit_interval``
+    seconds, and on ``close``. Buffered pages are readable from this store
+    only; other processes see them once they are committed.
+
+    Appends and compaction take an exclusive lock on the store, so a crawler
+    and ``parse_raw_data.py`` can use the same store at the same time.
+    """
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024, compression="gzip",
+                 commit_pages=100, commit_interval=5.0):
+        """
+        Open or create the store.
+
+        Args:
+            directory (str): Directory of the segments and the index.
+            segment_size (int): Size in bytes after which a new segment is started.
+            compression (str): ``gzip`` or ``zstd`` for new records; existing segments
+                are read whatever their compression.
+            commit_pages (int): Buffered pages that are written together.
+            commit_interval (float): Seconds after which buffered pages are written
+                with the next ``put``.
+        """
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, storing pages with gzip")
+            compression = "gzip"
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compression = compression
+        self.commit_pages = commit_pages
+        self.commit_interval = commit_interval
+        self.pending = {}
+        self.pending_since = None
+        os.makedirs(directory, exist_ok=True)
+        self.lock_file = open(os.path.join(directory, "store.lock"), "a+b")
+        # The crawler closes (and may compact) its stores from a worker thread
+        self.db = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30,
+                                  check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, segment INTEGER NOT NULL, "
+            "offset INTEGER NOT NULL, length INTEGER NOT NULL, content_type TEXT, digest TEXT, "
+            "stored_at REAL)")
+        self.db.commit()
+        self.writer = None
+        self.writer_segment = None
+        self.maps = {}
+
+    @classmethod
+    def for_domain(cls, root, domain, settings=None):
+        """
+        Open the store of a domain below a data directory.
+
+        Args:
+            root (str): Data directory, e.g. PAGE_STORE_DIR.
+            domain (str): Normalized domain.
+            settings (scrapy.settings.Settings, optional): Settings with PAGE_STORE_*.
+
+        Returns:
+            PageStore: Store in ``root/domain/store``.
+        """
+        options = {}
+        if settings is not None:
+            options = {
+                "segment_size": settings.getint("PAGE_STORE_SEGMENT_SIZE", 256 * 1024 * 1024),
+                "compression": settings.get("PAGE_STORE_COMPRESSION", "gzip"),
+                "commit_pages": settings.getint("PAGE_STORE_COMMIT_PAGES", 100),
+                "commit_interval": settings.getfloat("PAGE_STORE_COMMIT_INTERVAL", 5.0),
+            }
+        return cls(os.path.join(root, domain, "store"), **options)
+
+    def segment_path(self, segment, compression=None):
+        """
+        Return the path of a segment.
+
+        Args:
+            segment (int): Segment number.
+            compression (str, optional): Compression of the segment; looked up on disk if None.
+
+        Returns:
+            str: Segment file path.
+        """
+        if compression is None:
+            for extension in ("gz", "zst"):
+                path = os.path.join(self.directory, f"segment-{segment:06d}.warc.{extension}")
+                if os.path.exists(path):
+                    return path
+            compression = self.compression
+        extension = "zst" if compression == "zstd" else "gz"
+        return os.path.join(self.directory, f"segment-{segment:06d}.warc.{extension}")
+
+    def segments(self):
+        """
+        List the segments on disk.
+
+        Returns:
+            list: Segment numbers in ascending order.
+        """
+        numbers = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def put(self, url, body, content_type="text/html"):
+        """
+        Add a new version of a page, writing the buffered pages when the batch is due.
+
+        Args:
+            url (str): Page URL.
+            body (bytes or str): Page content; text is stored as UTF-8.
+            content_type (str): MIME type of the content.
+
+        Returns:
+            str: Hex digest of the stored body.
+        """
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        record = self._compress(self._build_record(url, body, content_type))
+        # A newer version replaces a buffered one before it is written
+        self.pending[url] = (record, content_type, digest, time.time())
+        if self.pending_since is None:
+            self.pending_since = time.monotonic()
+        if (len(self.pending) >= self.commit_pages
+                or time.monotonic() - self.pending_since >= self.commit_interval):
+            self.commit()
+        return digest
+
+    def commit(self):
+        """Append the buffered pages to the segments and index them in one transaction."""
+        if not self.pending:
+            return
+        pending, self.pending, self.pending_since = self.pending, {}, None
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            rows = []
+            for url, (record, content_type, digest, stored_at) in pending.items():
+                writer = self._writer(len(record))
+                offset = writer.seek(0, os.SEEK_END)
+                writer.write(record)
+                rows.append((url, self.writer_segment, offset, len(record), content_type, digest,
+                             stored_at))
+            writer.flush()
+            self.db.executemany(
+                "INSERT OR REPLACE INTO pages (url, segment, offset, length, content_type, digest, "
+                "stored_at) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def get(self, url):
+        """
+        Read the latest version of a page.
+
+        Args:
+            url (str): Page URL.
+
+        Returns:
+            bytes or None: Page content, None if the page is not stored.
+        """
+        pending = self.pending.get(url)
+        if pending is not None:
+            return self._parse_record(self._decompress(pending[0], self.compression))[1]
+        row = self.db.execute("SELECT segment, offset, length FROM pages WHERE url = ?",
+                              (url,)).fetchone()
+        if row is None:
+            return None
+        return self._read(*row)[1]
+
+    def __contains__(self, url):
+        """
+        Check whether a page is stored.
+
+        Args:
+            url (str): Page URL.
+
+        Returns:
+            bool: True if a version of the page is stored.
+        """
+        if url in self.pending:
+            return True
+        return self.db.execute("SELECT 1 FROM pages WHERE url = ?", (url,)).fetchone() is not None
+
+    def __len__(self):
+        """
+        Return the number of stored pages.
+
+        Returns:
+            int: Number of URLs in the index.
+        """
+        self.commit()
+        return self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def digests(self, content_type=None):
+        """
+        List the stored URLs and the digests of their latest version in on-disk order.
+
+        Args:
+            content_type (str, optional): Only list pages of this MIME type.
+
+        Returns:
+            list: ``(url, digest)`` tuples.
+        """
+        self.commit()
+        query = "SELECT url, digest FROM pages"
+        parameters = ()
+        if content_type is not None:
+            query += " WHERE content_type = ?"
+            parameters = (content_type,)
+        return self.db.execute(query + " ORDER BY segment, offset", parameters).fetchall()
+
+    def iter_pages(self, content_type=None):
+        """
+        Stream the latest version of every stored page in on-disk order.
+
+        Args:
+            content_type (str, optional): Only yield pages of this MIME type.
+
+        Yields:
+            StoredPage: Stored page with its content.
+        """
+        self.commit()
+        query = "SELECT url, segment, offset, length, content_type, digest, stored_at FROM pages"
+        parameters = ()
+        if content_type is not None:
+            query += " WHERE content_type = ?"
+            parameters = (content_type,)
+        rows = self.db.execute(query + " ORDER BY segment, offset", parameters).fetchall()
+        for url, segment, offset, length, page_type, digest, stored_at in rows:
+            try:
+                body = self._read(segment, offset, length)[1]
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read {url} from segment {segment}: {e}")
+                continue
+            yield StoredPage(url, page_type, body, digest, stored_at)
+
+    def garbage_ratio(self):
+        """
+        Return the share of segment bytes taken by superseded versions.
+
+        Returns:
+            float: Between 0 and 1.
+        """
+        self.commit()
+        total = sum(os.path.getsize(self.segment_path(segment)) for segment in self.segments())
+        if not total:
+            return 0.0
+        live = self.db.execute("SELECT COALESCE(SUM(length), 0) FROM pages").fetchone()[0]
+        return max(0.0, 1 - live / total)
+
+    def compact(self):
+        """
+        Copy the live records into new segments and delete the old segments.
+
+        Records are copied compressed, without being decoded again.
+
+        Returns:
+            int: Bytes reclaimed.
+        """
+        self.commit()
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            old_segments = self.segments()
+            if not old_segments:
+                return 0
+            before = sum(os.path.getsize(self.segment_path(segment)) for segment in old_segments)
+            self._close_writer()
+            self._close_maps()
+            rows = self.db.execute("SELECT url, segment, offset, length FROM pages "
+                                   "ORDER BY segment, offset").fetchall()
+            segment = old_segments[-1] + 1
+            output, output_compression, updates = None, None, []
+            for url, old_segment, offset, length in rows:
+                path = self.segment_path(old_segment)
+                compression = "zstd" if path.endswith(".zst") else "gzip"
+                if output is None or compression != output_compression or (
+                        output.tell() and output.tell() + length > self.segment_size):
+                    if output is not None:
+                        output.close()
+                        segment += 1
+                    output = open(self.segment_path(segment, compression), "wb")
+                    output_compression = compression
+                with open(path, "rb") as source:
+                    source.seek(offset)
+                    data = source.read(length)
+                updates.append((segment, output.tell(), url))
+                output.write(data)
+            if output is not None:
+                output.close()
+            self.db.executemany("UPDATE pages SET segment = ?, offset = ? WHERE url = ?", updates)
+            self.db.commit()
+            for old_segment in old_segments:
+                os.remove(self.segment_path(old_segment))
+            after = sum(os.path.getsize(self.segment_path(number)) for number in self.segments())
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        logger.info(f"Compacted {self.directory}: {before} -> {after} bytes")
+        return before - after
+
+    def close(self):
+        """Write the buffered pages, then close the segments and the index."""
+        self.commit()
+        self._close_writer()
+        self._close_maps()
+        self.db.close()
+        self.lock_file.close()
+
+    def _writer(self, record_length):
+        """
+        Return the segment file to append to, starting a new segment when it is full.
+
+        Must be called with the store lock held.
+
+        Args:
+            record_length (int): Size of the record about to be written.
+
+        Returns:
+            file: Segment opened for appending.
+        """
+        writer = self.writer
+        # Another process may have compacted the store and deleted our segment
+        if writer is not None and os.fstat(writer.fileno()).st_nlink == 0:
+            self._close_writer()
+            writer = None
+        if writer is None:
+            segments = self.segments()
+            self.writer_segment = segments[-1] if segments else 1
+            path = self.segment_path(self.writer_segment)
+            if os.path.exists(path) and not path.endswith(
+                    ".zst" if self.compression == "zstd" else ".gz"):
+                self.writer_segment += 1
+                path = self.segment_path(self.writer_segment, self.compression)
+            writer = self.writer = open(path, "ab")
+        size = writer.seek(0, os.SEEK_END)
+        if size and size + record_length > self.segment_size:
+            self._close_writer()
+            self.writer_segment = max([self.writer_segment] + self.segments()) + 1
+            writer = self.writer = open(self.segment_path(self.writer_segment, self.compression),
+                                        "ab")
+        return writer
+
+    def _close_writer(self):
+        """Close the segment being appended to."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def _close_maps(self):
+        """Unmap all segments."""
+        for file, array in self.maps.values():
+            array.close()
+            file.close()
+        self.maps = {}
+
+    def _read(self, segment, offset, length):
+        """
+        Read and decode one record.
+
+        Args:
+            segment (int): Segment number.
+            offset (int): Offset of the compressed record.
+            length (int): Length of the compressed record.
+
+        Returns:
+            tuple: Record headers (dict) and body (bytes).
+        """
+        mapped = self.maps.get(segment)
+        if mapped is None or offset + length > len(mapped[1]):
+            if mapped is not None:
+                mapped[1].close()
+                mapped[0].close()
+            path = self.segment_path(segment)
+            file = open(path, "rb")
+            mapped = self.maps[segment] = (file, mmap.mmap(file.fileno(), 0,
+                                                           access=mmap.ACCESS_READ))
+        compression = "zstd" if mapped[0].name.endswith(".zst") else "gzip"
+        return self._parse_record(self._decompress(mapped[1][offset:offset + length],
+                                                   compression))
+
+    def _compress(self, data):
+        """
+        Compress one record as an independent gzip member or zstd frame.
+
+        Args:
+            data (bytes): Uncompressed record.
+
+        Returns:
+            bytes: Compressed record.
+        """
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        return gzip.compress(data, compresslevel=6, mtime=0)
+
+    @staticmethod
+    def _decompress(data, compression):
+        """
+        Decompress one record.
+
+        Args:
+            data (bytes): Compressed record.
+            compression (str): ``gzip`` or ``zstd``.
+
+        Returns:
+            bytes: Uncompressed record.
+
+        Raises:
+            ValueError: A zstd record is read without zstandard installed.
+        """
+        if compression == "zstd":
+            if zstandard is None:
+                raise ValueError("zstandard is required to read .warc.zst segments")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    @staticmethod
+    def _build_record(url, body, content_type):
+        """
+        Build a WARC/1.1 resource record.
+
+        Args:
+            url (str): Page URL.
+            body (bytes): Page content.
+            content_type (str): MIME type of the content.
+
+        Returns:
+            bytes: Uncompressed record.
+        """
+        date = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        headers = (
+            "WARC/1.1\r\n"
+            "WARC-Type: resource\r\n"
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+            f"WARC-Date: {date}\r\n"
+            f"WARC-Target-URI: {url}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+        )
+        return headers.encode("utf-8") + body + b"\r\n\r\n"
+
+    @staticmethod
+    def _parse_record(data):
+        """
+        Split a WARC record into headers and body.
+
+        Args:
+            data (bytes): Uncompressed record.
+
+        Returns:
+            tuple: Record headers (dict) and body (bytes).
+        """
+        head, _, rest = data.partition(b"\r\n\r\n")
+        headers = {}
+        for line in head.decode("utf-8").split("\r\n")[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip()] = value.strip()
+        return headers, rest[:int(headers.get("Content-Length", len(rest)))]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Compact the page stores of a data directory.")
+    parser.add_argument("root", help="Data directory with one folder per domain")
+    parser.add_argument("--min-garbage", type=float, default=0.0,
+                        help="Only compact stores with at least this share of superseded bytes")
+    arguments = parser.parse_args()
+    for domain in sorted(os.listdir(arguments.root)):
+        if not os.path.isdir(os.path.join(arguments.root, domain, "store")):
+            continue
+        store = PageStore.for_domain(arguments.root, domain)
+        if store.garbage_ratio() >= arguments.min_garbage:
+            store.compact()
+        store.close()
@@ -4,6 +4,8 @@
 from bs4 import BeautifulSoup
 from typing import List, Tuple
 
+from utils.extraction import extract_content
+
 def parse_javascript_links(page):
     """Extract all links dynamically generated on the current page."""
     return page.eval_on_selector_all('a', 'elements => elements.map(el => el.href)')
@@ -34,21 +36,7 @@ def parse_html_images(html_content):
 
 
 def parse_html_titles_and_contents(html_content) -> List[Tuple[str, str]]:
-    soup = BeautifulSoup(html_content, 'lxml')
-    titles = []
-    current_title = None
-    content = []
-
-    for tag in soup.find_all(['h1', 'h2', 'p']):
-        if tag.name in ['h1', 'h2']:
-            if current_title and content:
-                titles.append((current_title, ' '.join(content)))
-            current_title = tag.get_text(strip=True)
-            content = []
-        elif tag.name == 'p':
-            content.append(tag.get_text(strip=True))
-
-    if current_title and content:
-        titles.append((current_title, ' '.join(content)))
-
-    return titles
+    """Parse HTML content into (header, joined paragraphs) pairs of the non-empty sections."""
+    sections = extract_content(html_content)["content"]
+    return [(section["header"], " ".join(section["paragraphs"]))
+            for section in sections if section["paragraphs"]]